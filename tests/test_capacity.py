@@ -0,0 +1,112 @@
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+
+from tpv.commands.test import mock_galaxy
+from tpv.core.capacity import DestinationCapacity, FileCapacityFeed, close_capacity_feeds, open_capacity_feed
+from tpv.core.explain import ExplainCollector
+from tpv.rules import gateway
+
+
+class TestCapacityFeeds(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "capacity.json")
+
+    def tearDown(self):
+        close_capacity_feeds()
+        self.tmpdir.cleanup()
+
+    def write_capacities(self, capacities):
+        # replace the file atomically, as an agent should
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(capacities, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def test_parse_capacity(self):
+        capacity = DestinationCapacity.parse({"free_slots": "4", "queue_depth": 2, "online": False})
+        self.assertEqual(capacity, DestinationCapacity(free_slots=4, queue_depth=2, online=False))
+        self.assertEqual(capacity.describe(), "offline, free_slots=4, queue_depth=2")
+        self.assertEqual(DestinationCapacity.parse({}).describe(), "online")
+
+    def test_file_feed_reloads_changes_after_refresh_interval(self):
+        now = [0.0]
+        self.write_capacities({"slurm": {"free_slots": 4}})
+        feed = FileCapacityFeed(self.path, refresh_interval=5, timer=lambda: now[0])
+        self.assertEqual(feed.get("slurm").free_slots, 4)
+        self.assertIsNone(feed.get("pulsar"))
+        self.assertTrue(feed.is_online("pulsar"))
+
+        self.write_capacities({"slurm": {"free_slots": 0, "queue_depth": 12}, "pulsar": {"online": False}})
+        now[0] = 4
+        self.assertEqual(feed.get("slurm").free_slots, 4)
+        now[0] = 6
+        self.assertEqual(feed.get("slurm"), DestinationCapacity(free_slots=0, queue_depth=12))
+        self.assertFalse(feed.is_online("pulsar"))
+
+        # capacities that can't be read are ignored
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        now[0] = 12
+        self.assertFalse(feed.is_online("pulsar"))
+
+    def test_socket_feed_applies_updates(self):
+        path = os.path.join(self.tmpdir.name, "capacity.sock")
+        feed = open_capacity_feed(f"unix:{path}")
+        self.assertIs(open_capacity_feed(f"unix:{path}"), feed)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as agent:
+            agent.connect(path)
+            agent.sendall(b'{"slurm": {"free_slots": 3}, "pulsar": {"online": false}}\n')
+            agent.sendall(b"not json\n")
+            agent.sendall(b'{"slurm": {"free_slots": 1, "queue_depth": 5}}\n')
+        deadline = time.monotonic() + 5
+        while feed.get("slurm") != DestinationCapacity(free_slots=1, queue_depth=5) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(feed.get("slurm"), DestinationCapacity(free_slots=1, queue_depth=5))
+        # destinations that are not mentioned in an update keep their state
+        self.assertFalse(feed.is_online("pulsar"))
+
+    def _mapper(self):
+        destination = {"runner": "local", "max_accepted_cores": 8}
+        config = {
+            "global": {"capacity_feed": self.path},
+            "tools": {"bwa": {"cores": 2}},
+            "destinations": {"slurm": destination, "pulsar": destination, "k8s": destination},
+        }
+        return gateway.load_destination_mapper([config])
+
+    @staticmethod
+    def _map_to_destination(mapper, explain_collector=None):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        return mapper.map_to_tpv_destination(
+            galaxy_app,
+            mock_galaxy.Tool("bwa"),
+            mock_galaxy.User("ford", "prefect@vortex.org"),
+            mock_galaxy.Job(),
+            explain_collector=explain_collector,
+        )
+
+    def test_offline_destinations_are_not_matched_and_free_slots_rank_higher(self):
+        self.write_capacities(
+            {
+                "slurm": {"free_slots": 10, "online": False},
+                "pulsar": {"free_slots": 2, "queue_depth": 4},
+                "k8s": {"free_slots": 2, "queue_depth": 1},
+            }
+        )
+        mapper = self._mapper()
+        self.assertEqual(self._map_to_destination(mapper).dest_name, "k8s")
+
+        collector = ExplainCollector()
+        self._map_to_destination(mapper, explain_collector=collector)
+        output = collector.render()
+        self.assertIn("destination is offline (offline, free_slots=10)", output)
+        self.assertIn("#1 k8s (score: 1, online, free_slots=2, queue_depth=1)", output)
+
+    def test_destinations_are_ranked_as_before_without_capacities(self):
+        self.write_capacities({})
+        self.assertEqual(self._map_to_destination(self._mapper()).dest_name, "slurm")
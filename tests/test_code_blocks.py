@@ -0,0 +1,134 @@
+import unittest
+
+from tpv.commands.test import mock_galaxy
+from tpv.core.loader import TPVConfigLoader
+
+
+class TestCodeBlockFunctions(unittest.TestCase):
+
+    def setUp(self):
+        self.loader = TPVConfigLoader({})
+
+    def test_referenced_context_names_are_parameters(self):
+        function = self.loader.compile_code_function("cores * 2 if tool.id else mem")
+        self.assertCountEqual(function.names, ["cores", "tool", "mem"])
+        self.assertEqual(
+            self.loader.eval_code_block(
+                "cores * 2 if tool.id else mem", {"cores": 2, "mem": 8, "tool": mock_galaxy.Tool("bwa")}
+            ),
+            4,
+        )
+        (compiled,) = function.functions.values()
+        self.assertEqual(compiled.__code__.co_varnames, function.names)
+
+    def test_multi_statement_blocks(self):
+        code = "small = cores < 4\nfactor = 2 if small else 1\nmem * factor"
+        self.assertEqual(self.loader.eval_code_block(code, {"cores": 2, "mem": 8}), 16)
+        self.assertEqual(self.loader.eval_code_block(code, {"cores": 8, "mem": 8}), 8)
+
+    def test_execute_blocks_assign_and_mutate(self):
+        entity = mock_galaxy.User("ford", "prefect@vortex.org")
+        context = {"entity": entity, "cores": 3}
+        code = "total = 0\nfor i in range(cores):\n    total += i\nentity.username = f'{entity.username}-{total}'"
+        self.assertIsNone(self.loader.eval_code_block(code, context, exec_only=True))
+        self.assertEqual(entity.username, "ford-3")
+        # local assignments do not leak into the context
+        self.assertNotIn("total", context)
+
+    def test_context_values_can_be_reassigned(self):
+        self.assertEqual(
+            self.loader.eval_code_block("cores = cores + 1\n[cores for _ in range(2)]", {"cores": 1}), [2, 2]
+        )
+
+    def test_names_missing_from_context(self):
+        # names that are not in the context are resolved from builtins and module globals
+        self.assertEqual(self.loader.eval_code_block("len(helpers.__name__)", {}), len("tpv.core.helpers"))
+        self.assertEqual(self.loader.eval_code_block("max(cores, 2)", {"cores": 1}), 2)
+        # and only raise errors if they are evaluated
+        self.assertEqual(self.loader.eval_code_block("cores if cores else undefined_name", {"cores": 1}), 1)
+        with self.assertRaises(NameError):
+            self.loader.eval_code_block("cores if cores else undefined_name", {"cores": 0})
+        # the same block may be evaluated with and without a name in the context
+        self.assertEqual(self.loader.eval_code_block("undefined_name", {"undefined_name": 5}), 5)
+
+    def test_f_strings(self):
+        self.assertEqual(
+            self.loader.eval_code_block("--mem {mem} --cores {cores}", {"mem": 8, "cores": 2}, as_f_string=True),
+            "--mem 8 --cores 2",
+        )
+
+    def test_return_outside_function_is_rejected(self):
+        with self.assertRaises(SyntaxError):
+            self.loader.eval_code_block("return 1", {}, exec_only=True)
+
+
+class TestFusedRuleConditions(unittest.TestCase):
+
+    def setUp(self):
+        self.loader = TPVConfigLoader({})
+
+    def test_conditions_are_evaluated_by_a_single_generator(self):
+        conditions = ["cores > 2", "mem < 4", "True", "small = cores < 4\nsmall"]
+        outcomes = self.loader.evaluate_rule_conditions(conditions, {"cores": 2, "mem": 2}, [None] * 4)
+        self.assertEqual(list(outcomes), [False, True, True, True])
+        self.assertIs(
+            self.loader.compile_rule_conditions(tuple(conditions)),
+            self.loader.compile_rule_conditions(tuple(conditions)),
+        )
+
+    def test_known_outcomes_are_not_evaluated(self):
+        outcomes = self.loader.evaluate_rule_conditions(["undefined_name", "cores > 1"], {"cores": 2}, [True, None])
+        self.assertEqual(list(outcomes), [True, True])
+
+    def test_conditions_are_evaluated_lazily(self):
+        outcomes = self.loader.evaluate_rule_conditions(["cores > 1", "1 / 0"], {"cores": 2}, [None, None])
+        self.assertTrue(next(outcomes))
+        with self.assertRaises(ZeroDivisionError):
+            next(outcomes)
+
+    def test_rules_see_entity_changes_made_by_earlier_rules(self):
+        loader = TPVConfigLoader(
+            {
+                "tools": {
+                    "bwa": {
+                        "cores": 2,
+                        "rules": [
+                            {"if": "input_size < 10", "execute": "entity.cores = 8"},
+                            {"if": "entity.cores > 4", "mem": 32},
+                            {"if": "cores < 4", "gpus": 1},
+                        ],
+                    }
+                }
+            }
+        )
+        tool = loader.config.tools["bwa"]
+        job = mock_galaxy.Job()
+        context = {"job": job, "entity": tool, "self": tool, "cores": 2}
+        evaluated = tool.evaluate_rules(context)
+        self.assertEqual((evaluated.cores, evaluated.mem, evaluated.gpus), (8, 32, 1))
+
+    def test_threshold_conditions_are_indexed(self):
+        conditions = [
+            "input_size < 5",
+            "input_size >= 5 and input_size < 20",
+            "tool is None",
+            "20 <= input_size",
+            "mem > 4",
+        ]
+        function = self.loader.compile_rule_conditions(tuple(conditions))
+        (index,) = function.constants["_tpv_indexes"]
+        self.assertEqual(len(index.regions), 5)
+        for size, expected in [
+            (1, [True, False, True, False, True]),
+            (5, [False, True, True, False, True]),
+            (25, [False, False, True, True, True]),
+        ]:
+            with self.subTest(size=size):
+                job = mock_galaxy.Job()
+                job.add_input_dataset(
+                    mock_galaxy.DatasetAssociation("test", mock_galaxy.Dataset("test.txt", file_size=size * 1024**3))
+                )
+                outcomes = self.loader.evaluate_rule_conditions(
+                    conditions, {"job": job, "tool": None, "mem": 8}, [None] * 5
+                )
+                self.assertEqual(list(outcomes), expected)
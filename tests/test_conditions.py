@@ -0,0 +1,153 @@
+import ast
+import os
+import unittest
+from unittest import mock
+
+from tpv.commands.test import mock_galaxy
+from tpv.core import helpers
+from tpv.core.conditions import (
+    ConditionScope,
+    Interval,
+    IntervalIndex,
+    RuleConditionCache,
+    classify_condition,
+    parse_threshold_condition,
+)
+from tpv.rules import gateway
+
+
+class TestConditionClassification(unittest.TestCase):
+
+    def test_classify_conditions(self):
+        cases = {
+            "True": ConditionScope.CONSTANT,
+            "helpers.tool_version_gte(tool, '42')": ConditionScope.TOOL,
+            "tool.id.startswith('bwa') and len(tool.version) > 2": ConditionScope.TOOL,
+            "any([r for r in user.all_roles() if (not r.deleted and r.name.startswith('training'))])": (
+                ConditionScope.USER
+            ),
+            "user.email in ['a@b.org'] or tool.id == 'bwa'": ConditionScope.TOOL_AND_USER,
+            "input_size >= 5": ConditionScope.JOB,
+            "entity.cores > 2 and user is not None": ConditionScope.JOB,
+            "helpers.concurrent_job_count_for_tool(app, tool, user) >= 2": ConditionScope.JOB,
+            "helpers.job_args_match(job, app, {'input_opts': {'db_selector': 'db'}})": ConditionScope.JOB,
+            "small = 2\ninput_size < small": ConditionScope.JOB,
+            "version = tool.version\nversion == '1.0'": ConditionScope.TOOL,
+        }
+        for code, scope in cases.items():
+            with self.subTest(code=code):
+                self.assertEqual(classify_condition(code), scope)
+
+    def test_cache_key_depends_on_scope(self):
+        cache = RuleConditionCache()
+        context = {
+            "tool": mock_galaxy.Tool("bwa", version="1.0"),
+            "user": mock_galaxy.User("ford", "prefect@vortex.org"),
+        }
+        self.assertEqual(
+            cache.cache_key("tool.id == 'bwa'", context), ("tool.id == 'bwa'", ConditionScope.TOOL, "bwa", "1.0")
+        )
+        self.assertEqual(
+            cache.cache_key("user is None", context), ("user is None", ConditionScope.USER, context["user"].id)
+        )
+        self.assertIsNone(cache.cache_key("input_size > 1", context))
+
+
+class TestThresholdConditions(unittest.TestCase):
+
+    @staticmethod
+    def parse(code):
+        return parse_threshold_condition(ast.parse(code, mode="eval").body)
+
+    def test_parse_threshold_conditions(self):
+        cases = {
+            "input_size >= 10": ("input_size", Interval(lower=10, lower_inclusive=True)),
+            "input_size < 5": ("input_size", Interval(upper=5)),
+            "5 > input_size": ("input_size", Interval(upper=5)),
+            "0.01 <= input_size < 2": ("input_size", Interval(0.01, True, 2, False)),
+            "mem > 10 and mem <= 20": ("mem", Interval(10, False, 20, True)),
+            "cores > -1 and 4 >= cores": ("cores", Interval(-1, False, 4, True)),
+            "input_size >= 10 and input_size > 10": ("input_size", Interval(lower=10)),
+        }
+        for code, expected in cases.items():
+            with self.subTest(code=code):
+                self.assertEqual(self.parse(code), expected)
+
+    def test_other_conditions_are_not_thresholds(self):
+        for code in [
+            "input_size >= small_input_size",
+            "input_size == 10",
+            "input_size > 1 and mem < 4",
+            "input_size > 1 or input_size < 4",
+            "1 < input_size < mem",
+            "tool.version > 10",
+            "input_size > True",
+            "helpers.input_size(job) > 10",
+        ]:
+            with self.subTest(code=code):
+                self.assertIsNone(self.parse(code))
+
+    def test_interval_index(self):
+        intervals = {
+            0: Interval(upper=5),
+            1: Interval(5, True, 10, True),
+            2: Interval(lower=10),
+            3: Interval(2, False, 20, False),
+        }
+        index = IntervalIndex(intervals)
+        for value in [-1, 0, 2, 2.5, 5, 7, 10, 15, 20, 100, float("inf")]:
+            with self.subTest(value=value):
+                self.assertEqual(
+                    index.matching(value), {key for key, interval in intervals.items() if interval.contains(value)}
+                )
+        self.assertEqual(index.matching(float("nan")), set())
+
+
+class TestRuleConditionCache(unittest.TestCase):
+
+    @staticmethod
+    def _map_to_destination(mapper, tool, user):
+        galaxy_app = mock_galaxy.App(
+            job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"), create_model=True
+        )
+        job = mock_galaxy.Job()
+        job.add_input_dataset(
+            mock_galaxy.DatasetAssociation("test", mock_galaxy.Dataset("test.txt", file_size=1 * 1024**3))
+        )
+        return mapper.map_to_tpv_destination(galaxy_app, tool, user, job)
+
+    def test_job_independent_conditions_evaluated_once_per_tool_version(self):
+        mapper = gateway.load_destination_mapper(
+            [os.path.join(os.path.dirname(__file__), "fixtures/mapping-rule-tool-limits.yml")]
+        )
+        user = mock_galaxy.User("ford", "prefect@vortex.org")
+
+        def trinity(version):
+            return mock_galaxy.Tool(id=f"toolshed.g2.bx.psu.edu/repos/iuc/trinity/trinity/{version}", version=version)
+
+        def env_names(destination):
+            return sorted(e["name"] for e in destination.env if e["name"].startswith("version_"))
+
+        with mock.patch.object(helpers, "tool_version_gte", wraps=helpers.tool_version_gte) as version_gte:
+            for _ in range(3):
+                destination = self._map_to_destination(mapper, trinity("3.15.1+galaxy0"), user)
+                self.assertEqual(env_names(destination), ["version_gt_2.15.1+galaxy0", "version_gte_2.15.1+galaxy0"])
+            # the version condition is only evaluated for the first job
+            self.assertEqual(version_gte.call_count, 1)
+
+            destination = self._map_to_destination(mapper, trinity("2.10.1+galaxy6"), user)
+            self.assertEqual(env_names(destination), ["version_lt_2.10.1+galaxy7", "version_lte_2.10.1+galaxy7"])
+            self.assertEqual(version_gte.call_count, 2)
+
+    def test_job_dependent_conditions_evaluated_for_every_job(self):
+        mapper = gateway.load_destination_mapper(
+            [os.path.join(os.path.dirname(__file__), "fixtures/mapping-rule-tool-limits.yml")]
+        )
+        tool = mock_galaxy.Tool("toolshed.g2.bx.psu.edu/repos/artbio/repenrich/repenrich/2.31.1")
+        user = mock_galaxy.User("ford", "prefect@vortex.org")
+        with mock.patch.object(
+            helpers, "concurrent_job_count_for_tool", wraps=helpers.concurrent_job_count_for_tool
+        ) as job_count:
+            for _ in range(3):
+                self._map_to_destination(mapper, tool, user)
+            self.assertEqual(job_count.call_count, 3)
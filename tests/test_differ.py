@@ -0,0 +1,50 @@
+"""Unit tests for diffing mapping decisions between two TPV configs"""
+
+import os
+import unittest
+
+from tpv.commands.batch import JobSpec, read_job_specs
+from tpv.commands.differ import TPVDecisionDiffer
+
+
+class TestDecisionDiffer(unittest.TestCase):
+
+    @staticmethod
+    def _fixture_path(name):
+        return os.path.join(os.path.dirname(__file__), "fixtures", name)
+
+    def test_unchanged_config_has_no_changes(self):
+        tpv_config = self._fixture_path("mapping-rules.yml")
+        decision_diff = TPVDecisionDiffer.diff(
+            [tpv_config], [tpv_config], read_job_specs(self._fixture_path("replay-jobs.jsonl"))
+        )
+        self.assertEqual(decision_diff.summary(), {"jobs": 4, "changed": 0, "tools": {}})
+
+    def test_changes_grouped_by_tool(self):
+        tpv_config = self._fixture_path("mapping-rules.yml")
+        decision_diff = TPVDecisionDiffer.diff(
+            [tpv_config],
+            [tpv_config, self._fixture_path("mapping-rules-user-priority.yml")],
+            read_job_specs(self._fixture_path("replay-jobs.jsonl")),
+        )
+        summary = decision_diff.summary()
+        self.assertEqual(summary["changed"], 3)
+        self.assertEqual(sorted(summary["tools"]), ["bwa", "toolshed.g2.bx.psu.edu/repos/iuc/bwameth/bwameth/42"])
+        bwa = summary["tools"]["bwa"]
+        self.assertEqual(bwa["jobs"], 2)
+        self.assertEqual([job["job"] for job in bwa["changed"]], [1, 2])
+        self.assertEqual(list(bwa["changed"][0]["changes"]), ["params"])
+        self.assertEqual(bwa["changed"][0]["changes"]["params"]["new"]["priority"], "high")
+        self.assertIn("Tool: bwa (2 of 2 jobs changed)", decision_diff.render())
+
+    def test_explain_only_changed_jobs(self):
+        differ = TPVDecisionDiffer(
+            [self._fixture_path("mapping-rules.yml")],
+            [self._fixture_path("mapping-rules.yml"), self._fixture_path("mapping-rules-user-priority.yml")],
+        )
+        changed = differ.diff_job(JobSpec(tool="bwa", user="arthur@earth.org", input_size=6), explain=True)
+        self.assertIn("TPV SCHEDULING DECISION TRACE", changed["explain"]["old"])
+        self.assertIn("priority", changed["explain"]["new"])
+        unchanged = differ.diff_job(JobSpec(tool="bwa", user="ford@earth.org", input_size=6), explain=True)
+        self.assertEqual(unchanged["changes"], {})
+        self.assertNotIn("explain", unchanged)
@@ -1,10 +1,12 @@
+import copy
 import os
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 from galaxy.jobs import JobDestination
 
 from tpv.commands.test import mock_galaxy
-from tpv.core.entities import Destination, SchedulingTags, Tag, TagType, Tool
+from tpv.core.entities import Destination, Rule, SchedulingTags, Tag, TagType, Tool
 from tpv.core.loader import TPVConfigLoader
 from tpv.rules import gateway
 
@@ -89,6 +91,26 @@ class TestEntity(unittest.TestCase):
         # make sure the deserialized tool is the same as the original
         self.assertEqual(deserialized_tool, tool)
 
+    def test_deepcopy_shares_evaluator_and_copies_properties(self):
+        tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-rules.yml")
+        loader = TPVConfigLoader.from_url_or_path(tpv_config)
+        tool = loader.config.tools["default"]
+
+        tool_copy = copy.deepcopy(tool)
+        self.assertEqual(tool_copy, tool)
+        self.assertIs(tool_copy.evaluator, loader)
+        for field in ["env", "params", "tpv_tags", "rules"]:
+            self.assertIsNot(getattr(tool_copy, field), getattr(tool, field), field)
+        self.assertIsNot(tool_copy.env[0], tool.env[0])
+        rule_id = next(iter(tool.rules))
+        self.assertIsNot(tool_copy.rules[rule_id], tool.rules[rule_id])
+        self.assertIs(tool_copy.rules[rule_id].evaluator, loader)
+
+        tool_copy.params["native_spec"] = "changed"
+        tool_copy.tpv_tags.add_tag_override(TagType.REQUIRE, "changed")
+        self.assertEqual(tool.params["native_spec"], "--mem {mem} --cores {cores}")
+        self.assertNotIn("changed", tool.tpv_tags.require)
+
     def test_tag_equivalence(self):
         tag1 = Tag(value="tag_value", tag_type=TagType.REQUIRE)
         tag2 = Tag(value="tag_value1", tag_type=TagType.REQUIRE)
@@ -147,3 +169,9 @@ class TestEntity(unittest.TestCase):
         prefer_tags = SchedulingTags(prefer=["x"])
 
         assert prefer_tags.score(entity_tags) > accept_tags.score(entity_tags)
+
+    def test_rule_ids_are_unique_across_threads(self):
+        loader = TPVConfigLoader({})
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            ids = list(pool.map(lambda _: Rule(evaluator=loader, **{"if": "True"}).id, range(2000)))
+        self.assertEqual(len(set(ids)), len(ids))
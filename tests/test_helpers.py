@@ -1,19 +1,30 @@
 """Unit tests module for the helper functions"""
 
+import threading
+import time
 import unittest
+from collections import Counter
 from types import SimpleNamespace
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from tpv.commands.test import mock_galaxy
 from tpv.core.helpers import (
+    InputDatasetIndex,
+    JobArgsMatcher,
+    _weighted_shuffle_scales,
+    compile_job_args,
     get_dataset_attributes,
     get_input_dataset,
     get_input_datasets,
     get_input_size,
     input_size,
+    job_args_match,
+    job_memo_scope,
+    run_concurrently,
     weighted_choice,
     weighted_random_sampling,
 )
+from tpv.core.loader import TPVConfigLoader
 
 
 class TestHelpers(unittest.TestCase):
@@ -85,6 +96,30 @@ class TestHelpers(unittest.TestCase):
         self.assertIsNone(get_input_dataset(job, "inputs"))
         self.assertEqual(get_input_size(job, "inputs"), 0)
 
+    def test_get_input_datasets_param_names_ending_in_digits(self):
+        """A param whose name ends in a digit only matches its own datasets, not those of its siblings"""
+        job = mock_galaxy.Job()
+        for name in ("library|input_11", "library|input_12", "library|input_2", "library|input_21"):
+            job.add_input_dataset(
+                mock_galaxy.DatasetAssociation(name, mock_galaxy.Dataset(f"{name}.txt", file_size=1 * 1024**3)),
+                name=name,
+            )
+        datasets = get_input_datasets(job, "library|input_1")
+        self.assertEqual([dataset.name for dataset in datasets], ["library|input_11", "library|input_12"])
+        datasets = get_input_datasets(job, "library|input_2")
+        self.assertEqual([dataset.name for dataset in datasets], ["library|input_2", "library|input_21"])
+        self.assertEqual(get_input_datasets(job, "library|input_"), get_input_datasets(job))
+        self.assertEqual(get_input_datasets(job, "library|input_3"), [])
+
+    def test_get_input_datasets_indexes_job_once_within_scope(self):
+        job = self._job_with_multiple_data_param()
+        with patch("tpv.core.helpers.InputDatasetIndex", wraps=InputDatasetIndex) as index_mock:
+            with job_memo_scope():
+                self.assertEqual([dataset.name for dataset in get_input_datasets(job, "inputs")], ["first", "second"])
+                self.assertEqual(get_input_size(job, "inputs"), 8)
+                self.assertEqual(get_input_datasets(job, "missing"), [])
+            self.assertEqual(index_mock.call_count, 1)
+
     def test_get_input_dataset_returns_first_match(self):
         job = self._job_with_multiple_data_param()
         dataset = get_input_dataset(job, "inputs")
@@ -146,23 +181,45 @@ class TestHelpers(unittest.TestCase):
         sample_mock.assert_called_once_with(destinations, k=3)
         choices_mock.assert_not_called()
 
-    def test_weighted_random_sampling_with_weights_uses_weighted_choices(self):
-        """When any destination defines params.weight, use weighted random choices."""
+    def test_weighted_random_sampling_with_weights_returns_permutation(self):
+        """When any destination defines params.weight, each destination is still returned exactly once."""
         destinations = [
             SimpleNamespace(id="dest_a", params={"weight": 5}),
             SimpleNamespace(id="dest_b", params={}),
             SimpleNamespace(id="dest_c", params=None),
         ]
-        sampled_destinations = [destinations[0], destinations[0], destinations[2]]
 
-        with patch("tpv.core.helpers.random.choices", return_value=sampled_destinations) as choices_mock:
-            with patch("tpv.core.helpers.random.sample") as sample_mock:
+        with patch("tpv.core.helpers.random.sample") as sample_mock:
+            for _ in range(20):
                 result = weighted_random_sampling(destinations)
-
-        self.assertEqual(result, sampled_destinations)
-        choices_mock.assert_called_once_with(destinations, weights=[5, 1, 1], k=3)
+                self.assertCountEqual(result, destinations)
         sample_mock.assert_not_called()
 
+    def test_weighted_random_sampling_prefers_higher_weights(self):
+        """Higher weighted destinations should be ranked first more often, and zero weights last."""
+        destinations = [
+            SimpleNamespace(id="dest_a", params={"weight": 1}),
+            SimpleNamespace(id="dest_b", params={"weight": 9}),
+            SimpleNamespace(id="dest_c", params={"weight": 0}),
+        ]
+        first = Counter()
+        for _ in range(1000):
+            result = weighted_random_sampling(destinations)
+            first[result[0].id] += 1
+            self.assertEqual(result[-1].id, "dest_c")
+        self.assertGreater(first["dest_b"], 800)
+
+    def test_weighted_random_sampling_caches_weights(self):
+        """The weighted ordering structure is only computed once for the same weights."""
+        destinations = [
+            SimpleNamespace(id="dest_a", params={"weight": 2}),
+            SimpleNamespace(id="dest_b", params={"weight": 3}),
+        ]
+        _weighted_shuffle_scales.cache_clear()
+        for _ in range(5):
+            weighted_random_sampling(destinations)
+        self.assertEqual(_weighted_shuffle_scales.cache_info().misses, 1)
+
     def test_weighted_choice_without_weights_uses_unweighted_choice(self):
         """When no item defines weight, use unweighted random choice."""
         items = [
@@ -263,3 +320,90 @@ class TestHelpers(unittest.TestCase):
 
         self.assertIsInstance(result, dict)
         self.assertEqual(result, items[1])
+
+    @staticmethod
+    def _job_with_param_values():
+        job = mock_galaxy.Job()
+        job.param_values = {"input_opts": {"db_selector": "db", "index": "hg38"}, "mode": "fast"}
+        return job
+
+    def test_job_args_match_nested_args(self):
+        job = self._job_with_param_values()
+        self.assertTrue(job_args_match(job, None, {"input_opts": {"db_selector": "db"}}))
+        self.assertTrue(
+            job_args_match(job, None, {"input_opts": {"db_selector": "db", "index": "hg38"}, "mode": "fast"})
+        )
+        self.assertFalse(job_args_match(job, None, {"input_opts": {"db_selector": "history"}}))
+        self.assertFalse(job_args_match(job, None, {"input_opts": {"missing": "db"}}))
+        self.assertFalse(job_args_match(job, None, {"mode": {"nested": "fast"}}))
+        self.assertFalse(job_args_match(job, None, {}))
+        self.assertFalse(job_args_match(job, None, None))
+
+    def test_job_args_match_accepts_compiled_matcher(self):
+        job = self._job_with_param_values()
+        matcher = compile_job_args({"input_opts": {"index": "hg38"}})
+        self.assertEqual(matcher.paths, ((("input_opts", "index"), "hg38"),))
+        self.assertTrue(job_args_match(job, None, matcher))
+        self.assertFalse(job_args_match(job, None, JobArgsMatcher(paths=())))
+
+    def test_job_args_match_memoizes_param_values_within_scope(self):
+        job = self._job_with_param_values()
+        job.get_param_values = MagicMock(return_value=job.param_values)
+        with job_memo_scope():
+            self.assertTrue(job_args_match(job, None, {"mode": "fast"}))
+            self.assertFalse(job_args_match(job, None, {"mode": "slow"}))
+        self.assertEqual(job.get_param_values.call_count, 1)
+        # outside of a scope, nothing is memoized
+        job_args_match(job, None, {"mode": "fast"})
+        job_args_match(job, None, {"mode": "fast"})
+        self.assertEqual(job.get_param_values.call_count, 3)
+
+    def test_job_args_match_literal_args_are_precompiled(self):
+        loader = TPVConfigLoader({})
+        code = "helpers.job_args_match(job, app, {'input_opts': {'db_selector': 'db'}})"
+        exec_block, eval_block = loader.compile_code_block(code)
+        self.assertIn(((("input_opts", "db_selector"), "db"),), eval_block.co_consts)
+        context = {"job": self._job_with_param_values(), "app": None}
+        self.assertTrue(loader.eval_code_block(code, context))
+        # dicts that aren't literals are compiled when called
+        self.assertTrue(
+            loader.eval_code_block("helpers.job_args_match(job, app, {'mode': job.param_values['mode']})", context)
+        )
+
+    def test_run_concurrently_returns_results_in_order(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def call(value):
+            # every call must be running at the same time for the barrier to be passed
+            barrier.wait()
+            return value
+
+        self.assertEqual(run_concurrently([lambda v=v: call(v) for v in range(3)]), [0, 1, 2])
+        self.assertEqual(run_concurrently([]), [])
+
+    def test_run_concurrently_raises_first_exception_after_all_calls(self):
+        finished = []
+
+        def slow():
+            time.sleep(0.1)
+            finished.append(True)
+
+        def fail(message):
+            raise ValueError(message)
+
+        with self.assertRaisesRegex(ValueError, "first"):
+            run_concurrently([lambda: fail("first"), slow, lambda: fail("second")])
+        self.assertEqual(finished, [True])
+
+    def test_run_concurrently_shares_job_memo(self):
+        job = self._job_with_param_values()
+        job.get_param_values = MagicMock(return_value=job.param_values)
+        with job_memo_scope():
+            job_args_match(job, None, {"mode": "fast"})
+            run_concurrently([lambda: job_args_match(job, None, {"mode": "fast"})] * 2)
+        self.assertEqual(job.get_param_values.call_count, 1)
+
+    def test_nested_run_concurrently_runs_inline(self):
+        thread_names = run_concurrently([lambda: run_concurrently([lambda: threading.current_thread().name] * 2)] * 2)
+        for names in thread_names:
+            self.assertEqual(len(set(names)), 1)
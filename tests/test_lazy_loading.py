@@ -0,0 +1,101 @@
+import copy
+import os
+import unittest
+
+from tpv.commands.test import mock_galaxy
+from tpv.core.entities import LazyEntities
+from tpv.core.loader import InvalidParentException
+from tpv.rules import gateway
+
+
+def fixture(name):
+    return os.path.join(os.path.dirname(__file__), "fixtures", name)
+
+
+INHERITED_VERSION_RANGE = {
+    "global": {"default_inherits": "default"},
+    "tools": {
+        "default": {"cores": 2, "mem": 4, "params": {"native_spec": "--mem {mem}"}},
+        "new_fastqc": {"abstract": True, "version_range": {"gte": "0.12"}},
+        "toolshed.g2.bx.psu.edu/repos/iuc/fastqc/fastqc/.*": {"inherits": "new_fastqc", "mem": 16},
+    },
+    "destinations": {"local": {"runner": "local", "max_accepted_cores": 4, "max_accepted_mem": 32}},
+}
+
+
+def normalized_dump(tool):
+    data = tool.model_dump()
+    # rules without an id are numbered in the order in which they are loaded, which differs between modes
+    data["rules"] = [
+        {**rule, "id": None if rule["id"].startswith("tpv_rule_") else rule["id"]} for rule in data["rules"].values()
+    ]
+    return data
+
+
+class TestLazyLoading(unittest.TestCase):
+
+    CONFIG_CHAINS = [
+        [fixture("mapping-inheritance.yml")],
+        [fixture("mapping-rules.yml")],
+        [fixture("mapping-tool-version-range.yml")],
+        [fixture("scenario-usegalaxy-dev.yml")],
+        [fixture("mapping-merge-multiple-remote.yml"), fixture("mapping-merge-multiple-local.yml")],
+        [fixture("mapping-rules.yml"), fixture("mapping-rules-extra.yml")],
+        # version ranges that are inherited, within a file and from an earlier file
+        [INHERITED_VERSION_RANGE],
+        [{"tools": {"new_fastqc": INHERITED_VERSION_RANGE["tools"]["new_fastqc"]}}, INHERITED_VERSION_RANGE],
+    ]
+
+    def test_lazy_tools_match_eager_tools(self):
+        for chain in self.CONFIG_CHAINS:
+            with self.subTest(chain=chain):
+                # loading a config adds the loader to inline configs, so each mode loads its own copy
+                eager = gateway.load_config_chain(copy.deepcopy(chain))
+                lazy = gateway.load_config_chain(copy.deepcopy(chain), lazy=True)
+                self.assertIsInstance(lazy.config.tools, LazyEntities)
+                self.assertEqual(list(lazy.config.tools), list(eager.config.tools))
+                for key, tool in eager.config.tools.items():
+                    self.assertEqual(normalized_dump(lazy.config.tools[key]), normalized_dump(tool), key)
+                self.assertEqual(
+                    lazy.get_tool_version_ranges(lazy.config.tools), eager.get_tool_version_ranges(eager.config.tools)
+                )
+
+    def test_tools_materialized_on_first_match(self):
+        galaxy_app = mock_galaxy.App(job_conf=fixture("job_conf.yml"))
+        job = mock_galaxy.Job()
+        job.add_input_dataset(
+            mock_galaxy.DatasetAssociation("test", mock_galaxy.Dataset("test.txt", file_size=5 * 1024**3))
+        )
+        user = mock_galaxy.User("gargravarr", "fairycake@vortex.org")
+        gateway.ACTIVE_DESTINATION_MAPPERS = {}
+        destination = gateway.map_tool_to_destination(
+            galaxy_app,
+            job,
+            mock_galaxy.Tool("bwa"),
+            user,
+            tpv_config_files=[fixture("mapping-rules.yml")],
+            tpv_lazy_tools="true",
+        )
+        self.assertEqual(destination.params["native_spec"], "--mem 16 --cores 4")
+        tools = gateway.ACTIVE_DESTINATION_MAPPERS["tpv_dispatcher"].config.tools
+        # only the default tool and bwa were needed to map the job
+        self.assertEqual(tools.materialized, 2)
+
+    def test_inherited_version_range_applied(self):
+        galaxy_app = mock_galaxy.App(job_conf=fixture("job_conf.yml"))
+        tool = mock_galaxy.Tool("toolshed.g2.bx.psu.edu/repos/iuc/fastqc/fastqc/0.11.9", version="0.11.9")
+        for lazy in [False, True]:
+            with self.subTest(lazy=lazy):
+                mapper = gateway.load_destination_mapper([copy.deepcopy(INHERITED_VERSION_RANGE)], lazy=lazy)
+                destination = mapper.map_to_destination(
+                    galaxy_app, tool, mock_galaxy.User("ford", "prefect@vortex.org"), mock_galaxy.Job()
+                )
+                self.assertEqual(destination.params["native_spec"], "--mem 4")
+
+    def test_invalid_inheritance_raised_on_first_match(self):
+        loader = gateway.load_config_chain(
+            [{"tools": {"bwa": {"inherits": "missing"}, "hisat": {"cores": 2}}}], lazy=True
+        )
+        self.assertEqual(loader.config.tools["hisat"].cores, 2)
+        with self.assertRaisesRegex(InvalidParentException, "The specified parent: missing for entity: bwa"):
+            loader.config.tools["bwa"]
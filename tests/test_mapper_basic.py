@@ -1,7 +1,15 @@
+import asyncio
+import copy
 import os
 import re
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
+import yaml
 from galaxy.jobs.mapper import JobMappingException
 
 from tpv.commands.test import mock_galaxy
@@ -98,3 +106,196 @@ class TestMapperConfigHandling(unittest.TestCase):
         missing_local_path = os.path.join(os.path.dirname(__file__), "fixtures/this-file-does-not-exist.yml")
         with self.assertRaises(FileNotFoundError):
             load_yaml_from_url_or_path(missing_local_path)
+
+
+class TestMapperAsync(unittest.TestCase):
+
+    def test_map_tool_to_destination_async(self):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        user = mock_galaxy.User("gargravarr", "fairycake@vortex.org")
+        tpv_config = {
+            "tools": {
+                "bwa": {
+                    "cores": "sum(helpers.run_concurrently([lambda: 1, lambda: 2]))",
+                    "scheduling": {"require": ["pulsar"]},
+                }
+            },
+            "destinations": {
+                "local": {"runner": "local"},
+                "k8s_environment": {"runner": "k8s", "scheduling": {"accept": ["pulsar"]}},
+            },
+        }
+        gateway.ACTIVE_DESTINATION_MAPPERS = {}
+
+        async def map_jobs():
+            return await asyncio.gather(
+                *(
+                    gateway.map_tool_to_destination_async(
+                        galaxy_app, mock_galaxy.Job(), mock_galaxy.Tool(tool_id), user, tpv_configs=[tpv_config]
+                    )
+                    for tool_id in ["bwa", "sometool"]
+                )
+            )
+
+        bwa, sometool = asyncio.run(map_jobs())
+        self.assertEqual(bwa.id, "k8s_environment")
+        self.assertEqual(sometool.id, "local")
+
+    def test_map_tool_to_destination_async_raises_mapping_errors(self):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        gateway.ACTIVE_DESTINATION_MAPPERS = {}
+        with self.assertRaisesRegex(JobMappingException, "No destinations are available"):
+            asyncio.run(
+                gateway.map_tool_to_destination_async(
+                    galaxy_app,
+                    mock_galaxy.Job(),
+                    mock_galaxy.Tool("unschedulable_tool"),
+                    None,
+                    tpv_config_files=[os.path.join(os.path.dirname(__file__), "fixtures/mapping-basic.yml")],
+                )
+            )
+
+
+class TestMapperThreads(unittest.TestCase):
+
+    @staticmethod
+    def _map_jobs(jobs):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-rules.yml")
+        results = []
+        for tool_id, email, size in jobs:
+            job = mock_galaxy.Job()
+            job.add_input_dataset(
+                mock_galaxy.DatasetAssociation("test", mock_galaxy.Dataset("test.txt", file_size=size * 1024**3))
+            )
+            user = mock_galaxy.User(email.split("@")[0], email)
+            try:
+                destination = gateway.map_tool_to_destination(
+                    galaxy_app, job, mock_galaxy.Tool(tool_id), user, tpv_config_files=[config]
+                )
+                results.append((destination.id, destination.params.get("native_spec")))
+            except Exception as e:
+                # some users can't run some of the tools, which must fail the same way
+                results.append((type(e).__name__, str(e)))
+        return results
+
+    def test_concurrent_mapping_matches_sequential_mapping(self):
+        jobs = [
+            (tool_id, email, size)
+            for tool_id in ["bwa", "toolshed.g2.bx.psu.edu/repos/iuc/bwameth/bwameth/0.2", "sometool"]
+            for email in ["fairycake@vortex.org", "arthur@vortex.org", "krikkitrobot@planetkrikkit.org"]
+            for size in [1, 6, 12, 25]
+        ]
+        gateway.ACTIVE_DESTINATION_MAPPERS = {}
+        expected = self._map_jobs(jobs)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            # every thread maps all jobs through the same mapper, starting with a different job
+            futures = [pool.submit(self._map_jobs, jobs[i:] + jobs[:i]) for i in range(8)]
+            results = [future.result() for future in futures]
+        for i, result in enumerate(results):
+            self.assertEqual(result, expected[i:] + expected[:i])
+
+    def test_mapper_is_loaded_once_by_concurrent_jobs(self):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-rules.yml")
+        gateway.ACTIVE_DESTINATION_MAPPERS = {}
+        barrier = threading.Barrier(8)
+
+        def load_mapper():
+            barrier.wait(timeout=5)
+            return gateway.lock_and_load_mapper(galaxy_app, "tpv_dispatcher", [config])
+
+        with (
+            mock.patch.object(
+                gateway, "setup_destination_mapper", wraps=gateway.setup_destination_mapper
+            ) as setup_mapper,
+            ThreadPoolExecutor(max_workers=8) as pool,
+        ):
+            mappers = list(pool.map(lambda _: load_mapper(), range(8)))
+        self.assertEqual(setup_mapper.call_count, 1)
+        self.assertEqual(len({id(mapper) for mapper in mappers}), 1)
+
+
+class TestMappingFailures(unittest.TestCase):
+
+    CONFIG = {
+        "tools": {
+            "unschedulable": {"cores": 2, "scheduling": {"require": ["gpu"]}},
+            "bwa": {"cores": 2, "rules": [{"if": "input_size > 10", "fail": "Input of {input_size} GB is too large"}]},
+            "hisat": {
+                "cores": "2 if user else 1",
+                "rules": [{"if": "user.email.endswith('@krikkit.org')", "fail": "No robots allowed"}],
+            },
+        },
+        "roles": {"training": {"scheduling": {"accept": ["training"]}}},
+        "destinations": {
+            "local": {"runner": "local"},
+            "training_cluster": {"runner": "local", "scheduling": {"accept": ["gpu"], "require": ["training"]}},
+        },
+    }
+
+    @staticmethod
+    def _map_to_destination(mapper, tool_id, user, size=1):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        job = mock_galaxy.Job()
+        job.add_input_dataset(
+            mock_galaxy.DatasetAssociation("test", mock_galaxy.Dataset("test.txt", file_size=size * 1024**3))
+        )
+        return mapper.map_to_tpv_destination(galaxy_app, mock_galaxy.Tool(tool_id), user, job)
+
+    def test_job_independent_failures_are_remembered(self):
+        mapper = gateway.load_destination_mapper([copy.deepcopy(self.CONFIG)])
+        user = mock_galaxy.User("ford", "prefect@vortex.org")
+        with self.assertRaisesRegex(JobMappingException, "No destinations are available") as first:
+            self._map_to_destination(mapper, "unschedulable", user)
+        with mock.patch.object(mapper, "match_combine_evaluate_entities") as match:
+            with self.assertRaises(JobMappingException) as repeat:
+                self._map_to_destination(mapper, "unschedulable", user)
+            match.assert_not_called()
+        self.assertEqual(str(repeat.exception), str(first.exception))
+        # a user with different roles may be able to run the tool
+        trainee = mock_galaxy.User("ford", "prefect@vortex.org", roles=["training"])
+        self.assertEqual(self._map_to_destination(mapper, "unschedulable", trainee).dest_name, "training_cluster")
+
+    def test_rule_failures_that_only_depend_on_the_user_are_remembered(self):
+        mapper = gateway.load_destination_mapper([copy.deepcopy(self.CONFIG)])
+        robot = mock_galaxy.User("marvin", "marvin@krikkit.org")
+        for _ in range(2):
+            with self.assertRaisesRegex(JobMappingException, "No robots allowed"):
+                self._map_to_destination(mapper, "hisat", robot)
+        self.assertEqual(len(mapper.mapping_failures.cache), 1)
+
+    def test_remembered_failures_are_dropped_when_config_reloads(self):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        tool = mock_galaxy.Tool("unschedulable")
+        user = mock_galaxy.User("ford", "prefect@vortex.org")
+        with tempfile.NamedTemporaryFile("w", suffix=".yml") as tpv_config:
+            yaml.safe_dump(self.CONFIG, tpv_config)
+            tpv_config.flush()
+            gateway.ACTIVE_DESTINATION_MAPPERS = {}
+            with self.assertRaisesRegex(JobMappingException, "No destinations are available"):
+                gateway.map_tool_to_destination(
+                    galaxy_app, mock_galaxy.Job(), tool, user, tpv_config_files=[tpv_config.name]
+                )
+
+            # accept gpu jobs on the local destination, and wait for the config to reload
+            config = copy.deepcopy(self.CONFIG)
+            config["destinations"]["local"]["scheduling"] = {"accept": ["gpu"]}
+            tpv_config.seek(0)
+            tpv_config.truncate()
+            yaml.safe_dump(config, tpv_config)
+            tpv_config.flush()
+            time.sleep(2)
+
+            destination = gateway.map_tool_to_destination(
+                galaxy_app, mock_galaxy.Job(), tool, user, tpv_config_files=[tpv_config.name]
+            )
+            self.assertEqual(destination.id, "local")
+
+    def test_job_dependent_failures_are_not_remembered(self):
+        mapper = gateway.load_destination_mapper([copy.deepcopy(self.CONFIG)])
+        user = mock_galaxy.User("ford", "prefect@vortex.org")
+        with self.assertRaisesRegex(JobMappingException, "Input of 20.0 GB is too large"):
+            self._map_to_destination(mapper, "bwa", user, size=20)
+        self.assertEqual(self._map_to_destination(mapper, "bwa", user).dest_name, "local")
+        self.assertEqual(len(mapper.mapping_failures.cache), 0)
@@ -1,9 +1,13 @@
 import os
+import threading
 import unittest
+from unittest import mock
 
-from galaxy.jobs.mapper import JobMappingException
+from galaxy.jobs.mapper import JobMappingException, JobNotReadyException
 
 from tpv.commands.test import mock_galaxy
+from tpv.core.entities import Destination, SchedulingTags
+from tpv.core.mapper import DestinationDeferrals
 from tpv.rules import gateway
 
 
@@ -285,3 +289,150 @@ class TestMapperDestinations(unittest.TestCase):
             [env["value"] for env in destination.env if env["name"] == "MY_TOOL_ENV"],
             ["cores: 8 mem: 24 gpus: 1"],
         )
+
+
+class TestDestinationTagIndex(unittest.TestCase):
+
+    def test_candidates_match_tags(self):
+        for fixture in ["mapping-destinations.yml", "mapping-rules.yml", "scenario-usegalaxy-dev.yml"]:
+            mapper = gateway.load_destination_mapper([os.path.join(os.path.dirname(__file__), "fixtures", fixture)])
+            index = mapper.destination_tag_index
+            tag_values = sorted(set(index.tagged)) + ["unknown"]
+            tag_sets = [SchedulingTags()]
+            for tag in tag_values:
+                for tag_type in ["require", "prefer", "accept", "reject"]:
+                    tag_sets.append(SchedulingTags(**{tag_type: [tag]}))
+            tag_sets.append(SchedulingTags(require=tag_values[:2], reject=tag_values[2:3], accept=tag_values[3:5]))
+            for tags in tag_sets:
+                with self.subTest(fixture=fixture, tags=tags):
+                    self.assertEqual(
+                        index.candidates(tags), {key for key, dest_tags in index.tags.items() if tags.match(dest_tags)}
+                    )
+
+    def test_only_candidate_destinations_are_matched(self):
+        destinations = {
+            f"pulsar_{i}": {"runner": "pulsar", "max_accepted_cores": 8, "scheduling": {"require": [f"pulsar_{i}"]}}
+            for i in range(300)
+        }
+        destinations["local"] = {"runner": "local", "max_accepted_cores": 8, "scheduling": {"accept": ["general"]}}
+        config = {
+            "tools": {"bwa": {"cores": 2, "scheduling": {"require": ["pulsar_7"]}}},
+            "destinations": destinations,
+        }
+        mapper = gateway.load_destination_mapper([config])
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        with mock.patch.object(Destination, "matches", autospec=True, side_effect=Destination.matches) as matches:
+            destination = mapper.map_to_tpv_destination(
+                galaxy_app, mock_galaxy.Tool("bwa"), mock_galaxy.User("ford", "prefect@vortex.org"), mock_galaxy.Job()
+            )
+        self.assertEqual(destination.dest_name, "pulsar_7")
+        self.assertEqual(matches.call_count, 1)
+
+
+class TestConcurrentDestinationEvaluation(unittest.TestCase):
+
+    @staticmethod
+    def _mapper(outcomes, concurrent_destinations=3):
+        destinations = {}
+        for rank, (name, outcome) in enumerate(outcomes.items()):
+            # the top ranked destinations wait for each other at the barrier, so they can only be evaluated concurrently
+            rule = {"if": "barrier.wait(timeout=5) >= 0" if rank < concurrent_destinations else "True"}
+            if outcome:
+                rule["execute"] = f"from tpv.core.entities import {outcome}\nraise {outcome}('{name}')"
+            destinations[name] = {"runner": "local", "max_accepted_cores": 8, "rules": [rule]}
+        config = {
+            "global": {
+                "concurrent_destinations": concurrent_destinations,
+                "context": {"barrier": threading.Barrier(min(len(outcomes), concurrent_destinations))},
+            },
+            "tools": {"bwa": {"cores": 2}},
+            "destinations": destinations,
+        }
+        return gateway.load_destination_mapper([config])
+
+    @staticmethod
+    def _map_to_destination(mapper):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        return mapper.map_to_tpv_destination(
+            galaxy_app, mock_galaxy.Tool("bwa"), mock_galaxy.User("ford", "prefect@vortex.org"), mock_galaxy.Job()
+        )
+
+    def test_highest_ranked_success_is_chosen(self):
+        mapper = self._mapper({"first": None, "second": None, "third": None})
+        self.assertEqual(self._map_to_destination(mapper).dest_name, "first")
+        mapper = self._mapper(
+            {"first": "TryNextDestinationOrFail", "second": "TryNextDestinationOrWait", "third": None}
+        )
+        self.assertEqual(self._map_to_destination(mapper).dest_name, "third")
+
+    def test_deferred_destinations_raise_not_ready(self):
+        mapper = self._mapper({"first": "TryNextDestinationOrWait", "second": "TryNextDestinationOrFail"})
+        with self.assertRaises(JobNotReadyException):
+            self._map_to_destination(mapper)
+
+    def test_destinations_past_the_top_ranked_are_evaluated_in_turn(self):
+        mapper = self._mapper(
+            {"first": "TryNextDestinationOrFail", "second": "TryNextDestinationOrFail", "third": None},
+            concurrent_destinations=2,
+        )
+        self.assertEqual(self._map_to_destination(mapper).dest_name, "third")
+
+    def test_concurrent_evaluation_is_inherited(self):
+        mapper = gateway.load_destination_mapper(
+            [{"global": {"concurrent_destinations": 4}}, {"tools": {"bwa": {"cores": 2}}}]
+        )
+        self.assertEqual(mapper.concurrent_destinations, 4)
+
+
+class TestDestinationDeferrals(unittest.TestCase):
+
+    @staticmethod
+    def _map_to_destination(mapper, tool_id):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        return mapper.map_to_tpv_destination(
+            galaxy_app, mock_galaxy.Tool(tool_id), mock_galaxy.User("ford", "prefect@vortex.org"), mock_galaxy.Job()
+        )
+
+    def test_deferred_destinations_are_not_reevaluated(self):
+        config = {
+            "global": {"deferral_ttl": 60},
+            "tools": {"bwa": {"cores": 2}, "hisat": {"cores": 4}},
+            "destinations": {
+                "gpu_cluster": {
+                    "runner": "slurm",
+                    "max_accepted_cores": 8,
+                    "rules": [
+                        {
+                            "if": "True",
+                            "execute": "from tpv.core.entities import TryNextDestinationOrWait\n"
+                            "raise TryNextDestinationOrWait('queue is full')",
+                        }
+                    ],
+                }
+            },
+        }
+        mapper = gateway.load_destination_mapper([config])
+        with mock.patch.object(Destination, "evaluate", autospec=True, side_effect=Destination.evaluate) as evaluate:
+            for _ in range(3):
+                with self.assertRaises(JobNotReadyException):
+                    self._map_to_destination(mapper, "bwa")
+            self.assertEqual(evaluate.call_count, 1)
+            # an entity with a different signature is evaluated
+            with self.assertRaises(JobNotReadyException):
+                self._map_to_destination(mapper, "hisat")
+            self.assertEqual(evaluate.call_count, 2)
+
+    def test_deferrals_expire(self):
+        now = [0.0]
+        deferrals = DestinationDeferrals(ttl=30, timer=lambda: now[0])
+        deferrals.set(("gpu_cluster",), "queue is full")
+        now[0] = 29
+        self.assertEqual(deferrals.get(("gpu_cluster",)), "queue is full")
+        now[0] = 31
+        self.assertIsNone(deferrals.get(("gpu_cluster",)))
+
+    def test_deferrals_are_not_memoized_by_default(self):
+        mapper = gateway.load_destination_mapper(
+            [os.path.join(os.path.dirname(__file__), "fixtures/mapping-basic.yml")]
+        )
+        self.assertIsNone(mapper.deferrals)
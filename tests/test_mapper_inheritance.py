@@ -1,7 +1,9 @@
 import os
 import unittest
+from unittest import mock
 
 from tpv.commands.test import mock_galaxy
+from tpv.core.entities import Tool
 from tpv.core.loader import InvalidParentException, TPVConfigLoader
 from tpv.rules import gateway
 
@@ -171,3 +173,28 @@ class TestMapperInheritance(unittest.TestCase):
         # create a destination
         destination = loader.config.destinations["k8s_environment"]
         assert destination.inherit(None) == destination
+
+    def test_deep_inheritance_resolved_once_per_entity(self):
+        depth = 200
+        tools = {"tool_0": {"cores": 2, "env": {"TOOL_0": "set"}}}
+        for i in range(1, depth):
+            tools[f"tool_{i}"] = {"inherits": f"tool_{i - 1}", "env": {f"TOOL_{i}": "set"}}
+        with mock.patch.object(Tool, "inherit", autospec=True, side_effect=Tool.inherit) as inherit:
+            loader = TPVConfigLoader({"tools": tools})
+        # each entity with a parent inherits exactly once, rather than once for each of its descendants
+        self.assertEqual(inherit.call_count, depth - 1)
+        deepest = loader.config.tools[f"tool_{depth - 1}"]
+        self.assertEqual(deepest.cores, 2)
+        self.assertEqual(len(deepest.env), depth)
+
+    def test_inheritance_cycle_reports_path(self):
+        tools = {
+            "bwa": {"inherits": "aligner"},
+            "aligner": {"inherits": "mapper"},
+            "mapper": {"inherits": "bwa"},
+        }
+        with self.assertRaisesRegex(
+            InvalidParentException,
+            r"Cycle detected in inheritance chain for entity: bwa \(bwa -> aligner -> mapper -> bwa\)",
+        ):
+            TPVConfigLoader({"tools": tools})
@@ -0,0 +1,61 @@
+"""Integration tests for matching tool entries by version range."""
+
+import os
+import unittest
+
+from galaxy.jobs import JobDestination
+from pydantic import ValidationError
+
+from tpv.commands.test import mock_galaxy
+from tpv.core.entities import ToolVersionRange
+from tpv.core.util import parse_tool_version
+from tpv.rules import gateway
+
+
+class TestMapperToolVersion(unittest.TestCase):
+
+    @staticmethod
+    def _map_to_destination(tool: mock_galaxy.Tool) -> JobDestination:
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        job = mock_galaxy.Job()
+        user = mock_galaxy.User("ford", "prefect@vortex.org")
+        tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-tool-version-range.yml")
+        gateway.ACTIVE_DESTINATION_MAPPERS = {}
+        return gateway.map_tool_to_destination(galaxy_app, job, tool, user, tpv_config_files=[tpv_config])  # type: ignore[arg-type]
+
+    def test_version_within_range(self) -> None:
+        tool = mock_galaxy.Tool("toolshed.g2.bx.psu.edu/repos/iuc/fastqc/fastqc/0.12.1", version="0.12.1")
+        destination = self._map_to_destination(tool)
+        self.assertEqual(destination.params["native_spec"], "--mem 16 --cores 4")
+
+    def test_version_outside_ranges(self) -> None:
+        tool = mock_galaxy.Tool("toolshed.g2.bx.psu.edu/repos/iuc/fastqc/fastqc/0.11.9", version="0.11.9")
+        destination = self._map_to_destination(tool)
+        self.assertEqual(destination.params["native_spec"], "--mem 8 --cores 4")
+
+    def test_version_in_lower_range(self) -> None:
+        tool = mock_galaxy.Tool("toolshed.g2.bx.psu.edu/repos/iuc/fastqc/fastqc/0.9", version="0.9")
+        destination = self._map_to_destination(tool)
+        self.assertEqual(destination.params["native_spec"], "--mem 2 --cores 1")
+
+    def test_unknown_version_is_not_in_range(self) -> None:
+        self.assertFalse(ToolVersionRange(gte="0.1").contains(None))
+        self.assertTrue(ToolVersionRange().contains("1.0"))
+
+    def test_range_versions_loaded_as_numbers(self) -> None:
+        version_range = ToolVersionRange.model_validate({"gte": "1.5", "lt": 2})
+        self.assertEqual(version_range.lt, "2")
+        self.assertTrue(version_range.contains("1.10"))
+        self.assertFalse(version_range.contains("2.0"))
+        with self.assertRaisesRegex(ValidationError, "Version 1.1 must be quoted"):
+            ToolVersionRange.model_validate({"gte": 1.10})
+
+    def test_unknown_range_bounds_are_rejected(self) -> None:
+        with self.assertRaisesRegex(ValidationError, "gte_"):
+            ToolVersionRange.model_validate({"gte_": "1.0"})
+
+    def test_tool_versions_are_parsed_once(self) -> None:
+        parse_tool_version.cache_clear()
+        for _ in range(3):
+            ToolVersionRange(gte="0.12", lt="1.0").contains("0.12.1")
+        self.assertEqual(parse_tool_version.cache_info().misses, 3)
@@ -0,0 +1,135 @@
+"""Unit tests for the incremental type checking of code blocks by the linter"""
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tpv.commands import mypychecker
+from tpv.core.loader import TPVConfigLoader
+
+CHECKED_CODE = []
+
+
+def fake_mypy_run(args):
+    """Reports an error for every line that refers to the undefined variable mem2."""
+    filename = args[-1]
+    with open(filename) as f:
+        CHECKED_CODE.append(f.read())
+    errors = [
+        f'{filename}:{i}: error: Name "mem2" is not defined  [name-defined]'
+        for i, line in enumerate(CHECKED_CODE[-1].splitlines(), start=1)
+        if "mem2" in line
+    ]
+    if not errors:
+        return "Success: no issues found in 1 source file\n", "", 0
+    return "\n".join(errors + [f"Found {len(errors)} errors in 1 file"]) + "\n", "", 1
+
+
+class TestIncrementalTypeCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.loader = TPVConfigLoader.from_url_or_path(
+            os.path.join(os.path.dirname(__file__), "fixtures/linter/linter-types-undefined-variable.yml")
+        )
+
+    @staticmethod
+    def _reported_lines(errors):
+        lines = []
+        for error in errors:
+            filename, line = re.match(r"^(.+?):(\d+): ", error).groups()
+            with open(filename) as f:
+                lines.append(f.readlines()[int(line) - 1])
+        return lines
+
+    def _type_check(self, loader):
+        exit_code, errors, filename = mypychecker.type_check_code(loader, True, cache_dir=self.cache_dir)
+        self.addCleanup(lambda: os.path.exists(filename) and os.remove(filename))
+        return exit_code, errors
+
+    def test_cached_results_are_reported_without_running_mypy(self):
+        with patch("tpv.commands.mypychecker.mypy.api.run", side_effect=fake_mypy_run) as mypy_run:
+            exit_code, errors = self._type_check(self.loader)
+            self.assertEqual(mypy_run.call_count, 1)
+            self.assertEqual(exit_code, 1)
+            self.assertEqual(len(errors), 1)
+            # the message refers to the line in the fully rendered code
+            self.assertIn("mem2", self._reported_lines(errors)[0])
+            self.assertIn("--cache-dir", mypy_run.call_args.args[0])
+
+            exit_code, cached_errors = self._type_check(self.loader)
+            self.assertEqual(mypy_run.call_count, 1)
+            self.assertEqual(exit_code, 1)
+            self.assertEqual([e.split(":", 1)[1] for e in cached_errors], [e.split(":", 1)[1] for e in errors])
+            self.assertIn("mem2", self._reported_lines(cached_errors)[0])
+
+    def test_only_changed_code_blocks_are_checked(self):
+        with patch("tpv.commands.mypychecker.mypy.api.run", side_effect=fake_mypy_run) as mypy_run:
+            self._type_check(self.loader)
+            changed_loader = TPVConfigLoader(
+                {"tools": {"default": {"params": {"native_spec": "--mem {mem2} --cores {cores}"}}}},
+                parent=self.loader,
+            )
+            exit_code, errors = self._type_check(changed_loader)
+            self.assertEqual(mypy_run.call_count, 2)
+            self.assertIn("--cores", CHECKED_CODE[-1])
+            self.assertNotIn("something", CHECKED_CODE[-1])
+            self.assertEqual(exit_code, 1)
+            self.assertEqual(len(errors), 1)
+            self.assertIn("--cores", self._reported_lines(errors)[0])
+
+    def test_no_cache_dir_checks_everything(self):
+        with patch("tpv.commands.mypychecker.mypy.api.run", side_effect=fake_mypy_run) as mypy_run:
+            mypychecker.type_check_code(self.loader, False)
+            mypychecker.type_check_code(self.loader, False)
+            self.assertEqual(mypy_run.call_count, 2)
+            self.assertNotIn("--cache-dir", mypy_run.call_args.args[0])
+
+    def test_unusable_cache_dir_checks_everything(self):
+        cache_dir = os.path.join(self.cache_dir, "file")
+        with open(cache_dir, "w"):
+            pass
+        with patch("tpv.commands.mypychecker.mypy.api.run", side_effect=fake_mypy_run) as mypy_run:
+            with self.assertLogs("tpv.commands.mypychecker", "WARNING"):
+                exit_code, errors, _ = mypychecker.type_check_code(self.loader, False, cache_dir=cache_dir)
+            self.assertEqual(mypy_run.call_count, 1)
+            self.assertNotIn("--cache-dir", mypy_run.call_args.args[0])
+            self.assertEqual(exit_code, 1)
+            self.assertEqual(len(errors), 1)
+
+    def test_concurrent_caches_keep_each_others_entries(self):
+        first = mypychecker.TypeCheckCache(self.cache_dir, "usegalaxy.org")
+        second = mypychecker.TypeCheckCache(self.cache_dir, "usegalaxy.eu")
+        # mypy's own cache can't be shared by concurrent runs
+        self.assertNotEqual(first.mypy_cache_dir, second.mypy_cache_dir)
+        first.entries["first"] = []
+        second.entries["second"] = [(1, "error")]
+        first.save()
+        second.save()
+        self.assertEqual(mypychecker.TypeCheckCache(self.cache_dir).entries, {"first": [], "second": [(1, "error")]})
+
+    def test_cached_notes_without_errors_succeed(self):
+        def fake_mypy_run_with_note(args):
+            # also reports a note for every line that refers to something
+            stdout, stderr, exit_code = fake_mypy_run(args)
+            notes = [
+                f'{args[-1]}:{i}: note: Revealed type is "builtins.str"'
+                for i, line in enumerate(CHECKED_CODE[-1].splitlines(), start=1)
+                if "something" in line
+            ]
+            return "\n".join(notes + [stdout]), stderr, exit_code
+
+        with patch("tpv.commands.mypychecker.mypy.api.run", side_effect=fake_mypy_run_with_note):
+            exit_code, errors = self._type_check(self.loader)
+            self.assertEqual(exit_code, 1)
+            self.assertEqual(len(errors), 2)
+            fixed_loader = TPVConfigLoader(
+                {"tools": {"default": {"params": {"native_spec": "--mem {mem} --cores {cores}"}}}},
+                parent=self.loader,
+            )
+            # only the note is left, which mypy does not fail for
+            self.assertEqual(self._type_check(fixed_loader), (0, []))
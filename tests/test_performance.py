@@ -0,0 +1,162 @@
+import copy
+import gc
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+from pydantic import BaseModel
+
+from tpv.commands.test import mock_galaxy
+from tpv.core.loader import TPVConfigLoader
+from tpv.rules import gateway
+
+
+class TestLoaderPerformance(unittest.TestCase):
+
+    @staticmethod
+    def _shared_config(num_tools):
+        tools = {"shared_base": {"abstract": True, "cores": 1, "mem": 4}}
+        for i in range(num_tools):
+            tools[f"tool_{i}"] = {"inherits": "shared_base", "cores": 2, "env": {"SHARED": "true"}}
+        return {"tools": tools}
+
+    @staticmethod
+    def _overlay_config(num_tools):
+        # a local overlay that overrides every shared tool, through a local abstract parent
+        tools = {"local_base": {"abstract": True, "scheduling": {"require": ["local"]}}}
+        for i in range(num_tools):
+            tools[f"tool_{i}"] = {"inherits": "local_base", "mem": 8}
+        return {"tools": tools}
+
+    @classmethod
+    def _time_merge(cls, num_tools, repeats=3):
+        shared = TPVConfigLoader(cls._shared_config(num_tools))
+        overlay = TPVConfigLoader(cls._overlay_config(num_tools))
+        timings = []
+        # garbage collection pauses grow with the number of live objects, and would swamp the merge itself
+        gc.disable()
+        try:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                merged = overlay.inherit_parent_entities(shared.config.tools, overlay.config.tools)
+                timings.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+        return merged, min(timings)
+
+    @pytest.mark.slow
+    def test_inherit_parent_entities_scales_linearly(self):
+        timings = {}
+        for num_tools in [2000, 8000]:
+            merged, timings[num_tools] = self._time_merge(num_tools)
+            self.assertEqual(len(merged), num_tools + 2)
+            tool = merged[f"tool_{num_tools - 1}"]
+            self.assertEqual((tool.cores, tool.mem), (2, 8))
+            self.assertEqual(tool.tpv_tags.require, ["local"])
+        # four times as many overrides should take about four times as long, and nowhere near sixteen times
+        self.assertLess(timings[8000], timings[2000] * 8, f"Merge timings do not scale linearly: {timings}")
+
+
+class TestEntityPerformance(unittest.TestCase):
+
+    @pytest.mark.slow
+    def test_entity_deepcopy_faster_than_generic_deepcopy(self):
+        loader = TPVConfigLoader.from_url_or_path(
+            os.path.join(os.path.dirname(__file__), "fixtures/scenario-usegalaxy-dev.yml")
+        )
+        tools = list(loader.config.tools.values())
+
+        def time_copies(copier):
+            start = time.perf_counter()
+            for _ in range(200):
+                for tool in tools:
+                    copier(tool)
+            return time.perf_counter() - start
+
+        fast = time_copies(copy.deepcopy)
+        # pydantic's generic deepcopy, keeping the evaluator from being copied as entities did before
+        generic = time_copies(lambda tool: BaseModel.__deepcopy__(tool, {id(loader): loader}))
+        self.assertLess(fast, generic, f"Entity deepcopy took {fast:.3f}s vs generic deepcopy {generic:.3f}s")
+
+
+class TimedLock:
+    """
+    A lock that records how often it is acquired, and how long threads wait to acquire it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+        self.wait_time = 0.0
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self.lock.acquire()
+        self.acquisitions += 1
+        self.wait_time += time.perf_counter() - start
+        return self
+
+    def __exit__(self, *args):
+        self.lock.release()
+
+
+class TestMapperConcurrency(unittest.TestCase):
+
+    JOBS_PER_THREAD = 200
+
+    @staticmethod
+    def _map_jobs(galaxy_app, tools, user, num_jobs):
+        config = os.path.join(os.path.dirname(__file__), "fixtures/scenario-usegalaxy-dev.yml")
+        destinations = []
+        for i in range(num_jobs):
+            job = mock_galaxy.Job()
+            job.add_input_dataset(
+                mock_galaxy.DatasetAssociation("test", mock_galaxy.Dataset("test.txt", file_size=(i % 50) * 1024**3))
+            )
+            destination = gateway.map_tool_to_destination(
+                galaxy_app, job, tools[i % len(tools)], user, tpv_config_files=[config]
+            )
+            destinations.append((destination.id, destination.params.get("native_spec")))
+        return destinations
+
+    @pytest.mark.slow
+    def test_mapping_throughput_and_lock_contention_with_threads(self):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        tools = [
+            mock_galaxy.Tool(tool_id)
+            for tool_id in ["bwa", "toolshed.g2.bx.psu.edu/repos/iuc/hisat2/hisat2/2.1.0+galaxy7", "sometool"]
+        ]
+        user = mock_galaxy.User("ford", "prefect@vortex.org")
+        throughput = {}
+        lock_waits = {}
+        expected = None
+        for num_threads in [1, 2, 4, 8, 16]:
+            # every thread count starts without a mapper, so that all threads race to load it
+            gateway.ACTIVE_DESTINATION_MAPPERS.clear()
+            lock = TimedLock()
+            with (
+                mock.patch.object(gateway, "DESTINATION_MAPPER_LOCK", lock),
+                mock.patch.object(gateway, "load_destination_mapper", wraps=gateway.load_destination_mapper) as load,
+                ThreadPoolExecutor(num_threads) as pool,
+            ):
+                start = time.perf_counter()
+                futures = [
+                    pool.submit(self._map_jobs, galaxy_app, tools, user, self.JOBS_PER_THREAD)
+                    for _ in range(num_threads)
+                ]
+                results = [future.result() for future in futures]
+                elapsed = time.perf_counter() - start
+            throughput[num_threads] = round(num_threads * self.JOBS_PER_THREAD / elapsed)
+            lock_waits[num_threads] = (lock.acquisitions, round(lock.wait_time * 1000, 1))
+            expected = expected or results[0]
+            for result in results:
+                self.assertEqual(result, expected)
+            # the mapper is only loaded once, and the lock is only taken while it is loaded, and not for every job
+            self.assertEqual(load.call_count, 1)
+            self.assertLessEqual(lock.acquisitions, num_threads)
+        # wall-clock throughput varies too much between runs to assert on, so it is only reported
+        print(f"jobs/s by thread count: {throughput}, lock (acquisitions, ms waited): {lock_waits}")
@@ -0,0 +1,51 @@
+"""Unit tests for replaying historical jobs through TPV"""
+
+import os
+import unittest
+
+from tpv.commands.batch import read_job_specs
+from tpv.commands.replayer import LatencyHistogram, TPVJobReplayer
+
+
+class TestReplayer(unittest.TestCase):
+
+    def test_latency_histogram_percentiles(self):
+        histogram = LatencyHistogram()
+        for i in range(1, 101):
+            histogram.add(i / 1000)
+        summary = histogram.summary()
+        self.assertAlmostEqual(summary["mean"], 0.0505)
+        self.assertEqual(summary["max"], 0.1)
+        # percentiles are estimated to within a bucket width
+        self.assertAlmostEqual(summary["p50"], 0.05, delta=0.05 * 0.13)
+        self.assertAlmostEqual(summary["p90"], 0.09, delta=0.09 * 0.13)
+        self.assertLessEqual(summary["p99"], summary["max"])
+
+    def test_latency_histogram_empty(self):
+        self.assertEqual(LatencyHistogram().summary()["p99"], 0.0)
+
+    def test_replay_jobs(self):
+        job_conf = os.path.join(os.path.dirname(__file__), "fixtures/job_conf_dry_run.yml")
+        tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-rules.yml")
+        jobs = os.path.join(os.path.dirname(__file__), "fixtures/replay-jobs.jsonl")
+        stats = TPVJobReplayer.replay(job_conf, read_job_specs(jobs), tpv_confs=[tpv_config])
+        summary = stats.summary()
+        self.assertEqual(summary["jobs"], 4)
+        self.assertEqual(summary["destinations"], {"k8s_environment": 2, "local": 1})
+        self.assertEqual(summary["cores"], {4: 2, 2: 1})
+        self.assertEqual(summary["mem"], {16: 2, 6: 1})
+        self.assertEqual(summary["errors"], {"JobMappingException": 1})
+        self.assertGreater(summary["jobs_per_second"], 0)
+        self.assertIn("k8s_environment: 2 (50.0%)", stats.render())
+
+    def test_replay_job_with_datasets_and_version(self):
+        job_conf = os.path.join(os.path.dirname(__file__), "fixtures/job_conf_dry_run.yml")
+        tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-rules.yml")
+        jobs = os.path.join(os.path.dirname(__file__), "fixtures/replay-jobs.jsonl")
+        job_specs = list(read_job_specs(jobs))
+        replayer = TPVJobReplayer(job_conf, tpv_confs=[tpv_config])
+        user, tool, job = replayer.create_mock_objects(job_specs[3])
+        self.assertEqual(tool.version, "42")
+        self.assertEqual(job.param_values, {"mode": "fast"})
+        self.assertEqual(job.input_datasets[0].dataset.dataset.get_size(), 8 * 1024**3)
+        self.assertEqual(replayer.replay_job(job_specs[1])["destination"], "k8s_environment")
@@ -1,8 +1,10 @@
 import contextlib
 import io
+import json
 import os
 import re
 import sys
+import tempfile
 import unittest
 from collections import OrderedDict
 
@@ -42,7 +44,7 @@ class TPVShellTestCase(unittest.TestCase):
 
     def test_lint_no_errors_non_verbose(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/scenario-usegalaxy-dev.yml")
-        output = self.call_shell_command("tpv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "lint", "--no-cache", tpv_config)
         self.assertTrue(
             "lint successful" in output,
             f"Expected lint to be successful but output was: {output}",
@@ -50,7 +52,7 @@ class TPVShellTestCase(unittest.TestCase):
 
     def test_lint_no_errors_verbose(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/scenario-usegalaxy-dev.yml")
-        output = self.call_shell_command("tpv", "-vvvv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vvvv", "lint", "--no-cache", tpv_config)
         self.assertTrue(
             "lint successful" in output,
             f"Expected lint to be successful but output was: {output}",
@@ -58,7 +60,7 @@ class TPVShellTestCase(unittest.TestCase):
 
     def test_lint_nested_resubmit_handler(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-params-specific.yml")
-        output = self.call_shell_command("tpv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "lint", "--no-cache", tpv_config)
         self.assertTrue(
             "lint successful" in output,
             f"Expected nested resubmit handlers to lint successfully but output was: {output}",
@@ -66,13 +68,13 @@ class TPVShellTestCase(unittest.TestCase):
 
     def test_lint_syntax_error(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-syntax-error.yml")
-        output = self.call_shell_command("tpv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "lint", "--no-cache", tpv_config)
         self.assertTrue("lint failed" in output, f"Expected lint to fail but output was: {output}")
         self.assertTrue("oops syntax!" in output, f"Expected lint to fail but output was: {output}")
 
     def test_lint_invalid_regex(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/linter/linter-invalid-regex.yml")
-        output = self.call_shell_command("tpv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "lint", "--no-cache", tpv_config)
         self.assertTrue("lint failed" in output, f"Expected lint to fail but output was: {output}")
         self.assertTrue(
             "Failed to compile regex: bwa" in output,
@@ -81,7 +83,7 @@ class TPVShellTestCase(unittest.TestCase):
 
     def test_lint_no_runner_defined(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/linter/linter-no-runner-defined.yml")
-        output = self.call_shell_command("tpv", "-vv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", tpv_config)
         self.assertTrue("lint failed" in output, f"Expected lint to fail but output was: {output}")
         self.assertTrue(
             "Destination 'local'" in output,
@@ -99,7 +101,7 @@ class TPVShellTestCase(unittest.TestCase):
 
     def test_lint_destination_defines_cores_instead_of_accepted_cores(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/linter/linter-legacy-destinations.yml")
-        output = self.call_shell_command("tpv", "-vv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", tpv_config)
         self.assertTrue("lint failed" in output, f"Expected lint to fail but output was: {output}")
         self.assertTrue(
             "The destination named: local_with_mem" in output,
@@ -123,7 +125,7 @@ class TPVShellTestCase(unittest.TestCase):
             os.path.dirname(__file__),
             "fixtures/linter/linter-types-undefined-variable.yml",
         )
-        output = self.call_shell_command("tpv", "-vv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", tpv_config)
         self.assertTrue(
             'error: Name "something" is not defined' in output,
             f"Expected Name 'something' is not defined but output was: {output}",
@@ -142,7 +144,7 @@ class TPVShellTestCase(unittest.TestCase):
             os.path.dirname(__file__),
             "fixtures/linter/linter-types-undefined-variable.yml",
         )
-        output = self.call_shell_command("tpv", "-vv", "lint", tpv_config_parent, tpv_config_child)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", tpv_config_parent, tpv_config_child)
         self.assertTrue(
             'error: Name "something" is not defined' not in output,
             f"Expected Name 'something' is not defined but output was: {output}",
@@ -157,7 +159,7 @@ class TPVShellTestCase(unittest.TestCase):
             os.path.dirname(__file__),
             "fixtures/linter/linter-types-legacy-tags.yml",
         )
-        output = self.call_shell_command("tpv", "-vv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", tpv_config)
         self.assertTrue(
             'error: Module "tpv.core.entities" has no attribute "TagSetManager"' in output,
             f'Expected error: Module "tpv.core.entities" has no attribute "TagSetManager": {output}',
@@ -176,7 +178,7 @@ class TPVShellTestCase(unittest.TestCase):
             os.path.dirname(__file__),
             "fixtures/linter/linter-types-undefined-variable.yml",
         )
-        output = self.call_shell_command("tpv", "-vv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", tpv_config)
         pattern = r"T103: ([^:\s]+tmp[^:\s]*\.py):\d+: error:"
         match = re.search(pattern, output)
         self.assertTrue(
@@ -189,7 +191,7 @@ class TPVShellTestCase(unittest.TestCase):
             "expected temporary file to have been deleted",
         )
 
-        output = self.call_shell_command("tpv", "-vv", "lint", "--preserve-temp-code", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", "--preserve-temp-code", tpv_config)
         match = re.search(pattern, output)
         self.assertTrue(
             match and match.group(1),
@@ -210,7 +212,7 @@ class TPVShellTestCase(unittest.TestCase):
             os.path.dirname(__file__),
             "fixtures/linter/linter-types-context-vars.yml",
         )
-        output = self.call_shell_command("tpv", "-vv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", tpv_config)
         self.assertTrue(
             'error: Unsupported operand types for + ("int" and "str")' in output,
             'Expected Unsupported operand types for + ("int" and "str") due to '
@@ -244,7 +246,7 @@ class TPVShellTestCase(unittest.TestCase):
 
     def test_lint_types_silence_warnings(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/linter/linter-types-context-vars.yml")
-        output = self.call_shell_command("tpv", "-vv", "lint", "--ignore=T103", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", "--ignore=T103", tpv_config)
         self.assertTrue(
             "T103" not in output,
             f"Expected T103 errors to be suppressed but output was: {output}",
@@ -252,7 +254,7 @@ class TPVShellTestCase(unittest.TestCase):
 
     def test_lint_types_multiline_return(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/linter/linter-types-multiline-return.yml")
-        output = self.call_shell_command("tpv", "-vv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", tpv_config)
         self.assertFalse(
             "invalid syntax" in output,
             f"Expected invalid syntax errors to not be present but output was: {output}",
@@ -260,7 +262,7 @@ class TPVShellTestCase(unittest.TestCase):
 
     def test_lint_warnings(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/linter/linter-warnings.yml")
-        output = self.call_shell_command("tpv", "-vv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", tpv_config)
         self.assertTrue(
             "T102: The tool named: cores-no-mem-1 sets `cores`" in output,
             f"Expected T102 warning for cores-no-mem-1 but output was: {output}",
@@ -273,7 +275,7 @@ class TPVShellTestCase(unittest.TestCase):
             "T102: The tool named: cores-no-mem-3 sets `cores`" in output,
             f"T102 warning for cores-no-mem-3 should be suppressed by noqa but output was: {output}",
         )
-        output = self.call_shell_command("tpv", "-vv", "lint", "--ignore=T102", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", "--ignore=T102", tpv_config)
         self.assertFalse(
             "T102: The tool named:" in output,
             f"T102 warnings should be suppressed by --ignore but output was: {output}",
@@ -281,23 +283,45 @@ class TPVShellTestCase(unittest.TestCase):
 
     def test_lint_warn_unknown_fields(self):
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/linter/linter-warn-unknown-fields.yml")
-        output = self.call_shell_command("tpv", "-vv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", tpv_config)
         self.assertTrue(
             "T104: Unexpected field '.destinations.local.if'" in output,
             f"Expected T104 warning for incorrectly nested if in '.destinations.local.if' but output was: {output}",
         )
-        output = self.call_shell_command("tpv", "-vv", "lint", "--ignore=T104", tpv_config)
+        output = self.call_shell_command("tpv", "-vv", "lint", "--no-cache", "--ignore=T104", tpv_config)
         self.assertFalse(
             "T104: Unexpected field '.destinations.local.if'" in output,
             f"T104 warnings should be suppressed by --ignore but output was: {output}",
         )
 
+    def test_lint_manifest_report(self):
+        manifest = os.path.join(os.path.dirname(__file__), "fixtures/linter/linter-manifest.yml")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report_file = os.path.join(tmp_dir, "report.json")
+            output = self.call_shell_command(
+                "tpv", "lint", "--no-cache", "--manifest", manifest, "--workers", "2", "--report", report_file
+            )
+            with open(report_file) as f:
+                report = json.load(f)
+        self.assertIn("usegalaxy-dev: lint successful", output)
+        self.assertIn("invalid-regex: Failed to compile regex: bwa", output)
+        self.assertFalse(report["success"])
+        chains = {chain["name"]: chain for chain in report["chains"]}
+        self.assertEqual(list(chains), ["usegalaxy-dev", "invalid-regex", "unknown-fields"])
+        self.assertTrue(chains["usegalaxy-dev"]["success"])
+        self.assertEqual(chains["invalid-regex"]["errors"], ["Failed to compile regex: bwa[0-9]^++"])
+        self.assertEqual(len(chains["invalid-regex"]["config"]), 2)
+        self.assertTrue(chains["unknown-fields"]["success"])
+        self.assertIn("T104", [warning["code"] for warning in chains["unknown-fields"]["warnings"]])
+        for chain in report["chains"]:
+            self.assertEqual(set(chain["timings"]), {"load", "structural", "type_check", "total"})
+
     def test_warn_if_default_inherits_not_marked_abstract(self):
         tpv_config = os.path.join(
             os.path.dirname(__file__),
             "fixtures/linter/linter-default-inherits-marked-abstract.yml",
         )
-        output = self.call_shell_command("tpv", "-vvvv", "lint", tpv_config)
+        output = self.call_shell_command("tpv", "-vvvv", "lint", "--no-cache", tpv_config)
         self.assertTrue(
             "WARNING" in output and "The tool named: default is marked globally as" in output,
             f"Expected a warning when the default abstract class for a tool is not marked abstract but output "
@@ -661,6 +685,82 @@ class TPVShellTestCase(unittest.TestCase):
             f"Expected 'id: magrathea' destination\n{output}",
         )
 
+    @staticmethod
+    def _batch_results(output):
+        return [json.loads(line) for line in output.splitlines() if line.startswith("{")]
+
+    def test_dry_run_batch_jsonl(self):
+        job_config = os.path.join(os.path.dirname(__file__), "fixtures/job_conf_dry_run.yml")
+        batch = os.path.join(os.path.dirname(__file__), "fixtures/dry-run-batch.jsonl")
+        tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-basic.yml")
+        output = self.call_shell_command("tpv", "dry-run", "--job-conf", job_config, "--batch", batch, tpv_config)
+        results = self._batch_results(output)
+        self.assertEqual(
+            [r["tool"] for r in results], ["sometool", "bwa", "unschedulable_tool", "regex_tool/hoopy_frood"]
+        )
+        self.assertEqual(results[0]["destination"], "local")
+        self.assertEqual(results[1]["destination"], "k8s_environment")
+        self.assertEqual(results[1]["user"], "fairycake@vortex.org")
+        self.assertIn("JobMappingException", results[2]["error"])
+        self.assertEqual(results[3]["destination"], "k8s_environment")
+
+    def test_dry_run_batch_csv_with_workers(self):
+        job_config = os.path.join(os.path.dirname(__file__), "fixtures/job_conf_dry_run.yml")
+        batch = os.path.join(os.path.dirname(__file__), "fixtures/dry-run-batch.csv")
+        tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-basic.yml")
+        output = self.call_shell_command(
+            "tpv", "dry-run", "--job-conf", job_config, "--batch", batch, "--workers", "2", "--explain", tpv_config
+        )
+        results = self._batch_results(output)
+        self.assertEqual([r.get("destination") for r in results], ["local", "k8s_environment", None, "k8s_environment"])
+        self.assertIn("TPV SCHEDULING DECISION TRACE", results[0]["explain"])
+
+    def test_replay(self):
+        job_config = os.path.join(os.path.dirname(__file__), "fixtures/job_conf_dry_run.yml")
+        jobs = os.path.join(os.path.dirname(__file__), "fixtures/replay-jobs.jsonl")
+        tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-rules.yml")
+        output = self.call_shell_command(
+            "tpv",
+            "replay",
+            "--job-conf",
+            job_config,
+            "--jobs",
+            jobs,
+            "--workers",
+            "2",
+            "--output-format",
+            "yaml",
+            tpv_config,
+        )
+        summary = yaml.safe_load(output[output.index("cores:") :])
+        self.assertEqual(summary["jobs"], 4)
+        self.assertEqual(summary["destinations"], {"k8s_environment": 2, "local": 1})
+        self.assertEqual(summary["errors"], {"JobMappingException": 1})
+
+    def test_diff_decisions(self):
+        jobs = os.path.join(os.path.dirname(__file__), "fixtures/replay-jobs.jsonl")
+        tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-rules.yml")
+        tpv_config_new = os.path.join(os.path.dirname(__file__), "fixtures/mapping-rules-user-priority.yml")
+        output = self.call_shell_command(
+            "tpv",
+            "diff-decisions",
+            "--old",
+            tpv_config,
+            "--new",
+            tpv_config,
+            tpv_config_new,
+            "--jobs",
+            jobs,
+            "--workers",
+            "2",
+        )
+        self.assertIn("3 of 4 jobs changed", output)
+        self.assertIn("Tool: bwa (2 of 2 jobs changed)", output)
+        output = self.call_shell_command(
+            "tpv", "diff-decisions", "--old", tpv_config, "--new", tpv_config, "--jobs", jobs
+        )
+        self.assertIn("0 of 4 jobs changed", output)
+
     def test_dry_run_with_explain_flag(self):
         job_config = os.path.join(os.path.dirname(__file__), "fixtures/job_conf_dry_run.yml")
         tpv_config = os.path.join(os.path.dirname(__file__), "fixtures/mapping-rules.yml")
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from tpv.commands.test import mock_galaxy
+from tpv.core.entities import LazyEntities
+from tpv.core.snapshot import ConfigSnapshot, load_config_snapshot, snapshot_key
+from tpv.rules import gateway
+
+
+class TestConfigSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.snapshot_file = os.path.join(self.tmp_dir, "tpv.snapshot")
+        self.tpv_config = os.path.join(self.tmp_dir, "mapping-rules.yml")
+        shutil.copy(os.path.join(os.path.dirname(__file__), "fixtures/mapping-rules.yml"), self.tpv_config)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _map_to_destination(self, tool_id, snapshot_file=None):
+        galaxy_app = mock_galaxy.App(job_conf=os.path.join(os.path.dirname(__file__), "fixtures/job_conf.yml"))
+        job = mock_galaxy.Job()
+        job.add_input_dataset(
+            mock_galaxy.DatasetAssociation("test", mock_galaxy.Dataset("test.txt", file_size=5 * 1024**3))
+        )
+        user = mock_galaxy.User("gargravarr", "fairycake@vortex.org")
+        gateway.ACTIVE_DESTINATION_MAPPERS = {}
+        return gateway.map_tool_to_destination(
+            galaxy_app,
+            job,
+            mock_galaxy.Tool(tool_id),
+            user,
+            tpv_config_files=[self.tpv_config],
+            tpv_snapshot_file=snapshot_file,
+        )
+
+    def test_map_from_snapshot(self):
+        expected = self._map_to_destination("bwa")
+        destination = self._map_to_destination("bwa", snapshot_file=self.snapshot_file)
+        self.assertEqual(destination.id, expected.id)
+        self.assertEqual(destination.params, expected.params)
+        self.assertEqual(destination.env, expected.env)
+        self.assertTrue(os.path.exists(self.snapshot_file))
+
+    def test_entities_are_materialized_lazily(self):
+        self._map_to_destination("bwa", snapshot_file=self.snapshot_file)
+        tools = gateway.ACTIVE_DESTINATION_MAPPERS["tpv_dispatcher"].config.tools
+        self.assertIsInstance(tools, LazyEntities)
+        # only the default tool and bwa were needed to map the job
+        self.assertEqual(tools.materialized, 2)
+        self.assertGreater(len(tools), 2)
+
+    def test_snapshot_is_reused_until_config_changes(self):
+        load_config = mock.Mock(side_effect=lambda: gateway.load_config_chain([self.tpv_config]))
+        load_config_snapshot(self.snapshot_file, [self.tpv_config], load_config)
+        loader = load_config_snapshot(self.snapshot_file, [self.tpv_config], load_config)
+        self.assertEqual(load_config.call_count, 1)
+        self.assertIn("bwa", loader.config.tools)
+
+        with open(self.tpv_config, "a") as f:
+            f.write("\n# a change\n")
+        load_config_snapshot(self.snapshot_file, [self.tpv_config], load_config)
+        self.assertEqual(load_config.call_count, 2)
+
+    def test_snapshot_key_changes_with_remote_config_content(self):
+        url = "https://example.org/tpv/tools.yml"
+        with mock.patch("tpv.core.snapshot.requests.get") as get:
+            get.return_value.__enter__.return_value.content = b"tools: {}"
+            key = snapshot_key([url, self.tpv_config])
+            self.assertEqual(snapshot_key([url, self.tpv_config]), key)
+            get.return_value.__enter__.return_value.content = b"tools: {bwa: {cores: 2}}"
+            self.assertNotEqual(snapshot_key([url, self.tpv_config]), key)
+
+    def test_invalid_snapshot_is_rewritten(self):
+        with open(self.snapshot_file, "wb") as f:
+            f.write(b"not a snapshot")
+        self.assertIsNone(ConfigSnapshot.open_if_current(self.snapshot_file, "any"))
+        loader = load_config_snapshot(
+            self.snapshot_file, [self.tpv_config], lambda: gateway.load_config_chain([self.tpv_config])
+        )
+        self.assertEqual(loader.config.tools["bwa"].id, "bwa")
@@ -0,0 +1,129 @@
+import csv
+import functools
+import json
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+# the number of jobs queued per worker process, which bounds memory use for arbitrarily long job files
+JOBS_IN_FLIGHT_PER_WORKER = 16
+
+# the per process state of a worker in a batch pool, such as a loaded mapper
+_WORKER_STATE: Any = None
+
+
+def _as_list(value: Any) -> list[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        # csv cells hold lists as comma separated values
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return [str(v) for v in value]
+
+
+@dataclass
+class DatasetSpec:
+    """
+    An input dataset of a job, with its size in bytes.
+    """
+
+    name: str = "input"
+    size: int = 0
+    extension: str = "txt"
+    object_store_id: str | None = None
+
+    @staticmethod
+    def from_row(row: Mapping[str, Any]) -> "DatasetSpec":
+        return DatasetSpec(
+            name=row.get("name") or "input",
+            size=int(row.get("size") or 0),
+            extension=row.get("extension") or "txt",
+            object_store_id=row.get("object_store_id"),
+        )
+
+
+@dataclass
+class JobSpec:
+    """
+    A job to be mapped, as read from a row of a batch file. Fields mirror the dry-run command line arguments, with
+    the remaining fields describing historical jobs in more detail.
+    """
+
+    tool: str = "_default_"
+    user: str | None = None
+    roles: list[str] = field(default_factory=list)
+    history_tags: list[str] = field(default_factory=list)
+    input_size: float | None = None
+    tool_version: str | None = None
+    datasets: list[DatasetSpec] = field(default_factory=list)
+    params: dict[str, Any] = field(default_factory=dict)
+
+    @staticmethod
+    def from_row(row: Mapping[str, Any]) -> "JobSpec":
+        input_size = row.get("input_size")
+        datasets = row.get("datasets") or []
+        params = row.get("params") or {}
+        return JobSpec(
+            tool=row.get("tool") or "_default_",
+            user=row.get("user") or None,
+            roles=_as_list(row.get("roles")),
+            history_tags=_as_list(row.get("history_tags")),
+            input_size=float(input_size) if input_size not in (None, "") else None,
+            tool_version=row.get("tool_version") or None,
+            # csv cells hold nested values as json
+            datasets=[
+                DatasetSpec.from_row(d) for d in (json.loads(datasets) if isinstance(datasets, str) else datasets)
+            ],
+            params=json.loads(params) if isinstance(params, str) else params,
+        )
+
+
+def read_job_specs(path: str) -> Iterator[JobSpec]:
+    """
+    Stream the jobs in a .csv or .jsonl file, one row at a time.
+    """
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                yield JobSpec.from_row(row)
+    elif path.endswith(".jsonl"):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield JobSpec.from_row(json.loads(line))
+    else:
+        raise ValueError(f"Unsupported batch file: {path}. Expected a .csv or .jsonl file.")
+
+
+def _init_worker(factory: Callable[[], Any]) -> None:
+    global _WORKER_STATE
+    _WORKER_STATE = factory()
+
+
+def _call_worker(method: str, item: Any, **kwargs: Any) -> Any:
+    return getattr(_WORKER_STATE, method)(item, **kwargs)
+
+
+def map_in_workers(
+    factory: Callable[[], Any], method: str, items: Iterable[Any], workers: int = 1, **kwargs: Any
+) -> Iterator[Any]:
+    """
+    Call `method` on the object created by `factory` for each item, yielding results in input order. The factory
+    is called once per worker process, so that expensive state such as a loaded mapper is only built once per
+    worker. It must therefore be picklable when more than one worker is used. Only a bounded number of items are
+    queued at a time, so that items and results are streamed.
+    """
+    if workers <= 1:
+        yield from map(functools.partial(getattr(factory(), method), **kwargs), items)
+        return
+    func = functools.partial(_call_worker, method, **kwargs)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(factory,)) as executor:
+        pending: deque[Future[Any]] = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= workers * JOBS_IN_FLIGHT_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
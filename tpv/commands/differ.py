@@ -0,0 +1,136 @@
+import functools
+from collections import Counter, defaultdict
+from collections.abc import Iterable
+from typing import Any
+
+from tpv.core.explain import ExplainCollector
+from tpv.core.mapper import EntityToDestinationMapper
+from tpv.rules import gateway
+
+from .batch import JobSpec, map_in_workers
+from .dryrunner import TPVBatchDryRunner
+from .test import mock_galaxy
+
+# the parts of a mapping decision that are compared between configs
+DECISION_FIELDS = ["destination", "cores", "mem", "gpus", "params", "error"]
+
+
+class DecisionDiff:
+    """
+    Collects the jobs whose mapping decision differs between two configs, grouped by tool.
+    """
+
+    def __init__(self) -> None:
+        self.jobs_by_tool: Counter[str] = Counter()
+        self.changes_by_tool: dict[str, list[dict[str, Any]]] = defaultdict(list)
+
+    def add(self, job_number: int, result: dict[str, Any]) -> None:
+        self.jobs_by_tool[result["tool"]] += 1
+        if result.get("changes"):
+            self.changes_by_tool[result["tool"]].append({"job": job_number, **result})
+
+    @property
+    def changed(self) -> int:
+        return sum(len(changes) for changes in self.changes_by_tool.values())
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "jobs": sum(self.jobs_by_tool.values()),
+            "changed": self.changed,
+            "tools": {
+                tool: {
+                    "jobs": self.jobs_by_tool[tool],
+                    "changed": [{key: value for key, value in job.items() if key != "tool"} for job in changes],
+                }
+                for tool, changes in sorted(self.changes_by_tool.items())
+            },
+        }
+
+    def render(self) -> str:
+        lines = [f"{self.changed} of {sum(self.jobs_by_tool.values())} jobs changed"]
+        for tool, changes in sorted(self.changes_by_tool.items()):
+            lines.append(f"Tool: {tool} ({len(changes)} of {self.jobs_by_tool[tool]} jobs changed)")
+            for job in changes:
+                lines.append(f"  job {job['job']} (user: {job['user']}):")
+                for field, change in job["changes"].items():
+                    lines.append(f"    {field}: {change['old']} -> {change['new']}")
+                for config, trace in job.get("explain", {}).items():
+                    lines.append(f"    {config} config trace:")
+                    lines.extend(f"      {line}" for line in trace.splitlines())
+        return "\n".join(lines) + "\n"
+
+
+class TPVDecisionDiffer:
+    """
+    Maps jobs against two config chains, and reports the jobs whose mapping decision differs.
+    """
+
+    def __init__(self, old_confs: list[str], new_confs: list[str], job_conf: str | None = None):
+        self.galaxy_app = mock_galaxy.App(job_conf=job_conf, create_model=True)
+        self.old_mapper = gateway.load_destination_mapper(old_confs)
+        self.new_mapper = gateway.load_destination_mapper(new_confs)
+
+    def _decide(
+        self, mapper: EntityToDestinationMapper, job_spec: JobSpec, collector: ExplainCollector | None = None
+    ) -> dict[str, Any]:
+        # mock objects are created afresh for each mapping, so that one config can't affect the other's decision
+        user, tool, job = TPVBatchDryRunner.create_mock_objects(job_spec)
+        try:
+            destination = mapper.map_to_tpv_destination(
+                self.galaxy_app,  # type: ignore[arg-type]
+                tool,  # type: ignore[arg-type]
+                user,  # type: ignore[arg-type]
+                job,  # type: ignore[arg-type]
+                explain_collector=collector,
+            )
+            return {
+                "destination": destination.dest_name,
+                "cores": destination.cores,
+                "mem": destination.mem,
+                "gpus": destination.gpus,
+                "params": destination.params or {},
+                "error": None,
+            }
+        except Exception as e:
+            return {field: None for field in DECISION_FIELDS} | {"error": f"{type(e).__name__}: {e}"}
+
+    def diff_job(self, job_spec: JobSpec, explain: bool = False) -> dict[str, Any]:
+        old = self._decide(self.old_mapper, job_spec)
+        new = self._decide(self.new_mapper, job_spec)
+        result: dict[str, Any] = {
+            "tool": job_spec.tool,
+            "user": job_spec.user,
+            "changes": {
+                field: {"old": old[field], "new": new[field]} for field in DECISION_FIELDS if old[field] != new[field]
+            },
+        }
+        if result["changes"] and explain:
+            # explaining is comparatively slow, so jobs are only mapped again with a trace if their decision changed
+            traces = {}
+            for config, mapper in [("old", self.old_mapper), ("new", self.new_mapper)]:
+                collector = ExplainCollector()
+                self._decide(mapper, job_spec, collector)
+                traces[config] = collector.render()
+            result["explain"] = traces
+        return result
+
+    @staticmethod
+    def diff(
+        old_confs: list[str],
+        new_confs: list[str],
+        job_specs: Iterable[JobSpec],
+        job_conf: str | None = None,
+        explain: bool = False,
+        workers: int = 1,
+    ) -> DecisionDiff:
+        decision_diff = DecisionDiff()
+        results = map_in_workers(
+            functools.partial(TPVDecisionDiffer, old_confs, new_confs, job_conf),
+            "diff_job",
+            job_specs,
+            workers,
+            explain=explain,
+        )
+        for job_number, result in enumerate(results, start=1):
+            decision_diff.add(job_number, result)
+        return decision_diff
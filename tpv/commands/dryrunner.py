@@ -1,10 +1,14 @@
+import functools
 import os
+from collections.abc import Iterable, Iterator
+from typing import Any
 
 from galaxy.jobs import JobDestination
 
 from tpv.core.explain import ExplainCollector
 from tpv.rules import gateway
 
+from .batch import DatasetSpec, JobSpec, map_in_workers
 from .test import mock_galaxy
 
 
@@ -61,15 +65,16 @@ class TPVDryRunner:
         return destination, collector
 
     @staticmethod
-    def from_params(
-        job_conf: str,
+    def create_mock_objects(
         user_email: str | None = None,
         tool_id: str | None = None,
         roles: list[str] | None = None,
         history_tags: list[str] | None = None,
-        tpv_confs: list[str] | None = None,
-        input_size: int | None = None,
-    ) -> "TPVDryRunner":
+        input_size: float | None = None,
+        tool_version: str | None = None,
+        datasets: list[DatasetSpec] | None = None,
+        params: dict[str, Any] | None = None,
+    ) -> tuple[mock_galaxy.User | None, mock_galaxy.Tool | None, mock_galaxy.Job]:
         if user_email is not None:
             user = mock_galaxy.User(username="gargravarr", email=user_email)
         else:
@@ -83,7 +88,7 @@ class TPVDryRunner:
         if tool_id:
             tool = mock_galaxy.Tool(
                 tool_id,
-                version=tool_id.split("/")[-1] if "/" in tool_id else None,
+                version=tool_version or (tool_id.split("/")[-1] if "/" in tool_id else None),
             )
         else:
             tool = None
@@ -91,10 +96,108 @@ class TPVDryRunner:
         job = mock_galaxy.Job()
         if input_size:
             dataset = mock_galaxy.DatasetAssociation(
-                "test", mock_galaxy.Dataset("test.txt", file_size=input_size * 1024**3)
+                "test", mock_galaxy.Dataset("test.txt", file_size=int(input_size * 1024**3))
             )
             job.add_input_dataset(dataset)
+        for dataset_spec in datasets or []:
+            job.add_input_dataset(
+                mock_galaxy.DatasetAssociation(
+                    dataset_spec.name,
+                    mock_galaxy.Dataset(
+                        dataset_spec.name, file_size=dataset_spec.size, object_store_id=dataset_spec.object_store_id
+                    ),
+                    extension=dataset_spec.extension,
+                )
+            )
+        if params:
+            job.param_values = params
         job.history = mock_galaxy.History()
         if history_tags:
             job.history.tags = [mock_galaxy.HistoryTag(tag_name) for tag_name in history_tags]
+        return user, tool, job
+
+    @staticmethod
+    def from_params(
+        job_conf: str,
+        user_email: str | None = None,
+        tool_id: str | None = None,
+        roles: list[str] | None = None,
+        history_tags: list[str] | None = None,
+        tpv_confs: list[str] | None = None,
+        input_size: int | None = None,
+    ) -> "TPVDryRunner":
+        user, tool, job = TPVDryRunner.create_mock_objects(user_email, tool_id, roles, history_tags, input_size)
         return TPVDryRunner(job_conf=job_conf, tpv_confs=tpv_confs, user=user, tool=tool, job=job)
+
+
+class TPVBatchDryRunner:
+    """
+    Maps many jobs against a single Galaxy app and destination mapper, which are only loaded once.
+    """
+
+    def __init__(self, job_conf: str, tpv_confs: list[str] | None = None):
+        self.galaxy_app = mock_galaxy.App(job_conf=job_conf, create_model=True)
+        if tpv_confs:
+            self.tpv_config_files = tpv_confs
+        else:
+            tpv_config_list: list[str] = self.galaxy_app.job_config.get_destination("tpv_dispatcher").params[
+                "tpv_config_files"
+            ]
+            self.tpv_config_files = TPVDryRunner.resolve_relative_config_paths(tpv_config_list, job_conf)
+        self.mapper = gateway.load_destination_mapper(self.tpv_config_files)
+
+    @staticmethod
+    def create_mock_objects(
+        job_spec: JobSpec,
+    ) -> tuple[mock_galaxy.User | None, mock_galaxy.Tool | None, mock_galaxy.Job]:
+        return TPVDryRunner.create_mock_objects(
+            job_spec.user,
+            job_spec.tool,
+            job_spec.roles,
+            job_spec.history_tags,
+            job_spec.input_size,
+            job_spec.tool_version,
+            job_spec.datasets,
+            job_spec.params,
+        )
+
+    def map_job(self, job_spec: JobSpec, explain: bool = False) -> dict[str, Any]:
+        user, tool, job = self.create_mock_objects(job_spec)
+        collector = ExplainCollector() if explain else None
+        result: dict[str, Any] = {"tool": job_spec.tool, "user": job_spec.user}
+        try:
+            destination = self.mapper.map_to_tpv_destination(
+                self.galaxy_app,  # type: ignore[arg-type]
+                tool,  # type: ignore[arg-type]
+                user,  # type: ignore[arg-type]
+                job,  # type: ignore[arg-type]
+                explain_collector=collector,
+            )
+            result.update(
+                {
+                    "destination": destination.dest_name,
+                    "runner": destination.runner,
+                    "cores": destination.cores,
+                    "mem": destination.mem,
+                    "gpus": destination.gpus,
+                    "params": destination.params or {},
+                    "env": destination.env or [],
+                }
+            )
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        if collector:
+            result["explain"] = collector.render()
+        return result
+
+    @staticmethod
+    def run_batch(
+        job_conf: str,
+        job_specs: Iterable[JobSpec],
+        tpv_confs: list[str] | None = None,
+        explain: bool = False,
+        workers: int = 1,
+    ) -> Iterator[dict[str, Any]]:
+        return map_in_workers(
+            functools.partial(TPVBatchDryRunner, job_conf, tpv_confs), "map_job", job_specs, workers, explain=explain
+        )
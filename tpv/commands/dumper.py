@@ -42,6 +42,12 @@ class TPVConfigDumper:
         gc = config.global_config
         if gc.default_inherits:
             buf.write(f"  default_inherits: {gc.default_inherits}\n")
+        if gc.concurrent_destinations:
+            buf.write(f"  concurrent_destinations: {gc.concurrent_destinations}\n")
+        if gc.deferral_ttl:
+            buf.write(f"  deferral_ttl: {gc.deferral_ttl}\n")
+        if gc.capacity_feed:
+            buf.write(f"  capacity_feed: {gc.capacity_feed}\n")
         if gc.context:
             buf.write("  context:\n")
             for k, v in gc.context.items():
@@ -1,8 +1,12 @@
 import logging
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Any
 
 from pydantic import BaseModel
+from ruamel.yaml import YAML
 
 from tpv.commands import mypychecker
 from tpv.core.entities import Entity
@@ -24,15 +28,26 @@ class TPVLintError(Exception):
 
 class TPVConfigLinter(object):
 
-    def __init__(self, url_or_path: list[str], ignore: list[str] | None, preserve_temp_code: bool):
+    def __init__(
+        self,
+        url_or_path: list[str],
+        ignore: list[str] | None,
+        preserve_temp_code: bool,
+        cache_dir: str | None = None,
+        cache_name: str | None = None,
+    ):
         self.url_or_path: list[str] = url_or_path
         self.ignore: list[str] = ignore or []
         self.preserve_temp_code = preserve_temp_code
+        self.cache_dir = cache_dir
+        self.cache_name = cache_name
         self.warnings: list[tuple[str, str]] = []
         self.errors: list[str | tuple[str, str]] = []
         self.loader: TPVConfigLoader | None = None
+        self.timings: dict[str, float] = {}
 
     def load_config(self) -> None:
+        start = time.perf_counter()
         loader = None
         for tpv_config in self.url_or_path:
             try:
@@ -41,6 +56,7 @@ class TPVConfigLinter(object):
             except Exception as e:
                 log.error(f"Linting failed due to syntax errors in yaml file: {e}")
                 raise TPVLintError("Linting failed due to syntax errors in yaml file: ") from e
+        self.timings["load"] = time.perf_counter() - start
 
     def add_warning(self, code: str, message: str) -> None:
         if code not in self.ignore:
@@ -51,14 +67,30 @@ class TPVConfigLinter(object):
             self.add_warning(code, message)
 
     def lint(self) -> None:
+        self.run_checks()
+        if self.loader is not None:
+            self.print_errors_and_warnings()
+
+    def run_checks(self) -> None:
+        """
+        Run all checks, recording errors and warnings without reporting them. Type checking is by far the slowest
+        check, so the structural checks run while mypy type checks the code in a separate thread.
+        """
         if self.loader is None:
             self.load_config()
         if self.loader is not None:  # satisfy mypy
-            self.lint_extra_fields(self.loader)
-            self.lint_code(self.loader)
-            self.lint_tools(self.loader)
-            self.lint_destinations(self.loader)
-            self.print_errors_and_warnings()
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                type_check = executor.submit(self.type_check, self.loader)
+                start = time.perf_counter()
+                self.lint_extra_fields(self.loader)
+                # type check warnings are recorded in between, so that warnings are reported in the same order as
+                # when the checks run sequentially
+                index = len(self.warnings)
+                self.lint_tools(self.loader)
+                self.lint_destinations(self.loader)
+                self.timings["structural"] = time.perf_counter() - start
+                code_warnings, self.timings["type_check"] = type_check.result()
+            self.warnings[index:index] = code_warnings
 
     def lint_extra_fields(self, loader: TPVConfigLoader) -> None:
         self.check_for_extra_fields_recurse(loader.config, "")
@@ -97,10 +129,21 @@ class TPVConfigLinter(object):
         Gather code blocks from the loader, render them into a .py file with Jinja2,
         run mypy, record errors if any.
         """
-        exit_code, errors, _ = mypychecker.type_check_code(loader, self.preserve_temp_code)
-        if exit_code != 0:
-            for err in errors:
-                self.add_warning("T103", err)
+        code_warnings, _ = self.type_check(loader)
+        self.warnings.extend(code_warnings)
+
+    def type_check(self, loader: TPVConfigLoader) -> tuple[list[tuple[str, str]], float]:
+        """
+        Type check the code blocks, returning the resulting warnings and the time taken.
+        """
+        start = time.perf_counter()
+        exit_code, errors, _ = mypychecker.type_check_code(
+            loader, self.preserve_temp_code, self.cache_dir, self.cache_name
+        )
+        code_warnings = []
+        if exit_code != 0 and "T103" not in self.ignore:
+            code_warnings = [("T103", err) for err in errors]
+        return code_warnings, time.perf_counter() - start
 
     def lint_tools(self, loader: TPVConfigLoader) -> None:
         default_inherits = loader.config.global_config.default_inherits
@@ -167,5 +210,85 @@ class TPVConfigLinter(object):
         url_or_path: list[str],
         ignore: list[str] | None = None,
         preserve_temp_code: bool = False,
+        cache_dir: str | None = None,
+        cache_name: str | None = None,
     ) -> "TPVConfigLinter":
-        return TPVConfigLinter(url_or_path, ignore=ignore, preserve_temp_code=preserve_temp_code)
+        return TPVConfigLinter(
+            url_or_path,
+            ignore=ignore,
+            preserve_temp_code=preserve_temp_code,
+            cache_dir=cache_dir,
+            cache_name=cache_name,
+        )
+
+    @staticmethod
+    def lint_chain(
+        name: str,
+        url_or_path: list[str],
+        ignore: list[str] | None = None,
+        cache_dir: str | None = None,
+    ) -> dict[str, Any]:
+        """
+        Lint a single config chain, returning its errors, warnings and timings as a report entry.
+        """
+        start = time.perf_counter()
+        # chains may be linted concurrently, so each is given its own mypy cache
+        linter = TPVConfigLinter.from_url_or_path(url_or_path, ignore=ignore, cache_dir=cache_dir, cache_name=name)
+        try:
+            linter.run_checks()
+        except TPVLintError as e:
+            linter.errors.append(f"{e}{e.__cause__}")
+        linter.timings["total"] = time.perf_counter() - start
+        return {
+            "name": name,
+            "config": url_or_path,
+            "success": not linter.errors,
+            "errors": linter.errors,
+            "warnings": [{"code": code, "message": message} for code, message in linter.warnings],
+            "timings": linter.timings,
+        }
+
+    @staticmethod
+    def lint_chains(
+        chains: dict[str, list[str]],
+        ignore: list[str] | None = None,
+        cache_dir: str | None = None,
+        workers: int = 1,
+    ) -> dict[str, Any]:
+        """
+        Lint independent config chains, each in its own worker process, and merge the results into one report.
+        """
+        start = time.perf_counter()
+        if workers <= 1:
+            results = [TPVConfigLinter.lint_chain(name, files, ignore, cache_dir) for name, files in chains.items()]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(TPVConfigLinter.lint_chain, name, files, ignore, cache_dir)
+                    for name, files in chains.items()
+                ]
+                results = [future.result() for future in futures]
+        return {
+            "success": all(result["success"] for result in results),
+            "elapsed_seconds": time.perf_counter() - start,
+            "chains": results,
+        }
+
+
+def read_lint_manifest(path: str) -> dict[str, list[str]]:
+    """
+    Read a manifest of config chains to lint, which maps each chain's name to its ordered list of config files.
+    Relative paths are resolved relative to the manifest's directory.
+    """
+    with open(path) as f:
+        manifest = YAML(typ="safe", pure=True).load(f)
+    if not isinstance(manifest, dict):
+        raise ValueError(f"Invalid lint manifest: {path}. Expected a mapping of chain names to config files.")
+    manifest_dir = os.path.dirname(os.path.abspath(path))
+    chains = {}
+    for name, files in manifest.items():
+        chains[str(name)] = [
+            file if os.path.isabs(file) or "://" in file else os.path.join(manifest_dir, file)
+            for file in ([files] if isinstance(files, str) else files)
+        ]
+    return chains
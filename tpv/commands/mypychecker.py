@@ -1,5 +1,8 @@
 import ast
+import fcntl
+import hashlib
 import inspect
+import json
 import logging
 import os
 import re
@@ -8,14 +11,21 @@ import textwrap
 from typing import Annotated, Any, get_args, get_origin
 
 import mypy.api
-from jinja2 import Environment, FileSystemLoader
+import mypy.version
+from jinja2 import Environment, FileSystemLoader, Template
 from pydantic.fields import FieldInfo
 
+from tpv import get_version
 from tpv.core.entities import Entity, TPVFieldMetadata
 from tpv.core.loader import TPVConfigLoader
 
 log = logging.getLogger(__name__)
 
+# e.g. /tmp/tmpxyz.py:12: error: Name "mem2" is not defined  [name-defined]
+MYPY_MESSAGE_RE = re.compile(r"^(?P<path>.+?):(?P<line>\d+): (?P<message>.*)$")
+# matches errors only, not notes such as /tmp/tmpxyz.py:12: note: Revealed type is "builtins.int"
+MYPY_ERROR_RE = re.compile(r"^.+?:\d+: error: ")
+
 
 # Optional mapping for known "weird" but serializable types
 SERIALIZABLE_TYPE_MAP = {
@@ -214,11 +224,172 @@ def gather_fields_from_entity(
     return code_snippets
 
 
-def type_check_code(loader: TPVConfigLoader, preserve_temp_code: bool) -> tuple[int, list[str], str]:
+class TypeCheckCache:
+    """
+    Persists the mypy messages of each code block across lint runs, keyed by a hash of everything that can affect
+    them, so that only new or changed code blocks need to be type checked. Also holds mypy's own incremental cache,
+    so that the modules imported by the type checked code are not re-analyzed on every run. Lint runs that may run
+    concurrently, such as the chains of a manifest, must each be given a name, so that they use separate mypy caches,
+    which mypy does not support sharing.
+    """
+
+    MAX_ENTRIES = 10000
+
+    def __init__(self, cache_dir: str, name: str | None = None):
+        self.cache_dir = cache_dir
+        self.mypy_cache_dir = (
+            os.path.join(cache_dir, "mypy", slugify(name)) if name else os.path.join(cache_dir, "mypy")
+        )
+        self.path = os.path.join(cache_dir, "type_check_cache.json")
+        # fail early if the cache can't be written, since mypy would otherwise fail while type checking
+        os.makedirs(self.mypy_cache_dir, exist_ok=True)
+        tempfile.TemporaryFile(dir=self.mypy_cache_dir).close()
+        self.entries = self.read()
+
+    def read(self) -> dict[str, list[tuple[int, str]]]:
+        try:
+            with open(self.path) as f:
+                return {key: [(offset, message) for offset, message in value] for key, value in json.load(f)}
+        except (OSError, ValueError, TypeError):
+            # a missing or corrupt cache is simply rebuilt
+            return {}
+
+    @staticmethod
+    def key(context_vars: dict[str, str], code_block: dict[str, str] | None = None) -> str:
+        """
+        The key of a code block, or of the code preceding the code blocks if no code block is given.
+        """
+        # the declared types of user defined context variables affect type checking too, as does the working
+        # directory, from which mypy resolves imports
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    code_block["code"] if code_block else None,
+                    code_block["return_type"] if code_block else None,
+                    context_vars,
+                    get_version(),
+                    mypy.version.__version__,
+                    os.getcwd(),
+                ],
+                sort_keys=True,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def save(self) -> None:
+        try:
+            with open(f"{self.path}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # keep the entries that concurrent lint runs saved since this cache was read
+                    self.entries = {**self.read(), **self.entries}
+                    # drop the least recently added entries
+                    entries = list(self.entries.items())[-self.MAX_ENTRIES :]
+                    with tempfile.NamedTemporaryFile("w", dir=self.cache_dir, delete=False) as f:
+                        json.dump(entries, f)
+                    os.replace(f.name, self.path)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except OSError:
+            log.warning(f"Failed to save type checking results to: {self.path}", exc_info=True)
+
+
+def get_type_check_template() -> Template:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    env = Environment(loader=FileSystemLoader(current_dir))
+    env.filters["returnify"] = add_return_to_last_expr
+    return env.get_template("type_check_template.j2")
+
+
+def get_function_line_ranges(code: str) -> list[tuple[int, int]] | None:
+    """
+    Returns the first and last line of each top level function in code, or None if the code does not parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    return [(node.lineno, node.end_lineno or node.lineno) for node in tree.body if isinstance(node, ast.FunctionDef)]
+
+
+def run_mypy(filename: str, cache_dir: str | None = None) -> tuple[int, list[str]]:
+    mypy_args = [filename]
+    if cache_dir:
+        mypy_args = ["--cache-dir", cache_dir] + mypy_args
+    stdout, stderr, exit_code = mypy.api.run(mypy_args)
+    if exit_code != 0:
+        # the last line in both stdout and stderr and useless, so always remove those
+        errors = stdout.strip().split("\n")[:-1]
+        errors.extend(stderr.strip().split("\n")[:-1])
+        return exit_code, errors
+    return 0, []
+
+
+def type_check_stale_code(
+    template: Template,
+    context_vars: dict[str, str],
+    code_blocks: list[dict[str, str]],
+    rendered_code: str,
+    filename: str,
+    cache: TypeCheckCache,
+) -> tuple[int, list[str]] | None:
+    """
+    Type checks only the code blocks that are not in the cache, and returns the messages of all code blocks as they
+    would have been reported for the fully rendered code in filename. Returns None if the code can't be split into
+    its code blocks, in which case all of it must be checked at once.
+    """
+    block_ranges = get_function_line_ranges(rendered_code)
+    if block_ranges is None or len(block_ranges) != len(code_blocks):
+        return None
+    header_key = cache.key(context_vars)
+    keys = [cache.key(context_vars, block) for block in code_blocks]
+    stale = [i for i, key in enumerate(keys) if key not in cache.entries]
+    if stale or header_key not in cache.entries:
+        stale_code = template.render(context_vars=context_vars, code_blocks=[code_blocks[i] for i in stale])
+        stale_ranges = get_function_line_ranges(stale_code) or []
+        # a stable module name stops mypy's cache from accumulating an entry for every run
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stale_filename = os.path.join(tmp_dir, "tpv_type_check.py")
+            with open(stale_filename, "w") as f:
+                f.write(stale_code)
+            exit_code, errors = run_mypy(stale_filename, cache.mypy_cache_dir)
+        if exit_code > 1:
+            # mypy itself failed, so there are no results to cache
+            return exit_code, errors
+        header_messages: list[tuple[int, str]] = []
+        stale_messages: dict[int, list[tuple[int, str]]] = {i: [] for i in stale}
+        for error in errors:
+            match = MYPY_MESSAGE_RE.match(error)
+            if not match or match.group("path") != stale_filename:
+                continue
+            line = int(match.group("line"))
+            for i, (start, end) in zip(stale, stale_ranges):
+                if start <= line <= end:
+                    stale_messages[i].append((line - start, match.group("message")))
+                    break
+            else:
+                # outside of any code block, so the line is the same in the fully rendered code
+                header_messages.append((line, match.group("message")))
+        cache.entries[header_key] = header_messages
+        for i, block_messages in stale_messages.items():
+            cache.entries[keys[i]] = block_messages
+        cache.save()
+    messages = [f"{filename}:{line}: {message}" for line, message in cache.entries[header_key]]
+    for key, (start, _) in zip(keys, block_ranges):
+        messages.extend(f"{filename}:{start + offset}: {message}" for offset, message in cache.entries[key])
+    # mypy only fails if it reports errors, and its output is not reported if it succeeds, as in run_mypy
+    if not any(MYPY_ERROR_RE.match(message) for message in messages):
+        return 0, []
+    return 1, messages
+
+
+def type_check_code(
+    loader: TPVConfigLoader, preserve_temp_code: bool, cache_dir: str | None = None, cache_name: str | None = None
+) -> tuple[int, list[str], str]:
     """
     1) Gather all evaluable code blocks from the loaded TPVConfig.
     2) Render them to a single .py file using Jinja2.
-    3) Run mypy and record errors if any.
+    3) Run mypy and record errors if any. If a cache_dir is provided, only code blocks that have changed since
+       a previous run are checked. A cache_name gives the run its own mypy cache within cache_dir.
     """
     # 1. Gather code blocks
     context_vars, code_blocks = gather_all_evaluable_code(loader)
@@ -227,10 +398,7 @@ def type_check_code(loader: TPVConfigLoader, preserve_temp_code: bool) -> tuple[
         return (0, [], "")
 
     # 2. Render with Jinja2
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    env = Environment(loader=FileSystemLoader(current_dir))
-    env.filters["returnify"] = add_return_to_last_expr
-    template = env.get_template("type_check_template.j2")
+    template = get_type_check_template()
     rendered_code = template.render(context_vars=context_vars, code_blocks=code_blocks)
 
     # 3. Write the rendered code to a temp file and run mypy
@@ -239,14 +407,16 @@ def type_check_code(loader: TPVConfigLoader, preserve_temp_code: bool) -> tuple[
         tmp_file.write(rendered_code)
         tmp_file.flush()
 
-        mypy_args = [
-            tmp_filename,
-        ]
-        stdout, stderr, exit_code = mypy.api.run(mypy_args)
+        result = None
+        if cache_dir:
+            try:
+                cache = TypeCheckCache(cache_dir, cache_name)
+            except OSError:
+                log.warning(f"Cannot use cache directory: {cache_dir}, so all code will be type checked", exc_info=True)
+            else:
+                result = type_check_stale_code(template, context_vars, code_blocks, rendered_code, tmp_filename, cache)
+        exit_code, errors = result or run_mypy(tmp_filename)
         if exit_code != 0:
-            # the last line in both stdout and stderr and useless, so always remove those
-            errors = stdout.strip().split("\n")[:-1]
-            errors.extend(stderr.strip().split("\n")[:-1])
             return exit_code, errors, tmp_filename
         else:
             return (0, [], "")
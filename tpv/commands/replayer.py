@@ -0,0 +1,162 @@
+import bisect
+import functools
+import math
+import time
+from collections import Counter
+from collections.abc import Iterable
+from typing import Any
+
+from .batch import JobSpec, map_in_workers
+from .dryrunner import TPVBatchDryRunner
+
+LATENCY_BUCKETS_PER_DECADE = 20
+# latency bucket upper bounds in seconds, from 1 microsecond to 100 seconds
+LATENCY_BUCKET_BOUNDS = [
+    10 ** (i / LATENCY_BUCKETS_PER_DECADE) / 1e6 for i in range(8 * LATENCY_BUCKETS_PER_DECADE + 1)
+]
+
+
+class LatencyHistogram:
+    """
+    Records latencies into logarithmically spaced buckets, so that percentiles over any number of jobs can be
+    estimated in constant memory. Estimates are accurate to within a bucket width, i.e. about 12%.
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKET_BOUNDS, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, percent: float) -> float:
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if bucket_count and seen >= rank:
+                # the last bucket has no upper bound
+                return min(LATENCY_BUCKET_BOUNDS[i], self.max) if i < len(LATENCY_BUCKET_BOUNDS) else self.max
+        return 0.0
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class ReplayStats:
+    """
+    Aggregates the outcome of replayed jobs. Only counters are kept, so memory use does not grow with the number of
+    jobs.
+    """
+
+    def __init__(self) -> None:
+        self.jobs = 0
+        self.latency = LatencyHistogram()
+        self.destinations: Counter[str] = Counter()
+        self.cores: Counter[Any] = Counter()
+        self.mem: Counter[Any] = Counter()
+        self.gpus: Counter[Any] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.start_time: float | None = None
+        self.elapsed = 0.0
+
+    def add(self, result: dict[str, Any]) -> None:
+        if self.start_time is None:
+            # start the clock at the first job, so that loading the config does not count towards throughput
+            self.start_time = time.perf_counter() - result["latency"]
+        self.jobs += 1
+        self.latency.add(result["latency"])
+        if "error" in result:
+            self.errors[result["error"]] += 1
+        else:
+            self.destinations[result["destination"]] += 1
+            self.cores[result["cores"]] += 1
+            self.mem[result["mem"]] += 1
+            self.gpus[result["gpus"]] += 1
+        self.elapsed = time.perf_counter() - self.start_time
+
+    @staticmethod
+    def _distribution(counter: Counter[Any]) -> dict[Any, int]:
+        return {key: count for key, count in counter.most_common()}
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "jobs": self.jobs,
+            "elapsed_seconds": self.elapsed,
+            "jobs_per_second": self.jobs / self.elapsed if self.elapsed else 0.0,
+            "latency_seconds": self.latency.summary(),
+            "destinations": self._distribution(self.destinations),
+            "cores": self._distribution(self.cores),
+            "mem": self._distribution(self.mem),
+            "gpus": self._distribution(self.gpus),
+            "errors": self._distribution(self.errors),
+        }
+
+    def render(self) -> str:
+        summary = self.summary()
+        latency = summary["latency_seconds"]
+        lines = [
+            f"Jobs replayed: {self.jobs} in {self.elapsed:.2f}s ({summary['jobs_per_second']:.1f} jobs/s)",
+            "Mapping latency (ms): " + ", ".join(f"{name}={value * 1000:.3f}" for name, value in latency.items()),
+        ]
+        for name in ["destinations", "cores", "mem", "gpus", "errors"]:
+            lines.append(f"{name.capitalize()}:")
+            for key, count in summary[name].items():
+                lines.append(f"  {key}: {count} ({count * 100 / self.jobs:.1f}%)")
+        return "\n".join(lines) + "\n"
+
+
+class TPVJobReplayer(TPVBatchDryRunner):
+    """
+    Replays historical jobs through the destination mapper, reporting only the chosen destination, resources and
+    mapping latency of each job.
+    """
+
+    def replay_job(self, job_spec: JobSpec) -> dict[str, Any]:
+        user, tool, job = self.create_mock_objects(job_spec)
+        result: dict[str, Any] = {}
+        start = time.perf_counter()
+        try:
+            destination = self.mapper.map_to_tpv_destination(
+                self.galaxy_app,  # type: ignore[arg-type]
+                tool,  # type: ignore[arg-type]
+                user,  # type: ignore[arg-type]
+                job,  # type: ignore[arg-type]
+            )
+            result.update(
+                {
+                    "destination": destination.dest_name,
+                    "cores": destination.cores,
+                    "mem": destination.mem,
+                    "gpus": destination.gpus,
+                }
+            )
+        except Exception as e:
+            result["error"] = type(e).__name__
+        result["latency"] = time.perf_counter() - start
+        return result
+
+    @staticmethod
+    def replay(
+        job_conf: str,
+        job_specs: Iterable[JobSpec],
+        tpv_confs: list[str] | None = None,
+        workers: int = 1,
+    ) -> ReplayStats:
+        stats = ReplayStats()
+        for result in map_in_workers(
+            functools.partial(TPVJobReplayer, job_conf, tpv_confs), "replay_job", job_specs, workers
+        ):
+            stats.add(result)
+        return stats
@@ -1,5 +1,7 @@
 import argparse
+import json
 import logging
+import os
 import sys
 from typing import Any
 
@@ -7,10 +9,13 @@ from ruamel.yaml import YAML
 from ruamel.yaml.nodes import ScalarNode
 from ruamel.yaml.representer import RoundTripRepresenter
 
-from .dryrunner import TPVDryRunner
+from .batch import read_job_specs
+from .differ import TPVDecisionDiffer
+from .dryrunner import TPVBatchDryRunner, TPVDryRunner
 from .dumper import TPVConfigDumper
 from .formatter import TPVConfigFormatter
-from .linter import TPVConfigLinter, TPVLintError
+from .linter import TPVConfigLinter, TPVLintError, read_lint_manifest
+from .replayer import TPVJobReplayer
 
 log = logging.getLogger(__name__)
 
@@ -28,11 +33,15 @@ def repr_none(dumper: RoundTripRepresenter, data: Any) -> ScalarNode:
 
 
 def tpv_lint_config_file(args: Any) -> int:
+    ignore = []
+    if args.ignore is not None:
+        ignore = [x.strip() for x in args.ignore.split(",")]
+    if getattr(args, "manifest", None) or getattr(args, "report", None):
+        return tpv_lint_chains(args, ignore)
     try:
-        ignore = []
-        if args.ignore is not None:
-            ignore = [x.strip() for x in args.ignore.split(",")]
-        tpv_linter = TPVConfigLinter.from_url_or_path(args.config, ignore, args.preserve_temp_code)
+        tpv_linter = TPVConfigLinter.from_url_or_path(
+            args.config, ignore, args.preserve_temp_code, cache_dir=None if args.no_cache else args.cache_dir
+        )
         tpv_linter.lint()
         log.info("lint successful.")
         return 0
@@ -41,6 +50,25 @@ def tpv_lint_config_file(args: Any) -> int:
         return 1
 
 
+def tpv_lint_chains(args: Any, ignore: list[str]) -> int:
+    chains = read_lint_manifest(args.manifest) if args.manifest else {"config": args.config}
+    report = TPVConfigLinter.lint_chains(
+        chains, ignore, cache_dir=None if args.no_cache else args.cache_dir, workers=args.workers
+    )
+    for chain in report["chains"]:
+        for warning in chain["warnings"]:
+            log.warning(f"{chain['name']}: {warning['code']}: {warning['message']}")
+        for error in chain["errors"]:
+            log.error(f"{chain['name']}: {error}")
+        log.info(
+            f"{chain['name']}: lint {'successful' if chain['success'] else 'failed'} ({chain['timings']['total']:.2f}s)."
+        )
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["success"] else 1
+
+
 def tpv_format_config_file(args: Any) -> int:
     try:
         formatter = TPVConfigFormatter.from_url_or_path(args.config)
@@ -57,7 +85,22 @@ def tpv_format_config_file(args: Any) -> int:
         return 1
 
 
+def tpv_dry_run_batch(args: Any) -> None:
+    results = TPVBatchDryRunner.run_batch(
+        job_conf=args.job_conf,
+        job_specs=read_job_specs(args.batch),
+        tpv_confs=args.config,
+        explain=getattr(args, "explain", False),
+        workers=getattr(args, "workers", 1),
+    )
+    for result in results:
+        sys.stdout.write(json.dumps(result, default=str) + "\n")
+        sys.stdout.flush()
+
+
 def tpv_dry_run_config_files(args: Any) -> None:
+    if getattr(args, "batch", None):
+        return tpv_dry_run_batch(args)
     dry_runner = TPVDryRunner.from_params(
         user_email=args.user,
         tool_id=args.tool,
@@ -80,6 +123,39 @@ def tpv_dry_run_config_files(args: Any) -> None:
         yaml.dump(destination, sys.stdout)
 
 
+def tpv_replay_jobs(args: Any) -> None:
+    stats = TPVJobReplayer.replay(
+        job_conf=args.job_conf,
+        job_specs=read_job_specs(args.jobs),
+        tpv_confs=args.config,
+        workers=args.workers,
+    )
+    if args.output_format == "yaml":
+        yaml = YAML(typ="safe", pure=True)
+        yaml.default_flow_style = False
+        yaml.dump(stats.summary(), sys.stdout)
+    else:
+        sys.stdout.write(stats.render())
+
+
+def tpv_diff_decisions(args: Any) -> int:
+    decision_diff = TPVDecisionDiffer.diff(
+        old_confs=args.old,
+        new_confs=args.new,
+        job_specs=read_job_specs(args.jobs),
+        job_conf=args.job_conf,
+        explain=args.explain,
+        workers=args.workers,
+    )
+    if args.output_format == "yaml":
+        yaml = YAML(typ="safe", pure=True)
+        yaml.default_flow_style = False
+        yaml.dump(decision_diff.summary(), sys.stdout)
+    else:
+        sys.stdout.write(decision_diff.render())
+    return 1 if decision_diff.changed else 0
+
+
 def tpv_dump_config(args: Any) -> None:
     config_files = args.config
     if not config_files and args.job_conf:
@@ -130,6 +206,36 @@ def create_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Preserve the temporary code autogenerated during mypy type checks",
     )
+    lint_parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "tpv", "lint"),
+        help="Directory in which type checking results are cached, so that only changed code is type checked on"
+        " subsequent runs (default: %(default)s)",
+    )
+    lint_parser.add_argument(
+        "--no-cache",
+        default=False,
+        action="store_true",
+        help="Type check all code, without reading or writing cached results",
+    )
+    lint_parser.add_argument(
+        "--manifest",
+        type=str,
+        help="A yaml file that maps the names of independent config chains to their config files, which are linted"
+        " concurrently instead of the config files on the command line",
+    )
+    lint_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to lint --manifest chains with (default: 1)",
+    )
+    lint_parser.add_argument(
+        "--report",
+        type=str,
+        help="Write the errors, warnings and timings of each config chain to this file as JSON",
+    )
     lint_parser.add_argument(
         "config",
         nargs="*",
@@ -182,6 +288,18 @@ def create_parser() -> argparse.ArgumentParser:
         default="text",
         help="Output format for --explain (default: text)",
     )
+    dry_run_parser.add_argument(
+        "--batch",
+        type=str,
+        help="A .csv or .jsonl file of jobs to map, with one job per row and the columns tool, user, roles,"
+        " history_tags and input_size. The results are written to stdout as JSON lines, in the order of the jobs.",
+    )
+    dry_run_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to map --batch jobs with (default: 1)",
+    )
     dry_run_parser.add_argument(
         "config",
         nargs="*",
@@ -189,6 +307,86 @@ def create_parser() -> argparse.ArgumentParser:
     )
     dry_run_parser.set_defaults(func=tpv_dry_run_config_files)
 
+    replay_parser = subparsers.add_parser(
+        "replay",
+        help="Replay a file of historical jobs through TPV and report mapping throughput and outcomes.",
+        description="Maps every job in a .csv or .jsonl export of jobs, and reports the mapping throughput, the"
+        " latency distribution, and the distribution of destinations and resources chosen.",
+    )
+    replay_parser.add_argument("--job-conf", type=str, required=True, help="Galaxy job configuration file")
+    replay_parser.add_argument(
+        "--jobs",
+        type=str,
+        required=True,
+        help="A .csv or .jsonl file of jobs to replay, with one job per row",
+    )
+    replay_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to map jobs with (default: 1)",
+    )
+    replay_parser.add_argument(
+        "--output-format",
+        choices=["text", "yaml"],
+        default="text",
+        help="Output format (default: text)",
+    )
+    replay_parser.add_argument(
+        "config",
+        nargs="*",
+        help="TPV configuration files, overrides tpv_config_files in Galaxy job configuration if provided",
+    )
+    replay_parser.set_defaults(func=tpv_replay_jobs)
+
+    diff_parser = subparsers.add_parser(
+        "diff-decisions",
+        help="Reports the jobs that would be mapped differently by a new TPV configuration.",
+        description="Maps every job in a .csv or .jsonl file against both the old and new TPV configuration files,"
+        " and reports the jobs whose destination, cores, mem, gpus or params changed, grouped by tool. Exits with"
+        " 1 if any job changed.",
+    )
+    diff_parser.add_argument(
+        "--old",
+        type=str,
+        nargs="+",
+        required=True,
+        help="The current TPV configuration files, merged in the order specified",
+    )
+    diff_parser.add_argument(
+        "--new",
+        type=str,
+        nargs="+",
+        required=True,
+        help="The changed TPV configuration files, merged in the order specified",
+    )
+    diff_parser.add_argument(
+        "--jobs",
+        type=str,
+        required=True,
+        help="A .csv or .jsonl file of jobs to compare, with one job per row",
+    )
+    diff_parser.add_argument("--job-conf", type=str, help="Galaxy job configuration file")
+    diff_parser.add_argument(
+        "--explain",
+        action="store_true",
+        default=False,
+        help="Include the decision traces of both configurations for each job that changed",
+    )
+    diff_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to map jobs with (default: 1)",
+    )
+    diff_parser.add_argument(
+        "--output-format",
+        choices=["text", "yaml"],
+        default="text",
+        help="Output format (default: text)",
+    )
+    diff_parser.set_defaults(func=tpv_diff_decisions)
+
     dump_parser = subparsers.add_parser(
         "dump",
         help="Dump the fully merged TPV configuration from one or more config sources.",
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from collections.abc import Callable, Mapping
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class DestinationCapacity:
+    """The live state of a destination, as last reported by an external agent."""
+
+    free_slots: int | None = None
+    queue_depth: int | None = None
+    online: bool = True
+
+    @staticmethod
+    def parse(values: Mapping[str, Any]) -> DestinationCapacity:
+        free_slots = values.get("free_slots")
+        queue_depth = values.get("queue_depth")
+        return DestinationCapacity(
+            free_slots=int(free_slots) if free_slots is not None else None,
+            queue_depth=int(queue_depth) if queue_depth is not None else None,
+            online=bool(values.get("online", True)),
+        )
+
+    def rank_key(self) -> tuple[int, int]:
+        # destinations with more free slots, and then with shorter queues, rank higher
+        return (self.free_slots or 0, -(self.queue_depth or 0))
+
+    def describe(self) -> str:
+        parts = ["online" if self.online else "offline"]
+        if self.free_slots is not None:
+            parts.append(f"free_slots={self.free_slots}")
+        if self.queue_depth is not None:
+            parts.append(f"queue_depth={self.queue_depth}")
+        return ", ".join(parts)
+
+
+class CapacityFeed:
+    """
+    The live capacity of destinations, keyed on destination id, held in memory so that it can be consulted while
+    mapping jobs without any I/O. Feeds replace their state as a whole when new values arrive, so that readers never
+    need a lock.
+    """
+
+    CONTEXT_KEY = "__capacity"
+
+    def __init__(self) -> None:
+        self.capacities: dict[str, DestinationCapacity] = {}
+
+    @staticmethod
+    def from_context(context: Mapping[str, Any]) -> CapacityFeed | None:
+        return context.get(CapacityFeed.CONTEXT_KEY)
+
+    @staticmethod
+    def parse(document: Mapping[str, Any]) -> dict[str, DestinationCapacity]:
+        return {str(key): DestinationCapacity.parse(values) for key, values in document.items()}
+
+    def get(self, destination_id: str) -> DestinationCapacity | None:
+        return self.capacities.get(destination_id)
+
+    def is_online(self, destination_id: str) -> bool:
+        capacity = self.get(destination_id)
+        # destinations that the agent does not report on are assumed to be online
+        return capacity is None or capacity.online
+
+    def rank_key(self, destination_id: str) -> tuple[int, int]:
+        capacity = self.get(destination_id)
+        return capacity.rank_key() if capacity else (0, 0)
+
+    def describe(self, destination_id: str) -> str | None:
+        capacity = self.get(destination_id)
+        return capacity.describe() if capacity else None
+
+    def close(self) -> None:
+        pass
+
+
+class FileCapacityFeed(CapacityFeed):
+    """
+    Reads destination capacities from a JSON file, which maps destination ids to their `free_slots`, `queue_depth`
+    and `online` state. The file is checked for changes at most once every refresh interval, and only read again
+    when it has changed, so an agent should replace it atomically, for example by renaming a temporary file.
+    """
+
+    REFRESH_INTERVAL = 1.0
+
+    def __init__(
+        self, path: str, refresh_interval: float = REFRESH_INTERVAL, timer: Callable[[], float] = time.monotonic
+    ):
+        super().__init__()
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.timer = timer
+        self.lock = threading.Lock()
+        self.next_check = 0.0
+        self.file_state: tuple[int, int] | None = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        if self.timer() < self.next_check or not self.lock.acquire(blocking=False):
+            # another thread is already checking the file, so the current capacities are used meanwhile
+            return
+        try:
+            self.next_check = self.timer() + self.refresh_interval
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            file_state = (stat.st_mtime_ns, stat.st_size)
+            if file_state != self.file_state:
+                self.file_state = file_state
+                try:
+                    with open(self.path) as f:
+                        self.capacities = self.parse(json.load(f))
+                except (OSError, ValueError, TypeError, AttributeError):
+                    log.warning(f"Failed to read destination capacities from: {self.path}", exc_info=True)
+        finally:
+            self.lock.release()
+
+    def get(self, destination_id: str) -> DestinationCapacity | None:
+        self.refresh()
+        return super().get(destination_id)
+
+
+class CapacityRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self) -> None:
+        feed: SocketCapacityFeed = self.server.feed  # type: ignore[attr-defined]
+        for line in self.rfile:
+            if line.strip():
+                try:
+                    feed.update(json.loads(line))
+                except (ValueError, TypeError, AttributeError):
+                    log.warning("Ignoring invalid destination capacity update", exc_info=True)
+
+
+class SocketCapacityFeed(CapacityFeed):
+    """
+    Listens on a unix socket for destination capacities. An agent connects and writes one JSON document per line,
+    each mapping destination ids to their `free_slots`, `queue_depth` and `online` state. Destinations that are not
+    mentioned in an update keep their last reported state.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            # a socket left behind by an earlier process
+            os.unlink(path)
+        self.server = socketserver.ThreadingUnixStreamServer(path, CapacityRequestHandler)
+        self.server.daemon_threads = True
+        self.server.feed = self  # type: ignore[attr-defined]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="tpv-capacity", daemon=True)
+        self.thread.start()
+
+    def update(self, document: Mapping[str, Any]) -> None:
+        updates = self.parse(document)
+        with self.lock:
+            self.capacities = {**self.capacities, **updates}
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+_CAPACITY_FEEDS: dict[str, CapacityFeed] = {}
+_CAPACITY_FEEDS_LOCK = threading.Lock()
+
+
+def open_capacity_feed(source: str) -> CapacityFeed:
+    """
+    Open the capacity feed for a source, which is either the path of a JSON file, or a unix socket path prefixed with
+    `unix:`. Feeds are shared by all mappers, so that a feed outlives the mapper that opened it when the config is
+    reloaded.
+    """
+    with _CAPACITY_FEEDS_LOCK:
+        feed = _CAPACITY_FEEDS.get(source)
+        if feed is None:
+            if source.startswith("unix:"):
+                feed = SocketCapacityFeed(source[len("unix:") :])
+            else:
+                feed = FileCapacityFeed(source)
+            _CAPACITY_FEEDS[source] = feed
+        return feed
+
+
+def close_capacity_feeds() -> None:
+    with _CAPACITY_FEEDS_LOCK:
+        for feed in _CAPACITY_FEEDS.values():
+            feed.close()
+        _CAPACITY_FEEDS.clear()
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import ast
+import bisect
+import dataclasses
+import functools
+import threading
+from enum import Enum
+from typing import Any, cast
+
+from cachetools import LRUCache
+
+
+class ConditionScope(Enum):
+    """The context that a rule condition depends on, and therefore how long its outcome stays valid."""
+
+    CONSTANT = "constant"
+    TOOL = "tool"
+    USER = "user"
+    TOOL_AND_USER = "tool_and_user"
+    JOB = "job"
+
+
+# builtins that always return the same result for the same arguments
+PURE_BUILTINS = frozenset(
+    {
+        "abs",
+        "all",
+        "any",
+        "bool",
+        "dict",
+        "float",
+        "frozenset",
+        "getattr",
+        "hasattr",
+        "int",
+        "isinstance",
+        "len",
+        "list",
+        "max",
+        "min",
+        "round",
+        "set",
+        "sorted",
+        "str",
+        "sum",
+        "tuple",
+    }
+)
+# helpers whose result only depends on their arguments
+PURE_HELPERS = frozenset(
+    {
+        "get_tool_resource_field",
+        "tool_version_eq",
+        "tool_version_gt",
+        "tool_version_gte",
+        "tool_version_lt",
+        "tool_version_lte",
+    }
+)
+
+
+class ConditionNameCollector(ast.NodeVisitor):
+    """
+    Collects the names that a code block reads from its context. Pure builtins and helpers are not collected,
+    and references to any other helper are collected as `helpers`.
+    """
+
+    def __init__(self) -> None:
+        self.loaded: set[str] = set()
+        self.stored: set[str] = set()
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Load):
+            self.loaded.add(node.id)
+        else:
+            self.stored.add(node.id)
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        if isinstance(node.value, ast.Name) and node.value.id == "helpers":
+            if node.attr not in PURE_HELPERS:
+                self.loaded.add("helpers")
+        else:
+            self.generic_visit(node)
+
+    def visit_arg(self, node: ast.arg) -> None:
+        self.stored.add(node.arg)
+
+    @staticmethod
+    def collect(code: str) -> set[str]:
+        collector = ConditionNameCollector()
+        collector.visit(ast.parse(code, mode="exec"))
+        # names assigned within the block, such as comprehension variables, are not read from the context
+        return {name for name in collector.loaded - collector.stored if name not in PURE_BUILTINS}
+
+
+@functools.lru_cache(maxsize=None)
+def referenced_names(code: str, as_f_string: bool = False) -> frozenset[str] | None:
+    """
+    The names that a code block reads from its context, or None if the code block can't be parsed.
+    """
+    try:
+        return frozenset(ConditionNameCollector.collect(f"f'''{code}'''" if as_f_string else code))
+    except SyntaxError:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def classify_condition(code: str) -> ConditionScope:
+    """
+    Classify a rule condition by the names it references. Conditions that only refer to the tool or the user can be
+    evaluated once per tool and user, while any other reference, including to the job, the entity or context
+    variables, makes a condition job dependent.
+    """
+    names = referenced_names(code)
+    if names is None:
+        return ConditionScope.JOB
+    if not names:
+        return ConditionScope.CONSTANT
+    elif names == {"tool"}:
+        return ConditionScope.TOOL
+    elif names == {"user"}:
+        return ConditionScope.USER
+    elif names == {"tool", "user"}:
+        return ConditionScope.TOOL_AND_USER
+    else:
+        return ConditionScope.JOB
+
+
+@dataclasses.dataclass(frozen=True)
+class Interval:
+    """A range of numbers, bounded on either or both sides."""
+
+    lower: float | None = None
+    lower_inclusive: bool = False
+    upper: float | None = None
+    upper_inclusive: bool = False
+
+    def contains(self, value: float) -> bool:
+        if self.lower is not None and (value < self.lower or (value == self.lower and not self.lower_inclusive)):
+            return False
+        if self.upper is not None and (value > self.upper or (value == self.upper and not self.upper_inclusive)):
+            return False
+        return True
+
+    def intersect(self, other: Interval) -> Interval:
+        lower, lower_inclusive = self.lower, self.lower_inclusive
+        if other.lower is not None and (lower is None or other.lower >= lower):
+            lower_inclusive = other.lower_inclusive and (lower != other.lower or lower_inclusive)
+            lower = other.lower
+        upper, upper_inclusive = self.upper, self.upper_inclusive
+        if other.upper is not None and (upper is None or other.upper <= upper):
+            upper_inclusive = other.upper_inclusive and (upper != other.upper or upper_inclusive)
+            upper = other.upper
+        return Interval(lower, lower_inclusive, upper, upper_inclusive)
+
+
+def threshold_bound(node: ast.expr) -> float | None:
+    try:
+        value = ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return None
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def parse_threshold_condition(node: ast.expr) -> tuple[str, Interval] | None:
+    """
+    Parse a condition that compares a single variable to numeric constants, such as `input_size >= 10`,
+    `2 <= input_size < 20` or `input_size > 2 and input_size < 20`, into the variable and the interval that it must
+    fall within. Returns None for any other condition.
+    """
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        parts = [parse_threshold_condition(value) for value in node.values]
+        if not all(parts) or len({part[0] for part in parts if part}) != 1:
+            return None
+        name, interval = cast(tuple[str, Interval], parts[0])
+        for part in parts[1:]:
+            interval = interval.intersect(cast(tuple[str, Interval], part)[1])
+        return name, interval
+    if not isinstance(node, ast.Compare):
+        return None
+    operands = [node.left, *node.comparators]
+    names = set()
+    interval = Interval()
+    for left, op, right in zip(operands, node.ops, operands[1:]):
+        if isinstance(left, ast.Name):
+            name, bound = left.id, threshold_bound(right)
+        elif isinstance(right, ast.Name):
+            # flip the comparison, so that the variable is on the left
+            name, bound = right.id, threshold_bound(left)
+            op = {ast.Lt: ast.Gt(), ast.LtE: ast.GtE(), ast.Gt: ast.Lt(), ast.GtE: ast.LtE()}.get(type(op), op)
+        else:
+            return None
+        if bound is None:
+            return None
+        names.add(name)
+        if isinstance(op, (ast.Lt, ast.LtE)):
+            interval = interval.intersect(Interval(upper=bound, upper_inclusive=isinstance(op, ast.LtE)))
+        elif isinstance(op, (ast.Gt, ast.GtE)):
+            interval = interval.intersect(Interval(lower=bound, lower_inclusive=isinstance(op, ast.GtE)))
+        else:
+            return None
+    return (names.pop(), interval) if len(names) == 1 else None
+
+
+class IntervalIndex:
+    """
+    Finds the intervals that contain a value through a binary search. The bounds of all intervals split the number
+    line into regions, made up of the bounds themselves and the open ranges between them, and the set of intervals
+    that contain each region is computed up front.
+    """
+
+    def __init__(self, intervals: dict[int, Interval]):
+        self.bounds = sorted(
+            {
+                bound
+                for interval in intervals.values()
+                for bound in (interval.lower, interval.upper)
+                if bound is not None
+            }
+        )
+        # a value from each region, in order
+        representatives: list[float] = []
+        for position, bound in enumerate(self.bounds):
+            previous = (self.bounds[position - 1] + bound) / 2 if position else bound - 1
+            representatives += [previous, bound]
+        representatives.append(self.bounds[-1] + 1 if self.bounds else 0)
+        self.regions = [
+            frozenset(key for key, interval in intervals.items() if interval.contains(value))
+            for value in representatives
+        ]
+
+    def matching(self, value: float) -> frozenset[int]:
+        if value != value:
+            # nan is not within any interval
+            return frozenset()
+        position = bisect.bisect_left(self.bounds, value)
+        if position < len(self.bounds) and self.bounds[position] == value:
+            return self.regions[2 * position + 1]
+        return self.regions[2 * position]
+
+
+class RuleConditionCache:
+    """
+    A bounded cache of the outcomes of rule conditions that do not depend on the job, keyed on the condition, and
+    the id and version of the tool and the id of the user that it depends on.
+    """
+
+    CONTEXT_KEY = "__condition_cache"
+
+    def __init__(self, maxsize: int = 10000):
+        self.cache: LRUCache[tuple[Any, ...], bool] = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def from_context(context: dict[str, Any]) -> RuleConditionCache | None:
+        return context.get(RuleConditionCache.CONTEXT_KEY)
+
+    @staticmethod
+    def tool_key(tool: Any) -> tuple[Any, ...]:
+        if tool is None:
+            return (None, None)
+        # user defined tools can share a tool id, but not a uuid
+        dynamic_tool = getattr(tool, "dynamic_tool", None)
+        return (getattr(dynamic_tool, "uuid", None) or tool.id, tool.version)
+
+    @staticmethod
+    def user_key(user: Any) -> Any:
+        return user.id if user is not None else None
+
+    def cache_key(self, code: str, context: dict[str, Any]) -> tuple[Any, ...] | None:
+        scope = classify_condition(code)
+        if scope is ConditionScope.JOB:
+            return None
+        key: tuple[Any, ...] = (code, scope)
+        if scope in (ConditionScope.TOOL, ConditionScope.TOOL_AND_USER):
+            key += self.tool_key(context.get("tool"))
+        if scope in (ConditionScope.USER, ConditionScope.TOOL_AND_USER):
+            key += (self.user_key(context.get("user")),)
+        return key
+
+    def get(self, key: tuple[Any, ...] | None) -> bool | None:
+        if key is None:
+            return None
+        with self.lock:
+            return self.cache.get(key)
+
+    def set(self, key: tuple[Any, ...] | None, matched: bool) -> None:
+        if key is not None:
+            with self.lock:
+                self.cache[key] = matched
@@ -2,7 +2,9 @@ import copy
 import itertools
 import logging
 import re
+import threading
 from collections import defaultdict
+from collections.abc import Iterator, Mapping
 from dataclasses import dataclass
 from enum import IntEnum
 from typing import (
@@ -10,21 +12,25 @@ from typing import (
     Any,
     Callable,
     ClassVar,
+    Generic,
     Iterable,
     TypeVar,
     cast,
 )
 
 from galaxy import util as galaxy_util
-from pydantic import BaseModel, ConfigDict, Field, model_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from pydantic.json_schema import SkipJsonSchema
 
 # xref: https://github.com/python/mypy/issues/12664
 from ruamel.yaml.comments import CommentedMap
 from typing_extensions import Self
 
+from .capacity import CapacityFeed
+from .conditions import RuleConditionCache
 from .evaluator import TPVCodeEvaluator
 from .explain import ExplainCollector, ExplainPhase
+from .util import parse_tool_version
 
 log = logging.getLogger(__name__)
 
@@ -66,11 +72,44 @@ def default_field_copier(entity1: "Entity", entity2: "Entity", property_name: st
 
 
 def default_dict_copier(entity1: "Entity", entity2: "Entity", property_name: str) -> Any:
-    new_dict = copy.deepcopy(getattr(entity2, property_name)) or {}
-    new_dict.update(copy.deepcopy(getattr(entity1, property_name)) or {})
+    new_dict = copy_value(getattr(entity2, property_name)) or {}
+    new_dict.update(copy_value(getattr(entity1, property_name)) or {})
     return new_dict
 
 
+def copy_value(value: Any) -> Any:
+    """
+    Deep copy a property value. Property values are almost always plain dicts, lists and scalars, which are copied
+    directly, as this is several times faster than a generic deepcopy.
+    """
+    value_type = type(value)
+    if value_type is dict:
+        return {key: copy_value(item) for key, item in value.items()}
+    elif value_type is list:
+        return [copy_value(item) for item in value]
+    elif value is None or value_type in (str, int, float, bool):
+        return value
+    else:
+        return copy.deepcopy(value)
+
+
+ModelType = TypeVar("ModelType", bound=BaseModel)
+
+
+def deepcopy_model(model: ModelType, shared_fields: Iterable[str] = ()) -> ModelType:
+    """
+    Deep copy a model by copying the values in its __dict__, bypassing pydantic's generic deepcopy. Fields in
+    `shared_fields` are shared with the copy instead.
+    """
+    new_model = model.model_copy()
+    for name, value in model.__dict__.items():
+        if name not in shared_fields:
+            new_model.__dict__[name] = copy_value(value)
+    if model.__pydantic_extra__:
+        new_model.__pydantic_extra__ = copy_value(model.__pydantic_extra__)
+    return new_model
+
+
 class TagType(IntEnum):
     REQUIRE = 3
     PREFER = 2
@@ -150,6 +189,9 @@ class SchedulingTags(BaseModel):
             filtered = (tag for tag in filtered if tag.value == tag_value)
         return filtered
 
+    def __deepcopy__(self, memo: dict[int, Any] | None = None) -> Self:
+        return deepcopy_model(self)
+
     def add_tag_override(self, tag_type: TagType, tag_value: str) -> None:
         # Remove tag from all categories
         for field in TagType:
@@ -285,13 +327,9 @@ class Entity(BaseModel):
                             evaluator.compile_code_block(value)
 
     def __deepcopy__(self, memo: dict[int, Any] | None = None) -> Self:
-        # satisfy mypy by ensuring memo is never None
-        if memo is None:
-            memo = {}  # pragma: no cover
-        # make sure we don't deepcopy the evaluator: https://github.com/galaxyproject/total-perspective-vortex/issues/53
-        # xref: https://stackoverflow.com/a/68746763/10971151
-        memo[id(self.evaluator)] = self.evaluator
-        return super().__deepcopy__(memo)
+        # entities are copied several times for every job mapped, so only property values are copied, and the
+        # evaluator is shared: https://github.com/galaxyproject/total-perspective-vortex/issues/53
+        return deepcopy_model(self, shared_fields=("evaluator",))
 
     @staticmethod
     def convert_env(
@@ -355,8 +393,8 @@ class Entity(BaseModel):
             entity,
             "env",
             field_copier=lambda e1, e2, p: self.merge_env_list(
-                copy.deepcopy(entity.env or []),
-                copy.deepcopy(self.env or []),
+                copy_value(entity.env or []),
+                copy_value(self.env or []),
             ),
         )
         self.override_single_property(new_entity, self, entity, "params", field_copier=default_dict_copier)
@@ -470,12 +508,17 @@ class Entity(BaseModel):
 
     def rank_destinations(self, destinations: list["Destination"], context: dict[str, Any]) -> list["Destination"]:
         if self.rank:
-            log.debug(f"Ranking destinations: {destinations} for entity: {self} using custom" " function")
+            # entity reprs are long, so they are only formatted if debug logging is enabled
+            log.debug("Ranking destinations: %s for entity: %s using custom function", destinations, self)
             context["candidate_destinations"] = destinations
             return cast(list["Destination"], self.evaluator.eval_code_block(self.rank, context))
         else:
             # Sort destinations by priority
-            log.debug(f"Ranking destinations: {destinations} for entity: {self} using default" " ranker")
+            log.debug("Ranking destinations: %s for entity: %s using default ranker", destinations, self)
+            capacity = CapacityFeed.from_context(context)
+            if capacity:
+                # destinations that match equally well are ranked by their free slots, and then by their queue depth
+                return sorted(destinations, key=lambda d: (d.score(self), capacity.rank_key(d.id)), reverse=True)
             return sorted(destinations, key=lambda d: d.score(self), reverse=True)
 
     def should_skip_qa(self, code: str) -> bool:
@@ -488,7 +531,8 @@ class Entity(BaseModel):
 
 
 class Rule(Entity):
-    rule_counter: ClassVar[int] = 0
+    # a counter, rather than an int incremented in place, so that rules created on different threads get unique ids
+    rule_counter: ClassVar[Iterator[int]] = itertools.count(1)
     id: str = Field(default_factory=lambda: Rule.set_default_id())
     if_condition: Annotated[str | bool, TPVFieldMetadata()] = Field(alias="if")
     execute: Annotated[str | None, TPVFieldMetadata(return_type=type(None))] = None
@@ -496,8 +540,7 @@ class Rule(Entity):
 
     @classmethod
     def set_default_id(cls) -> str:
-        cls.rule_counter += 1
-        return f"tpv_rule_{cls.rule_counter}"
+        return f"tpv_rule_{next(cls.rule_counter)}"
 
     def override(self, entity: Self) -> Self:
         new_entity = super().override(entity)
@@ -507,12 +550,6 @@ class Rule(Entity):
             self.override_single_property(new_entity, self, entity, "fail")
         return new_entity
 
-    def is_matching(self, context: dict[str, Any]) -> bool:
-        if self.evaluator.eval_code_block(str(self.if_condition), context):
-            return True
-        else:
-            return False
-
     def evaluate(self, context: dict[str, Any]) -> Self:
         if self.fail:
             from galaxy.jobs.mapper import JobMappingException
@@ -557,8 +594,17 @@ class EntityWithRules(Entity):
         new_entity = copy.deepcopy(self)
         context.update(new_entity.context or {})
         explain = ExplainCollector.from_context(context)
-        for rule in self.rules.values():
-            if rule.is_matching(context):
+        rules = list(self.rules.values())
+        conditions = [str(rule.if_condition) for rule in rules]
+        # outcomes of conditions that only depend on the tool or user may already be known from earlier jobs
+        condition_cache = RuleConditionCache.from_context(context)
+        keys = [condition_cache.cache_key(code, context) for code in conditions] if condition_cache else []
+        known = [condition_cache.get(key) for key in keys] if condition_cache else [None] * len(rules)
+        outcomes = self.evaluator.evaluate_rule_conditions(conditions, context, known)
+        for index, (rule, matched) in enumerate(zip(rules, outcomes)):
+            if condition_cache and known[index] is None:
+                condition_cache.set(keys[index], matched)
+            if matched:
                 if explain:
                     changes = []
                     if rule.cores is not None:
@@ -595,8 +641,47 @@ class EntityWithRules(Entity):
         return super(EntityWithRules, new_entity).evaluate(context)
 
 
+class ToolVersionRange(BaseModel):
+    # a misspelt bound would otherwise be ignored, and the range would match every version
+    model_config = ConfigDict(extra="forbid")
+
+    gt: str | None = None
+    gte: str | None = None
+    lt: str | None = None
+    lte: str | None = None
+
+    @field_validator("gt", "gte", "lt", "lte", mode="before")
+    @classmethod
+    def convert_version(cls, value: Any) -> Any:
+        if isinstance(value, float):
+            # an unquoted version such as 1.10 is loaded from yaml as the float 1.1, so can't be recovered
+            raise ValueError(f"Version {value} must be quoted, so that it is not read as a number")
+        return str(value) if isinstance(value, int) else value
+
+    def contains(self, version: str | None) -> bool:
+        """
+        Check whether a tool version lies within this range. A tool with an unknown version is never within range.
+        """
+        if version is None:
+            return False
+        parsed = parse_tool_version(version)
+        return (
+            (self.gt is None or parsed > parse_tool_version(self.gt))
+            and (self.gte is None or parsed >= parse_tool_version(self.gte))
+            and (self.lt is None or parsed < parse_tool_version(self.lt))
+            and (self.lte is None or parsed <= parse_tool_version(self.lte))
+        )
+
+
 class Tool(EntityWithRules):
     merge_order: ClassVar[int] = 2
+    version_range: ToolVersionRange | None = None
+
+    def override(self, entity: Self) -> Self:
+        new_entity = super().override(entity)
+        if isinstance(entity, Tool):
+            self.override_single_property(new_entity, self, entity, "version_range")
+        return new_entity
 
 
 class Role(EntityWithRules):
@@ -662,7 +747,7 @@ class Destination(EntityWithRules):
         """
         The match operation checks whether
 
-        a. The destination is not abstract.
+        a. The destination is not abstract, and is not reported to be offline by the capacity feed, if any.
         b. The cores, mem and gpu defined on the destination are sufficient to fulfill the cores, mem and gpus
            requested by the entity. If not defined, it is considered a match.
         c. all of the require tags in an entity are present in the destination entity, and none of the reject tags in
@@ -675,6 +760,9 @@ class Destination(EntityWithRules):
         """
         if self.abstract:
             return False
+        capacity = CapacityFeed.from_context(context)
+        if capacity and not capacity.is_online(self.id):
+            return False
         if (
             self.max_accepted_cores is not None
             and entity.cores is not None
@@ -713,7 +801,7 @@ class Destination(EntityWithRules):
         :return:
         """
         score = self.tpv_dest_tags.score(entity.tpv_tags)
-        log.debug(f"Destination: {entity} scored: {score}")
+        log.debug("Destination: %s scored: %s", entity, score)
         return score
 
 
@@ -722,6 +810,9 @@ class GlobalConfig(BaseModel):
 
     default_inherits: str | None = None
     context: dict[str, Any] = Field(default_factory=lambda: dict())
+    concurrent_destinations: int | None = None
+    deferral_ttl: float | None = None
+    capacity_feed: str | None = None
 
 
 class TPVConfig(BaseModel):
@@ -802,3 +893,55 @@ class TPVConfig(BaseModel):
             new_dict[key] = child_value
 
         return new_dict
+
+
+LazyEntityType = TypeVar("LazyEntityType", bound=Entity)
+
+
+class LazyEntities(Mapping[str, LazyEntityType], Generic[LazyEntityType]):
+    """
+    A read-only mapping of entity ids to entities, where each entity is only materialized, i.e. validated, compiled
+    and inheritance resolved, when it is first accessed.
+    """
+
+    def __init__(
+        self,
+        keys: Iterable[str],
+        materialize: Callable[[str], LazyEntityType],
+        version_ranges: dict[str, ToolVersionRange] | None = None,
+    ):
+        self.materialize = materialize
+        # tool version ranges are needed to match tool ids, so they are known up front, without materializing tools
+        self.version_ranges = version_ranges or {}
+        # the declared parent of each tool, so that tools inheriting a version range can be found without
+        # materializing them
+        self.inherits: dict[str, str | None] = {}
+        self._keys = list(keys)
+        self._key_set = set(self._keys)
+        self._entities: dict[str, LazyEntityType] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key: str) -> LazyEntityType:
+        entity = self._entities.get(key)
+        if entity is None:
+            if key not in self._key_set:
+                raise KeyError(key)
+            with self._lock:
+                entity = self._entities.get(key)
+                if entity is None:
+                    entity = self.materialize(key)
+                    self._entities[key] = entity
+        return entity
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._key_set
+
+    @property
+    def materialized(self) -> int:
+        return len(self._entities)
@@ -1,5 +1,5 @@
 import abc
-from collections.abc import Callable
+from collections.abc import Callable, Iterator, Sequence
 from types import CodeType
 from typing import Any
 
@@ -22,6 +22,16 @@ class TPVCodeEvaluator(abc.ABC):
     ) -> Any:
         pass  # pragma: no cover
 
+    def evaluate_rule_conditions(
+        self, conditions: Sequence[str], context: dict[str, Any], known: Sequence[bool | None]
+    ) -> Iterator[bool]:
+        """
+        Evaluate rule conditions in order, yielding whether each one matched. Conditions whose outcome is already
+        known are not evaluated. Conditions are evaluated lazily, so that matching rules can be applied in between.
+        """
+        for condition, matched in zip(conditions, known):
+            yield matched if matched is not None else bool(self.eval_code_block(condition, context))
+
     def process_complex_property(
         self,
         prop_name: str,
@@ -8,6 +8,7 @@ from typing import TYPE_CHECKING, Any
 from ruamel.yaml import YAML
 
 if TYPE_CHECKING:
+    from .capacity import CapacityFeed
     from .entities import Destination, Entity
 
 
@@ -148,10 +149,12 @@ class ExplainCollector:
         return buf.getvalue()
 
     @staticmethod
-    def match_failure_reason(dest: Destination, entity: Entity) -> str:
+    def match_failure_reason(dest: Destination, entity: Entity, capacity: CapacityFeed | None = None) -> str:
         """Produce a human-readable reason why a destination didn't match an entity."""
         if dest.abstract:
             return "destination is abstract"
+        if capacity and not capacity.is_online(dest.id):
+            return f"destination is offline ({capacity.describe(dest.id)})"
         if (
             dest.max_accepted_cores is not None
             and entity.cores is not None
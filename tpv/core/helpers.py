@@ -1,16 +1,18 @@
-try:
-    from galaxy.tool_util.version import parse_version
-except ImportError:
-    # Fallback to an older `packaging` version when Galaxy < 23.1.
-    # If Galaxy is < 23.1 you need to have `packaging` in <= 21.3
-    from packaging.version import parse as parse_version
-
+import contextvars
+import functools
+import math
 import operator
 import random
-import re
-from collections.abc import Callable, Mapping
+import string
+import threading
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from functools import reduce
-from typing import Any, TypeVar
+from typing import Any, TypeVar, cast
 
 T = TypeVar("T")
 WeightedT = TypeVar("WeightedT", bound=Mapping[str, Any])
@@ -23,6 +25,7 @@ from galaxy.tools import Tool as GalaxyTool
 
 from tpv.core.entities import Destination, Entity
 from tpv.core.resource_requirements import TPVResourceFieldName, extract_resource_requirements_from_tool
+from tpv.core.util import parse_tool_version
 
 GIGABYTES = 1024.0**3
 
@@ -32,6 +35,54 @@ COMPRESSED_EXTENSION_SUFFIXES = (".gz", ".bz2")
 # Default multiplier applied to compressed input sizes to approximate their decompressed size
 DEFAULT_COMPRESSION_FACTOR = 3.4
 
+# Values derived from a job that are expensive to compute, keyed by (job, name). Only populated
+# within a job_memo_scope, which the mapper opens for the duration of each mapping.
+_JOB_MEMO: ContextVar[dict[tuple[int, str], Any] | None] = ContextVar("tpv_job_memo", default=None)
+
+
+# the maximum number of helper calls that run at once, across all mappings in a process
+HELPER_POOL_SIZE = 8
+_HELPER_POOL: ThreadPoolExecutor | None = None
+_HELPER_POOL_LOCK = threading.Lock()
+_HELPER_THREAD = threading.local()
+
+
+def _helper_pool() -> ThreadPoolExecutor:
+    global _HELPER_POOL
+    if _HELPER_POOL is None:
+        with _HELPER_POOL_LOCK:
+            if _HELPER_POOL is None:
+                _HELPER_POOL = ThreadPoolExecutor(
+                    max_workers=HELPER_POOL_SIZE,
+                    thread_name_prefix="tpv-helper",
+                    initializer=lambda: setattr(_HELPER_THREAD, "active", True),
+                )
+    return _HELPER_POOL
+
+
+@contextmanager
+def job_memo_scope() -> Iterator[None]:
+    """
+    Memoize per-job helper results, such as a job's parameter values, until the scope exits.
+    Helpers called outside of a scope recompute their results on every call.
+    """
+    token = _JOB_MEMO.set({})
+    try:
+        yield
+    finally:
+        _JOB_MEMO.reset(token)
+
+
+def _memoize_for_job(job: Job, name: str, factory: Callable[[], T]) -> T:
+    memo = _JOB_MEMO.get()
+    if memo is None:
+        return factory()
+    # the job is referenced for the whole mapping, so its id can't be reused while the scope is open
+    key = (id(job), name)
+    if key not in memo:
+        memo[key] = factory()
+    return cast(T, memo[key])
+
 
 def get_dataset_size(dataset: Dataset) -> float:
     # calculate_size would mark file_size column as dirty
@@ -61,17 +112,41 @@ def input_size(job: Job) -> float:
     return calculate_dataset_total(job.input_datasets) / GIGABYTES
 
 
-def __unique_input_datasets(
-    datasets: list[JobToInputDatasetAssociation] | None,
-) -> dict[int, HistoryDatasetAssociation]:
-    # Galaxy records a `multiple="true"` data param under both `name` and `name1`, so the same
-    # dataset can be associated with a job more than once. Key on the underlying dataset to
-    # count each file only once, preserving the order the inputs were recorded in.
-    unique_datasets: dict[int, HistoryDatasetAssociation] = {}
-    for inp_ds in datasets or []:
-        if inp_ds.dataset and inp_ds.dataset.dataset:
-            unique_datasets.setdefault(inp_ds.dataset.dataset.id, inp_ds.dataset)
-    return unique_datasets
+class InputDatasetIndex:
+    """
+    A job's input datasets, grouped by parameter base name (the recorded name with any trailing
+    digits removed), so that the datasets of a parameter can be looked up without scanning and
+    pattern matching every input of the job.
+    """
+
+    def __init__(self, datasets: list[JobToInputDatasetAssociation] | None):
+        self.all_datasets = self.unique(datasets)
+        self.by_base_name: dict[str, list[JobToInputDatasetAssociation]] = defaultdict(list)
+        for inp_ds in datasets or []:
+            self.by_base_name[(inp_ds.name or "").rstrip(string.digits)].append(inp_ds)
+        self.by_param_name: dict[str, list[HistoryDatasetAssociation]] = {}
+
+    @staticmethod
+    def unique(datasets: list[JobToInputDatasetAssociation] | None) -> list[HistoryDatasetAssociation]:
+        # Galaxy records a `multiple="true"` data param under both `name` and `name1`, so the same
+        # dataset can be associated with a job more than once. Key on the underlying dataset to
+        # count each file only once, preserving the order the inputs were recorded in.
+        unique_datasets: dict[int, HistoryDatasetAssociation] = {}
+        for inp_ds in datasets or []:
+            if inp_ds.dataset and inp_ds.dataset.dataset:
+                unique_datasets.setdefault(inp_ds.dataset.dataset.id, inp_ds.dataset)
+        return list(unique_datasets.values())
+
+    def lookup(self, param_name: str) -> list[HistoryDatasetAssociation]:
+        datasets = self.by_param_name.get(param_name)
+        if datasets is None:
+            # matches the recorded names `param_name` followed by zero or more digits
+            base_name = param_name.rstrip(string.digits)
+            candidates = self.by_base_name.get(base_name, [])
+            if base_name != param_name:
+                candidates = [inp_ds for inp_ds in candidates if (inp_ds.name or "").startswith(param_name)]
+            datasets = self.by_param_name[param_name] = self.unique(candidates)
+        return datasets
 
 
 def get_input_datasets(job: Job, param_name: str | None = None) -> list[HistoryDatasetAssociation]:
@@ -87,11 +162,10 @@ def get_input_datasets(job: Job, param_name: str | None = None) -> list[HistoryD
     Note that `param_name` is the fully prefixed parameter name, so a data param nested in a
     conditional is addressed as e.g. `cond|input`.
     """
-    datasets = job.input_datasets
-    if param_name is not None:
-        pattern = re.compile(rf"^{re.escape(param_name)}\d*$")
-        datasets = [inp_ds for inp_ds in datasets or [] if pattern.match(inp_ds.name or "")]
-    return list(__unique_input_datasets(datasets).values())
+    index = _memoize_for_job(job, "input_dataset_index", lambda: InputDatasetIndex(job.input_datasets))
+    if param_name is None:
+        return list(index.all_datasets)
+    return list(index.lookup(param_name))
 
 
 def get_input_dataset(job: Job, param_name: str) -> HistoryDatasetAssociation | None:
@@ -141,11 +215,44 @@ def _weighted_draw(items: list[T], weights: list[float], k: int) -> list[T]:
     return random.sample(items, k=k)
 
 
+@functools.lru_cache(maxsize=256)
+def _weighted_shuffle_scales(
+    weights: tuple[float, ...],
+) -> tuple[tuple[tuple[int, float], ...], tuple[int, ...]] | None:
+    """Precompute a weighted shuffle of a destination set, keyed by the destination weights.
+
+    Returns the index and ``1 / weight`` scale of each positively weighted item, which are ordered
+    by exponentially distributed keys with that scale as mean (Efraimidis-Spirakis), yielding a
+    weighted permutation without replacement. Items with a weight of zero are returned separately,
+    to be placed last. Returns None when the shuffle should be unweighted, following the same rules
+    as ``_weighted_draw``.
+    """
+    weights = tuple(max(w, 0) for w in weights)
+    if any(w != 1 for w in weights) and any(w > 0 for w in weights):
+        return (
+            tuple((i, 1 / w) for i, w in enumerate(weights) if w > 0),
+            tuple(i for i, w in enumerate(weights) if w <= 0),
+        )
+    return None
+
+
 def weighted_random_sampling(destinations: list[Destination]) -> list[Destination]:
+    """Shuffle *destinations*, biased by each destination's optional ``params.weight``.
+
+    Every destination appears exactly once in the result, with higher weighted destinations more
+    likely to be placed first.
+    """
     if not destinations:
         return []
-    weights = [(d.params or {}).get("weight", 1) for d in destinations]
-    return _weighted_draw(destinations, weights, k=len(destinations))
+    shuffle = _weighted_shuffle_scales(tuple((d.params or {}).get("weight", 1) for d in destinations))
+    if shuffle is None:
+        return random.sample(destinations, k=len(destinations))
+    weighted, unweighted = shuffle
+    keys = {i: -math.log(1.0 - random.random()) * scale for i, scale in weighted}
+    order = sorted(keys, key=keys.__getitem__)
+    if unweighted:
+        order += random.sample(unweighted, k=len(unweighted))
+    return [destinations[i] for i in order]
 
 
 def weighted_choice(items: list[WeightedT]) -> WeightedT:
@@ -162,38 +269,69 @@ def weighted_choice(items: list[WeightedT]) -> WeightedT:
     return _weighted_draw(items, [item.get("weight", 1) for item in items], k=1)[0]
 
 
-def __get_keys_from_dict(dl: Any, keys_list: list[str]) -> None:
-    # This function builds a list using the keys from nested dictionaries
-    # (copied from galaxyproject/galaxy lib/galaxy/jobs/dynamic_tool_destination.py)
-    if isinstance(dl, dict):
-        keys_list.extend(dl.keys())
-        for x in dl.values():
-            __get_keys_from_dict(x, keys_list)
-    elif isinstance(dl, list):
-        for x in dl:
-            __get_keys_from_dict(x, keys_list)
+@dataclass(frozen=True)
+class JobArgsMatcher:
+    """
+    A `job_args_match` argument dict, precompiled into the paths of its leaf values so that the
+    nested dicts don't have to be walked again on every call.
+    """
+
+    paths: tuple[tuple[tuple[str, ...], Any], ...]
+
+    def matches(self, options: Any) -> bool:
+        if not self.paths:
+            return False
+        for path, expected in self.paths:
+            value = options
+            for key in path:
+                if not isinstance(value, Mapping) or key not in value:
+                    return False
+                value = value[key]
+            if value != expected:
+                return False
+        return True
+
+
+def __flatten_job_args(args: Mapping[str, Any], prefix: tuple[str, ...] = ()) -> Iterator[tuple[tuple[str, ...], Any]]:
+    for key, value in args.items():
+        path = prefix + (key,)
+        if isinstance(value, dict) and value:
+            yield from __flatten_job_args(value, path)
+        else:
+            yield path, value
+
+
+def compile_job_args(args: dict[str, Any]) -> JobArgsMatcher:
+    """
+    Precompile a dict of arguments for `job_args_match`. Nested dicts are matched key by key, so
+    `{"input_opts": {"db_selector": "db"}}` matches a job whose `input_opts|db_selector` param is `db`.
+    Literal argument dicts in code blocks are compiled once by the loader, so this is only needed
+    for dicts that are built at runtime.
+    """
+    return JobArgsMatcher(paths=tuple(__flatten_job_args(args)))
 
 
-def job_args_match(job: Job, app: UniverseApplication, args: dict[str, Any] | None) -> bool:
-    # Check whether a dictionary of arguments matches a job's parameters.  This code is
-    # from galaxyproject/galaxy lib/galaxy/jobs/dynamic_tool_destination.py
-    if not args or not isinstance(args, dict):
+def job_param_values(job: Job, app: UniverseApplication) -> dict[str, Any]:
+    """
+    Return a job's parameter values. Deserializing the tool state is expensive, so the result is
+    memoized for the duration of a mapping.
+    """
+    return cast(
+        dict[str, Any],
+        _memoize_for_job(job, "param_values", lambda: job.get_param_values(app)),  # type: ignore[no-untyped-call]
+    )
+
+
+def job_args_match(job: Job, app: UniverseApplication, args: dict[str, Any] | JobArgsMatcher | None) -> bool:
+    # Check whether a dictionary of arguments matches a job's parameters. Adapted from galaxyproject/galaxy
+    # lib/galaxy/jobs/dynamic_tool_destination.py
+    if isinstance(args, JobArgsMatcher):
+        matcher = args
+    elif args and isinstance(args, dict):
+        matcher = compile_job_args(args)
+    else:
         return False
-    options = job.get_param_values(app)  # type: ignore[no-untyped-call]
-    matched = True
-    # check if the args in the config file are available
-    for arg in args:
-        arg_dict = {arg: args[arg]}
-        arg_keys_list: list[str] = []
-        __get_keys_from_dict(arg_dict, arg_keys_list)
-        try:
-            options_value = reduce(dict.__getitem__, arg_keys_list, options)
-            arg_value = reduce(dict.__getitem__, arg_keys_list, arg_dict)
-            if arg_value != options_value:
-                matched = False
-        except KeyError:
-            matched = False
-    return matched
+    return matcher.matches(job_param_values(job, app))
 
 
 def concurrent_job_count_for_tool(
@@ -233,7 +371,7 @@ def __compare_tool_versions(
 ) -> bool | None:
     if versionA is None or versionB is None:
         return None
-    return comparator(parse_version(versionA), parse_version(versionB))
+    return comparator(parse_tool_version(versionA), parse_tool_version(versionB))
 
 
 def tool_version_eq(tool: GalaxyTool, version: str | None) -> bool | None:
@@ -274,3 +412,19 @@ def get_dataset_attributes(
         for i in datasets or {}
         if i.dataset and i.dataset.dataset
     }
+
+
+def run_concurrently(calls: Iterable[Callable[[], T]]) -> list[T]:
+    """
+    Run independent, blocking calls, such as database queries for several candidate destinations, concurrently on a
+    bounded thread pool, and return their results in order. If any call raises an exception, the first one in order
+    is raised once all calls have finished. Calls made from within the pool are run one after another, so that
+    nested calls can't exhaust the pool.
+    """
+    calls = list(calls)
+    if len(calls) < 2 or getattr(_HELPER_THREAD, "active", False):
+        return [call() for call in calls]
+    # each call sees the mapping's context, such as its job memo
+    futures = [_helper_pool().submit(contextvars.copy_context().run, call) for call in calls]
+    wait(futures)
+    return [future.result() for future in futures]
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 import ast
+import copy
 import functools
 import logging
-from collections.abc import Callable
+from collections import defaultdict
+from collections.abc import Callable, Iterator, Mapping, Sequence
 from types import CodeType
 from typing import Any, TypeVar, cast
 
 from . import helpers, util
-from .entities import Entity, GlobalConfig, TPVConfig
+from .conditions import Interval, IntervalIndex, parse_threshold_condition
+from .entities import Entity, GlobalConfig, LazyEntities, Tool, ToolVersionRange, TPVConfig
 from .evaluator import TPVCodeEvaluator
 
 log = logging.getLogger(__name__)
@@ -21,31 +24,180 @@ class InvalidParentException(Exception):
     pass
 
 
+class JobArgsPrecompiler(ast.NodeTransformer):
+    """
+    Replaces literal argument dicts passed to `helpers.job_args_match` with precompiled matchers,
+    so that the dict is not rebuilt and walked again every time the code block is evaluated.
+    """
+
+    CONSTANT_TYPES = (str, int, float, bool, type(None))
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        self.generic_visit(node)
+        func = node.func
+        if not (
+            isinstance(func, ast.Attribute)
+            and func.attr == "job_args_match"
+            and isinstance(func.value, ast.Name)
+            and func.value.id == "helpers"
+        ):
+            return node
+        if len(node.args) == 3:
+            node.args[2] = self.precompile(node.args[2])
+        for keyword in node.keywords:
+            if keyword.arg == "args":
+                keyword.value = self.precompile(keyword.value)
+        return node
+
+    def precompile(self, node: ast.expr) -> ast.expr:
+        if not isinstance(node, ast.Dict):
+            return node
+        try:
+            args = ast.literal_eval(node)
+        except (ValueError, TypeError):
+            return node
+        matcher = helpers.compile_job_args(args)
+        # only values that can be embedded as constants in a code object are precompiled
+        if not all(
+            isinstance(part, self.CONSTANT_TYPES) for path, expected in matcher.paths for part in (*path, expected)
+        ):
+            return node
+        precompiled = ast.Call(
+            func=ast.Attribute(value=ast.Name(id="helpers", ctx=ast.Load()), attr="JobArgsMatcher", ctx=ast.Load()),
+            # tuples of constants are valid constants, although typeshed does not allow for them
+            args=[ast.Constant(value=matcher.paths)],  # type: ignore[arg-type]
+            keywords=[],
+        )
+        return ast.fix_missing_locations(ast.copy_location(precompiled, node))
+
+
+class CodeBlockFunction:
+    """
+    A code block compiled into a function, whose parameters are the names that the block reads from the evaluation
+    context, so that they are passed in directly and looked up as fast locals, instead of through a globals dict that
+    is rebuilt for every evaluation. A separate function is compiled for each combination of referenced names that
+    are present in the context, so that names that are missing from the context are still resolved from the module's
+    globals and builtins, as they would be if the block was executed as a module.
+    """
+
+    FUNCTION_NAME = "tpv_code_block"
+
+    def __init__(
+        self,
+        block: ast.Module,
+        exec_only: bool,
+        extra_params: tuple[str, ...] = (),
+        constants: dict[str, Any] | None = None,
+    ):
+        self.block = block
+        self.exec_only = exec_only
+        # parameters that are passed in by the caller, rather than read from the context
+        self.extra_params = extra_params
+        # globals that are defined for the block, rather than read from the context
+        self.constants = constants or {}
+        # referenced names, in order of appearance
+        names: dict[str, None] = {}
+        for node in ast.walk(block):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+                names[node.id] = None
+        # helpers always refer to the helpers module, even if the context has a variable of the same name
+        names.pop("helpers", None)
+        for name in (*extra_params, *self.constants):
+            names.pop(name, None)
+        # input_size is computed from the job, and only if it is referenced
+        self.uses_input_size = "input_size" in names
+        names.pop("input_size", None)
+        self.names = tuple(names)
+        self.functions: dict[tuple[str, ...], Callable[..., Any]] = {}
+
+    def compile(self, params: tuple[str, ...]) -> Callable[..., Any]:
+        template = ast.parse(f"def {self.FUNCTION_NAME}({', '.join(self.extra_params + params)}): pass", mode="exec")
+        func = cast(ast.FunctionDef, template.body[0])
+        body = copy.deepcopy(self.block.body)
+        if not self.exec_only:
+            # assumes last node is an expression
+            last_stmt = body.pop()
+            assert isinstance(last_stmt, ast.Expr)
+            body.append(ast.copy_location(ast.Return(value=last_stmt.value), last_stmt))
+        func.body = body or [ast.Pass()]
+        namespace = {**globals(), **self.constants}
+        exec(compile(ast.fix_missing_locations(template), "<string>", mode="exec"), namespace)
+        return cast(Callable[..., Any], namespace[self.FUNCTION_NAME])
+
+    def __call__(self, context: dict[str, Any], *extra_args: Any) -> Any:
+        params = tuple(name for name in self.names if name in context)
+        args = [context[name] for name in params]
+        if self.uses_input_size:
+            params += ("input_size",)
+        function = self.functions.get(params)
+        if function is None:
+            function = self.functions.setdefault(params, self.compile(params))
+        if self.uses_input_size:
+            args.append(helpers.input_size(context["job"]))
+        return function(*extra_args, *args)
+
+
+class RuleConditionSubstituter(ast.NodeTransformer):
+    """
+    Substitutes a rule's condition into the statement that yields its outcome in a fused rule condition evaluator.
+    """
+
+    PLACEHOLDER = "_tpv_condition"
+
+    def __init__(self, condition: ast.expr):
+        self.condition = condition
+
+    def visit_Name(self, node: ast.Name) -> ast.expr:
+        return self.condition if node.id == self.PLACEHOLDER else node
+
+
 class TPVConfigLoader(TPVCodeEvaluator):
 
-    def __init__(self, tpv_config: dict[Any, Any], parent: TPVConfigLoader | None = None):
+    # parameters of fused rule condition evaluators, for the outcomes of conditions that are already known, and a
+    # callback that evaluates a condition that could not be fused
+    RULE_CONDITION_PARAMS = ("_tpv_known", "_tpv_evaluate")
+
+    def __init__(self, tpv_config: dict[Any, Any], parent: TPVConfigLoader | None = None, lazy: bool = False):
         self._cached_compile_code_block: Callable[[str, bool, bool], tuple[CodeType, CodeType | None]] = (
             functools.lru_cache(maxsize=None)(self.__compile_code_block)
         )
+        self._cached_compile_code_function: Callable[[str, bool, bool], CodeBlockFunction] = functools.lru_cache(
+            maxsize=None
+        )(self.__compile_code_function)
+        self._cached_compile_rule_conditions: Callable[[tuple[str, ...]], CodeBlockFunction] = functools.lru_cache(
+            maxsize=None
+        )(self.__compile_rule_conditions)
+        self.lazy = lazy
+        raw_tools: Mapping[str, Any] = {}
+        if lazy:
+            # tools are kept as raw mappings, and only validated and compiled when first matched
+            raw_tools = tpv_config.get("tools") or {}
+            tpv_config = {**tpv_config, "tools": {}}
         tpv_config["evaluator"] = self
         self.config = TPVConfig.model_validate(tpv_config)
         if parent:
             self.merge_config(parent.config)
         self.process_entities(self.config)
+        if lazy:
+            self.config.tools = cast(dict[str, Tool], self.lazy_tools(raw_tools, parent.config.tools if parent else {}))
 
     def compile_code_block(
         self, code: str, as_f_string: bool = False, exec_only: bool = False
     ) -> tuple[CodeType, CodeType | None]:
         return self._cached_compile_code_block(code, as_f_string, exec_only)
 
-    def __compile_code_block(
-        self, code: str, as_f_string: bool = False, exec_only: bool = False
-    ) -> tuple[CodeType, CodeType | None]:
+    @staticmethod
+    def parse_code_block(code: str, as_f_string: bool = False) -> ast.Module:
         if as_f_string:
             code_str = "f'''" + str(code) + "'''"
         else:
             code_str = str(code)
-        block = ast.parse(code_str, mode="exec")
+        return cast(ast.Module, JobArgsPrecompiler().visit(ast.parse(code_str, mode="exec")))
+
+    def __compile_code_block(
+        self, code: str, as_f_string: bool = False, exec_only: bool = False
+    ) -> tuple[CodeType, CodeType | None]:
+        block = self.parse_code_block(code, as_f_string)
         if exec_only:
             return compile(block, "<string>", mode="exec"), None
         else:
@@ -63,52 +215,155 @@ class TPVConfigLoader(TPVCodeEvaluator):
         as_f_string: bool = False,
         exec_only: bool = False,
     ) -> Any:
-        exec_block, eval_block = self.compile_code_block(code, as_f_string=as_f_string, exec_only=exec_only)
-        locals = dict(globals())
-        locals.update(context)
-        locals.update(
-            {
-                "helpers": helpers,
-                # Don't unnecessarily compute input_size unless it's referred to
-                "input_size": (helpers.input_size(context["job"]) if "input_size" in str(code) else 0),
-            }
+        return self.compile_code_function(code, as_f_string=as_f_string, exec_only=exec_only)(context)
+
+    def compile_code_function(self, code: str, as_f_string: bool = False, exec_only: bool = False) -> CodeBlockFunction:
+        return self._cached_compile_code_function(code, as_f_string, exec_only)
+
+    def __compile_code_function(
+        self, code: str, as_f_string: bool = False, exec_only: bool = False
+    ) -> CodeBlockFunction:
+        # the block is compiled as a module first, so that statements that are only valid in a function, such as
+        # return, are still rejected
+        self.compile_code_block(code, as_f_string=as_f_string, exec_only=exec_only)
+        return CodeBlockFunction(self.parse_code_block(code, as_f_string), exec_only=exec_only)
+
+    def evaluate_rule_conditions(
+        self, conditions: Sequence[str], context: dict[str, Any], known: Sequence[bool | None]
+    ) -> Iterator[bool]:
+        """
+        Evaluates all conditions through a single generator compiled for the combination of conditions, so that
+        conditions are evaluated in order, and lazily, without a separate evaluation round trip for each condition.
+        """
+        conditions = tuple(conditions)
+        if not conditions:
+            return iter(())
+        return cast(
+            Iterator[bool],
+            self.compile_rule_conditions(conditions)(
+                context, known, lambda index: bool(self.eval_code_block(conditions[index], context))
+            ),
+        )
+
+    def compile_rule_conditions(self, conditions: tuple[str, ...]) -> CodeBlockFunction:
+        return self._cached_compile_rule_conditions(conditions)
+
+    def __compile_rule_conditions(self, conditions: tuple[str, ...]) -> CodeBlockFunction:
+        blocks = []
+        for condition in conditions:
+            self.compile_code_block(condition)
+            blocks.append(self.parse_code_block(condition))
+        # conditions that compare the same variable to numeric thresholds are evaluated together through an interval
+        # index, when that variable is first needed
+        thresholds: dict[str, dict[int, Interval]] = defaultdict(dict)
+        for index, block in enumerate(blocks):
+            statement = block.body[0]
+            threshold = (
+                parse_threshold_condition(statement.value)
+                if len(block.body) == 1 and isinstance(statement, ast.Expr)
+                else None
+            )
+            if threshold and threshold[0] != "entity":
+                thresholds[threshold[0]][index] = threshold[1]
+        indexes: list[IntervalIndex] = []
+        # the position of the index and the variable for each indexed condition
+        indexed: dict[int, tuple[int, str]] = {}
+        for name, intervals in thresholds.items():
+            if len(intervals) > 1:
+                indexed.update(dict.fromkeys(intervals, (len(indexes), name)))
+                indexes.append(IntervalIndex(intervals))
+        body: list[ast.stmt] = []
+        queried: set[int] = set()
+        for index, block in enumerate(blocks):
+            statement = block.body[0]
+            if index in indexed:
+                position, name = indexed[index]
+                if position not in queried:
+                    queried.add(position)
+                    body.extend(ast.parse(f"_tpv_matched_{position} = _tpv_indexes[{position}].matching({name})").body)
+                body.extend(
+                    ast.parse(
+                        f"yield _tpv_known[{index}] if _tpv_known[{index}] is not None"
+                        f" else {index} in _tpv_matched_{position}"
+                    ).body
+                )
+            elif (
+                len(block.body) == 1
+                and isinstance(statement, ast.Expr)
+                # conditions that refer to the entity are evaluated separately, as earlier rules may replace it, and
+                # conditions that assign names would leak them into the conditions that follow
+                and not any(
+                    isinstance(node, ast.NamedExpr) or (isinstance(node, ast.Name) and node.id == "entity")
+                    for node in ast.walk(statement)
+                )
+            ):
+                template = ast.parse(
+                    f"yield _tpv_known[{index}] if _tpv_known[{index}] is not None else bool(_tpv_condition)"
+                )
+                body.extend(RuleConditionSubstituter(statement.value).visit(template).body)
+            else:
+                body.extend(
+                    ast.parse(
+                        f"yield _tpv_known[{index}] if _tpv_known[{index}] is not None else _tpv_evaluate({index})"
+                    ).body
+                )
+        return CodeBlockFunction(
+            ast.Module(body=body, type_ignores=[]),
+            exec_only=True,
+            extra_params=self.RULE_CONDITION_PARAMS,
+            constants={"_tpv_indexes": indexes},
         )
-        exec(exec_block, locals)
-        if eval_block:
-            return eval(eval_block, locals)
-        else:
-            return None
 
     @staticmethod
     def process_inheritance(
-        entity_list: dict[str, EntityType],
+        entity_list: Mapping[str, EntityType],
         entity: EntityType,
-        visited: set[str] | None = None,
+        resolved: dict[str, EntityType] | None = None,
     ) -> EntityType:
-        if visited is None:
-            visited = set()
+        """
+        Resolve an entity's inheritance chain. Ancestors resolved along the way are memoized in `resolved` by id, so
+        that an ancestor shared by many entities is only resolved once.
+        """
+        if resolved is None:
+            resolved = {}
 
-        if entity.inherits:
-            if entity.inherits in visited:
-                raise InvalidParentException(f"Cycle detected in inheritance chain for entity: {entity.id}")
-            parent_entity = entity_list.get(entity.inherits)
+        # walk up the chain until an ancestor that is already resolved, or one without a parent
+        chain = [entity]
+        chain_ids = {entity.id}
+        parent: EntityType | None = None
+        while chain[-1].inherits:
+            parent_id = chain[-1].inherits
+            if parent_id in resolved:
+                parent = resolved[parent_id]
+                break
+            if parent_id in chain_ids:
+                path = " -> ".join([e.id for e in chain] + [parent_id])
+                raise InvalidParentException(f"Cycle detected in inheritance chain for entity: {entity.id} ({path})")
+            parent_entity = entity_list.get(parent_id)
             if not parent_entity:
                 raise InvalidParentException(
-                    f"The specified parent: {entity.inherits} for entity: {entity.id} does not exist"
+                    f"The specified parent: {parent_id} for entity: {chain[-1].id} does not exist"
                 )
-            visited.add(entity.inherits)
-            return entity.inherit(TPVConfigLoader.process_inheritance(entity_list, parent_entity, visited))
+            chain.append(parent_entity)
+            chain_ids.add(parent_id)
+
+        # then resolve the chain top down, so that each entity inherits from its already resolved parent
+        for ancestor in reversed(chain):
+            parent = ancestor.inherit(parent) if parent else ancestor
+            resolved[ancestor.id] = parent
         # do not process default inheritance here, only at runtime, as multiple can cause default inheritance
         # to override later matches.
-        return entity
+        return cast(EntityType, parent)
 
     @staticmethod
     def recompute_inheritance(entities: dict[str, EntityType]) -> None:
+        resolved: dict[str, EntityType] = {}
         for key, entity in entities.items():
-            entities[key] = TPVConfigLoader.process_inheritance(entities, entity)
+            entities[key] = resolved.get(key) or TPVConfigLoader.process_inheritance(entities, entity, resolved)
 
     def process_entities(self, tpv_config: TPVConfig) -> None:
-        self.recompute_inheritance(tpv_config.tools)
+        if not self.lazy:
+            self.recompute_inheritance(tpv_config.tools)
         self.recompute_inheritance(tpv_config.users)
         self.recompute_inheritance(tpv_config.roles)
         self.recompute_inheritance(tpv_config.destinations)
@@ -118,6 +373,12 @@ class TPVConfigLoader(TPVCodeEvaluator):
             self.config.global_config.default_inherits = (
                 self.config.global_config.default_inherits or parent_globals.default_inherits
             )
+            if self.config.global_config.concurrent_destinations is None:
+                self.config.global_config.concurrent_destinations = parent_globals.concurrent_destinations
+            if self.config.global_config.deferral_ttl is None:
+                self.config.global_config.deferral_ttl = parent_globals.deferral_ttl
+            if self.config.global_config.capacity_feed is None:
+                self.config.global_config.capacity_feed = parent_globals.capacity_feed
             merged_context = dict(parent_globals.context or {})
             merged_context.update(self.config.global_config.context)
             self.config.global_config.context = merged_context
@@ -136,13 +397,17 @@ class TPVConfigLoader(TPVCodeEvaluator):
         """
 
         merged: dict[str, EntityType] = dict(entities_parent)
+        # merged only differs from entities_parent in entities that are overridden in entities_new, so inheritance
+        # chains can be resolved against a single combined view, built once, with resolved ancestors shared
+        combined: dict[str, EntityType] = {**entities_parent, **entities_new}
+        resolved: dict[str, EntityType] = {}
 
         for entity in entities_new.values():
             prior_definition = merged.get(entity.id)
 
             if prior_definition:
                 # resolve this entity's inheritance chain
-                resolved_entity = TPVConfigLoader.process_inheritance({**merged, **entities_new}, entity)
+                resolved_entity = TPVConfigLoader.process_inheritance(combined, entity, resolved)
                 # drop any existing entry so this later definition is reinserted last,
                 # preserving “last config wins” when dict order matters.
                 merged.pop(entity.id, None)
@@ -155,18 +420,90 @@ class TPVConfigLoader(TPVCodeEvaluator):
 
         return merged
 
+    def lazy_tools(self, raw_tools: Mapping[str, Any], parent_tools: Mapping[str, Tool]) -> LazyEntities[Tool]:
+        """
+        Lazily merge raw tool entries with the parent's tools. Each tool is merged and has its inheritance resolved on
+        first access, in the same way as inherit_parent_entities followed by recompute_inheritance would do eagerly.
+        """
+        new_tools: LazyEntities[Tool] = LazyEntities(
+            raw_tools, lambda key: Tool(**{**(raw_tools[key] or {}), "id": key, "evaluator": self})
+        )
+        combined: LazyEntities[Tool] = LazyEntities(
+            [*parent_tools, *raw_tools], lambda key: new_tools[key] if key in new_tools else parent_tools[key]
+        )
+        resolved_combined: dict[str, Tool] = {}
+
+        def merge_tool(key: str) -> Tool:
+            if key not in new_tools:
+                return parent_tools[key]
+            if key in parent_tools:
+                return self.process_inheritance(combined, new_tools[key], resolved_combined).inherit(parent_tools[key])
+            return new_tools[key]
+
+        # overriding entries are ordered after the parent's remaining entries, as in inherit_parent_entities
+        keys = [key for key in parent_tools if key not in raw_tools] + list(raw_tools)
+        merged = LazyEntities(keys, merge_tool)
+        resolved: dict[str, Tool] = {}
+
+        def resolve_tool(key: str) -> Tool:
+            return resolved.get(key) or self.process_inheritance(merged, merged[key], resolved)
+
+        tools = LazyEntities(keys, resolve_tool)
+        parent_inherits = self.get_tool_inherits(parent_tools)
+        for key in keys:
+            # an overriding entry keeps the parent's declared parent, unless it declares its own
+            raw_inherits = (raw_tools[key] or {}).get("inherits") if key in raw_tools else None
+            tools.inherits[key] = raw_inherits or parent_inherits.get(key)
+
+        # only tools that declare a version range, override one that does, or inherit one, need to be materialized
+        # up front
+        ranged = {key for key, raw in raw_tools.items() if raw and raw.get("version_range")}
+        ranged.update(self.get_tool_version_ranges(parent_tools))
+        inherits_range: dict[str, bool] = {}
+        for key in keys:
+            chain: list[str] = []
+            ancestor: str | None = key
+            while ancestor is not None and ancestor not in inherits_range and ancestor not in chain:
+                chain.append(ancestor)
+                ancestor = tools.inherits.get(ancestor)
+            # a cycle or missing parent is left to be reported when the tool is first matched
+            has_range = inherits_range.get(ancestor, False) if ancestor is not None else False
+            for chain_key in reversed(chain):
+                has_range = has_range or chain_key in ranged
+                inherits_range[chain_key] = has_range
+            if inherits_range[key]:
+                version_range = tools[key].version_range
+                if version_range:
+                    tools.version_ranges[key] = version_range
+        return tools
+
+    @staticmethod
+    def get_tool_version_ranges(tools: Mapping[str, Tool]) -> dict[str, ToolVersionRange]:
+        if isinstance(tools, LazyEntities):
+            return tools.version_ranges
+        return {key: tool.version_range for key, tool in tools.items() if tool.version_range}
+
+    @staticmethod
+    def get_tool_inherits(tools: Mapping[str, Tool]) -> dict[str, str | None]:
+        if isinstance(tools, LazyEntities):
+            return tools.inherits
+        return {key: tool.inherits for key, tool in tools.items()}
+
     def merge_config(self, parent_config: TPVConfig) -> None:
         self.inherit_globals(parent_config.global_config)
-        self.config.tools = self.inherit_parent_entities(parent_config.tools, self.config.tools)
+        if not self.lazy:
+            self.config.tools = self.inherit_parent_entities(parent_config.tools, self.config.tools)
         self.config.users = self.inherit_parent_entities(parent_config.users, self.config.users)
         self.config.roles = self.inherit_parent_entities(parent_config.roles, self.config.roles)
         self.config.destinations = self.inherit_parent_entities(parent_config.destinations, self.config.destinations)
 
     @staticmethod
-    def from_url_or_path(url_or_path: str, parent: TPVConfigLoader | None = None) -> TPVConfigLoader:
+    def from_url_or_path(
+        url_or_path: str, parent: TPVConfigLoader | None = None, lazy: bool = False
+    ) -> TPVConfigLoader:
         tpv_config = util.load_yaml_from_url_or_path(url_or_path)
         try:
-            return TPVConfigLoader(tpv_config, parent=parent)
+            return TPVConfigLoader(tpv_config, parent=parent, lazy=lazy)
         except Exception as e:
             log.exception(f"Error loading TPV config: {url_or_path}")
             raise e
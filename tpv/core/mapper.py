@@ -1,24 +1,35 @@
+import contextvars
 import functools
 import logging
 import re
-from collections.abc import Mapping
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, TypeVar, cast
 
-from cachetools import Cache, cached
+from cachetools import Cache, LRUCache, TTLCache, cached
 from galaxy.app import UniverseApplication
 from galaxy.jobs import JobDestination, JobWrapper, ResubmitConfigDict
-from galaxy.jobs.mapper import JobNotReadyException
+from galaxy.jobs.mapper import JobMappingException, JobNotReadyException
 from galaxy.model import Job
 from galaxy.model import User as GalaxyUser
 from galaxy.tools import Tool as GalaxyTool
 
+from . import helpers
+from .capacity import CapacityFeed, open_capacity_feed
+from .conditions import RuleConditionCache, referenced_names
 from .entities import (
     Destination,
     Entity,
     EntityWithRules,
+    IncompatibleTagsException,
     Role,
     SchedulingTags,
+    TagType,
     Tool,
+    ToolVersionRange,
     TryNextDestinationOrFail,
     TryNextDestinationOrWait,
     User,
@@ -31,8 +42,134 @@ log = logging.getLogger(__name__)
 
 EntityType = TypeVar("EntityType", bound=Entity)
 
+DESTINATION_POOL_SIZE = 8
+_DESTINATION_POOL: ThreadPoolExecutor | None = None
+_DESTINATION_POOL_LOCK = threading.Lock()
+_DESTINATION_THREAD = threading.local()
+
+
+def _destination_pool() -> ThreadPoolExecutor:
+    global _DESTINATION_POOL
+    if _DESTINATION_POOL is None:
+        with _DESTINATION_POOL_LOCK:
+            if _DESTINATION_POOL is None:
+                _DESTINATION_POOL = ThreadPoolExecutor(
+                    max_workers=DESTINATION_POOL_SIZE,
+                    thread_name_prefix="tpv-destination",
+                    initializer=lambda: setattr(_DESTINATION_THREAD, "active", True),
+                )
+    return _DESTINATION_POOL
+
+
+class DestinationTagIndex:
+    """
+    Posting sets of destination keys for each tag, by scheduling category, so that the destinations whose tags are
+    compatible with an entity's tags can be found with set operations, instead of by matching every destination.
+    """
+
+    def __init__(self, destinations: Mapping[str, Destination]):
+        self.tags = {key: destination.tpv_dest_tags for key, destination in destinations.items()}
+        # destinations that have a tag in any category
+        self.tagged: dict[str, set[str]] = defaultdict(set)
+        self.postings: dict[TagType, dict[str, set[str]]] = {tag_type: defaultdict(set) for tag_type in TagType}
+        for key, destination in destinations.items():
+            for tag in destination.tpv_dest_tags.tags:
+                self.tagged[tag.value].add(key)
+                self.postings[tag.tag_type][tag.value].add(key)
+
+    def candidates(self, tags: SchedulingTags) -> set[str]:
+        """
+        The keys of destinations whose tags match the given tags, as SchedulingTags.match would determine.
+        """
+        candidates = set(self.tags)
+        # the destination must have every tag the entity requires, and none that it rejects
+        for tag in tags.require or []:
+            candidates &= self.tagged.get(tag, set())
+        for tag in tags.reject or []:
+            candidates -= self.tagged.get(tag, set())
+        # and the entity must have every tag the destination requires, and none that it rejects
+        tag_values = set(tags.all_tag_values())
+        for tag, keys in self.postings[TagType.REQUIRE].items():
+            if tag not in tag_values:
+                candidates -= keys
+        for tag in tag_values:
+            candidates -= self.postings[TagType.REJECT].get(tag, set())
+        return candidates
+
+
+class DestinationDeferrals:
+    """
+    Destinations that recently deferred a job by raising TryNextDestinationOrWait, keyed on the destination and the
+    signature of the entity it was combined with. Galaxy retries deferred jobs on every handler loop, so jobs with
+    the same signature are deferred again without evaluating the destination's rules, until the deferral expires.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 10000, timer: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.cache: TTLCache[tuple[Any, ...], str] = TTLCache(maxsize=maxsize, ttl=ttl, timer=timer)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(destination: Destination, entity: Entity) -> tuple[Any, ...]:
+        # the entity id records the tool, user, roles and rules that were combined to create it
+        return (destination.id, entity.id, entity.cores, entity.mem, entity.gpus)
+
+    def get(self, key: tuple[Any, ...]) -> str | None:
+        with self.lock:
+            return self.cache.get(key)
+
+    def set(self, key: tuple[Any, ...], reason: str) -> None:
+        with self.lock:
+            self.cache[key] = reason
+
+
+class MappingFailures:
+    """
+    A bounded cache of the messages of mapping failures that do not depend on the job, keyed on the tool, and the
+    user and roles that it was mapped for, so that jobs that can never be mapped fail immediately when Galaxy retries
+    them. The cache belongs to a mapper, and is discarded along with it when the config is reloaded.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self.cache: LRUCache[tuple[Any, ...], str] = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(tool: GalaxyTool, user: GalaxyUser | None) -> tuple[Any, ...]:
+        roles = (
+            frozenset(role.name for role in user.all_roles() if not role.deleted)  # type: ignore[no-untyped-call]
+            if user
+            else frozenset()
+        )
+        return (*RuleConditionCache.tool_key(tool), RuleConditionCache.user_key(user), roles)
+
+    def get(self, tool: GalaxyTool, user: GalaxyUser | None) -> str | None:
+        # most tools can be mapped, so the key is only computed once any failures have been recorded
+        if not self.cache:
+            return None
+        key = self.key(tool, user)
+        with self.lock:
+            return self.cache.get(key)
+
+    def set(self, tool: GalaxyTool, user: GalaxyUser | None, message: str) -> None:
+        key = self.key(tool, user)
+        with self.lock:
+            self.cache[key] = message
+
 
 class EntityToDestinationMapper(object):
+    """
+    Maps jobs to destinations. A mapper is shared by all of Galaxy's handler threads, so any state that it keeps
+    between jobs is either read only once loaded, or safe to update concurrently, and any state for a single job is
+    kept in that job's evaluation context.
+    """
+
+    CONDITION_CACHE_SIZE = 10000
+    DEFERRAL_CACHE_SIZE = 10000
+    MAPPING_FAILURE_CACHE_SIZE = 1000
+    RESOURCE_FIELDS = ("cores", "mem", "gpus", "min_cores", "min_mem", "min_gpus", "max_cores", "max_mem", "max_gpus")
+    # names in the evaluation context whose values do not change between jobs of the same tool, user and roles
+    JOB_INDEPENDENT_NAMES = frozenset({"tool", "user", "entity", "self", *RESOURCE_FIELDS})
 
     def __init__(self, loader: TPVConfigLoader):
         self.loader = loader
@@ -40,18 +177,44 @@ class EntityToDestinationMapper(object):
         self.destinations = self.config.destinations
         self.default_inherits = self.config.global_config.default_inherits
         self.global_context = self.config.global_config.context
-        self.lookup_tool_regex = functools.lru_cache(maxsize=None)(self.__compile_tool_regex)
+        # the number of top ranked destinations to evaluate concurrently, if any
+        self.concurrent_destinations = self.config.global_config.concurrent_destinations or 0
+        # destinations that recently deferred jobs, if deferrals are memoized
+        deferral_ttl = self.config.global_config.deferral_ttl
+        self.deferrals = DestinationDeferrals(deferral_ttl, maxsize=self.DEFERRAL_CACHE_SIZE) if deferral_ttl else None
+        self.tool_regexes: dict[str, re.Pattern[str]] = {}
+        # tool entries restricted to a version range, so that the right entry for a tool version is
+        # resolved while matching tool ids, instead of by a rule
+        self.tool_version_ranges: dict[str, ToolVersionRange] = loader.get_tool_version_ranges(self.config.tools)
         self._cache_inherit_matching_entities: Any = Cache(maxsize=0)
+        # outcomes of rule conditions that only depend on the tool or user, for the lifetime of this mapper
+        self.condition_cache = RuleConditionCache(maxsize=self.CONDITION_CACHE_SIZE)
+        # messages of failures to map tools that do not depend on the job
+        self.mapping_failures = MappingFailures(maxsize=self.MAPPING_FAILURE_CACHE_SIZE)
+        # the live capacity of destinations, as reported by an external agent, if configured
+        capacity_feed = self.config.global_config.capacity_feed
+        self.capacity = open_capacity_feed(capacity_feed) if capacity_feed else None
 
         def _cache_key_ignore_context(
-            context: dict[str, Any], entity_type: type[EntityType], entity_field: str, entity_name: str
-        ) -> tuple[type[EntityType], str, str]:
+            context: dict[str, Any],
+            entity_type: type[EntityType],
+            entity_field: str,
+            entity_name: str,
+            entity_version: str | None = None,
+        ) -> tuple[type[EntityType], str, str, str | None]:
             # ignore context in the key
-            return (entity_type, entity_field, entity_name)
+            return (entity_type, entity_field, entity_name, entity_version)
 
-        self.inherit_matching_entities = cached(self._cache_inherit_matching_entities, key=_cache_key_ignore_context)(
-            self.__inherit_matching_entities
-        )
+        self.inherit_matching_entities = cached(
+            self._cache_inherit_matching_entities, key=_cache_key_ignore_context, lock=threading.Lock()
+        )(self.__inherit_matching_entities)
+
+    def lookup_tool_regex(self, key: str) -> re.Pattern[str]:
+        # compiled patterns are read without a lock, and a pattern compiled by two threads at once is stored once
+        pattern = self.tool_regexes.get(key)
+        if pattern is None:
+            pattern = self.tool_regexes.setdefault(key, self.__compile_tool_regex(key))
+        return pattern
 
     def __compile_tool_regex(self, key: str) -> re.Pattern[str]:
         try:
@@ -79,10 +242,14 @@ class EntityToDestinationMapper(object):
         entity_list: dict[str, EntityType],
         entity_name: str,
         entity_type: type[EntityType],
+        entity_version: str | None = None,
     ) -> list[EntityType]:
         matches = self._get_common_inherits(context, entity_list, entity_type)
+        version_ranges = self.tool_version_ranges if issubclass(entity_type, Tool) else {}
         for key in entity_list.keys():
             if self.lookup_tool_regex(key).match(entity_name):
+                if key in version_ranges and not version_ranges[key].contains(entity_version):
+                    continue
                 match = entity_list[key]
                 if match.abstract:
                     from galaxy.jobs.mapper import JobMappingException
@@ -95,10 +262,17 @@ class EntityToDestinationMapper(object):
         return matches
 
     def __inherit_matching_entities(
-        self, context: dict[str, Any], entity_type: type[EntityType], entity_field: str, entity_name: str
+        self,
+        context: dict[str, Any],
+        entity_type: type[EntityType],
+        entity_field: str,
+        entity_name: str,
+        entity_version: str | None = None,
     ) -> EntityType | None:
         entity_list: dict[str, EntityType] = getattr(self.config, entity_field)
-        matches: list[EntityType] = self._find_entities_matching_id(context, entity_list, entity_name, entity_type)
+        matches: list[EntityType] = self._find_entities_matching_id(
+            context, entity_list, entity_name, entity_type, entity_version
+        )
         if matches:
             return self.inherit_entities(matches)
         else:
@@ -135,12 +309,22 @@ class EntityToDestinationMapper(object):
         return None
 
     def __apply_default_destination_inheritance(
-        self, entity_list: dict[str, Destination], context: Mapping[str, Any]
+        self, entity_list: dict[str, Destination], context: Mapping[str, Any], keys: Iterable[str] | None = None
     ) -> list[Destination]:
         inherited_defaults = self._get_common_inherits(context, entity_list, Destination)
+        destinations = [entity_list[key] for key in keys] if keys is not None else list(entity_list.values())
         if inherited_defaults:
-            return [self.inherit_entities([*inherited_defaults, entity]) for entity in entity_list.values()]
-        return list(entity_list.values())
+            return [self.inherit_entities([*inherited_defaults, entity]) for entity in destinations]
+        return destinations
+
+    @functools.cached_property
+    def destination_tag_index(self) -> DestinationTagIndex:
+        # destinations are indexed by their tags after inheriting defaults, which do not depend on the job. Threads
+        # that map the first jobs at the same time may each build the same index, but only one is kept
+        keys = list(self.destinations)
+        return DestinationTagIndex(
+            dict(zip(keys, self.__apply_default_destination_inheritance(self.destinations, {}, keys)))
+        )
 
     def inherit_entities(self, entities: list[EntityType]) -> EntityType:
         return functools.reduce(lambda a, b: b.inherit(a), entities)
@@ -169,7 +353,14 @@ class EntityToDestinationMapper(object):
                 f"cores={evaluated_entity.cores}, mem={evaluated_entity.mem}, gpus={evaluated_entity.gpus}",
             )
 
-        all_dests = self.__apply_default_destination_inheritance(destinations, context)
+        if explain or destinations is not self.destinations:
+            # every destination is matched when explaining, so that the reason for rejecting each one is reported
+            all_dests = self.__apply_default_destination_inheritance(destinations, context)
+        else:
+            candidates = self.destination_tag_index.candidates(evaluated_entity.tpv_tags)
+            all_dests = self.__apply_default_destination_inheritance(
+                destinations, context, [key for key in destinations if key in candidates]
+            )
         matches = []
         for dest in all_dests:
             if dest.matches(evaluated_entity, context):
@@ -182,14 +373,17 @@ class EntityToDestinationMapper(object):
                         capacity_parts.append(f"max_mem={dest.max_accepted_mem}")
                     if dest.max_accepted_gpus is not None:
                         capacity_parts.append(f"max_gpus={dest.max_accepted_gpus}")
+                    live_capacity = self.capacity.describe(dest.id) if self.capacity else None
+                    details = [f"capacity: {', '.join(capacity_parts)}" if capacity_parts else None]
+                    details.append(f"live capacity: {live_capacity}" if live_capacity else None)
                     explain.add_step(
                         ExplainPhase.DESTINATION_MATCHING,
                         f"{dest.id}: MATCHED",
-                        f"capacity: {', '.join(capacity_parts)}" if capacity_parts else None,
+                        "\n".join(detail for detail in details if detail) or None,
                     )
             else:
                 if explain:
-                    reason = ExplainCollector.match_failure_reason(dest, evaluated_entity)
+                    reason = ExplainCollector.match_failure_reason(dest, evaluated_entity, self.capacity)
                     explain.add_step(
                         ExplainPhase.DESTINATION_MATCHING,
                         f"{dest.id}: REJECTED",
@@ -200,9 +394,10 @@ class EntityToDestinationMapper(object):
         if explain:
             for i, d in enumerate(ranked):
                 score = d.score(entity)
+                live_capacity = self.capacity.describe(d.id) if self.capacity else None
                 explain.add_step(
                     ExplainPhase.DESTINATION_RANKING,
-                    f"#{i + 1} {d.id} (score: {score})",
+                    f"#{i + 1} {d.id} (score: {score}{f', {live_capacity}' if live_capacity else ''})",
                 )
         return ranked
 
@@ -236,7 +431,7 @@ class EntityToDestinationMapper(object):
             tool_id = f"{tool.tool_type}-{tool.dynamic_tool.uuid}"
         else:
             tool_id = tool.id or "unknown_tool_id"
-        tool_entity = self.inherit_matching_entities(context, Tool, "tools", tool_id)
+        tool_entity = self.inherit_matching_entities(context, Tool, "tools", tool_id, tool.version)
 
         if not tool_entity:
             tool_entity = Tool(evaluator=self.loader, id=tool_id)
@@ -320,11 +515,43 @@ class EntityToDestinationMapper(object):
         context.update({"entity": evaluated_entity, "self": evaluated_entity})
 
         # Remove the rules as they've already been evaluated, and should not be re-evaluated when combining
-        # with destinations
+        # with destinations. The evaluated entity is a copy made for this job, so it can be changed in place.
         evaluated_entity.rules = {}
 
         return evaluated_entity
 
+    def is_job_independent(self, entity: EntityWithRules) -> bool:
+        """
+        Whether evaluating an entity's rules, resources and rank function has the same outcome for every job, because
+        none of its code blocks refer to the job, or to anything else that may change between jobs.
+        """
+        names = self.JOB_INDEPENDENT_NAMES | set(self.global_context or {}) | set(entity.context or {})
+        code_blocks = [(entity.rank, False)] + [(getattr(entity, field), False) for field in self.RESOURCE_FIELDS]
+        for rule in entity.rules.values():
+            names |= set(rule.context or {})
+            code_blocks += [(rule.if_condition, False), (rule.execute, False), (rule.fail, True)]
+            code_blocks += [(getattr(rule, field), False) for field in self.RESOURCE_FIELDS]
+        for code, as_f_string in code_blocks:
+            if code is not None:
+                referenced = referenced_names(str(code), as_f_string)
+                if referenced is None or not referenced <= names:
+                    return False
+        return True
+
+    def record_mapping_failure(self, tool: GalaxyTool, user: GalaxyUser | None, message: str) -> None:
+        """
+        Remember a failure to map a tool for a user, if mapping the tool would fail in the same way for any job.
+        """
+        try:
+            # matching and combining entities only depend on the tool, the user and their roles
+            entity = self.combine_entities(self._find_matching_entities({"tool": tool, "user": user}, tool, user))
+        except (JobMappingException, IncompatibleTagsException):
+            job_independent = True
+        else:
+            job_independent = self.is_job_independent(entity)
+        if job_independent:
+            self.mapping_failures.set(tool, user, message)
+
     def map_to_destination(
         self,
         app: UniverseApplication,
@@ -336,92 +563,179 @@ class EntityToDestinationMapper(object):
         workflow_invocation_uuid: str | None = None,
         explain_collector: ExplainCollector | None = None,
     ) -> JobDestination:
-
-        # 1. Create evaluation context - these are the common variables available within any code block
-        context = {}
-        context.update(self.global_context or {})
-        context.update(
-            {
-                "app": app,
-                "tool": tool,
-                "user": user,
-                "job": job,
-                "job_wrapper": job_wrapper,
-                "resource_params": resource_params,
-                "workflow_invocation_uuid": workflow_invocation_uuid,
-                "mapper": self,
-            }
+        return self.to_galaxy_destination(
+            self.map_to_tpv_destination(
+                app,
+                tool,
+                user,
+                job,
+                job_wrapper,
+                resource_params,
+                workflow_invocation_uuid,
+                explain_collector=explain_collector,
+            )
         )
 
-        # Inject the explain collector into the context
-        if explain_collector:
-            context[ExplainCollector.CONTEXT_KEY] = explain_collector
-
-        # 2. Find, combine and evaluate entities that match this tool and user
-        evaluated_entity = self.match_combine_evaluate_entities(context, tool, user)
-
-        # 3. Match and rank destinations that best match the combined entity
-        ranked_dest_entities = self.match_and_rank_destinations(evaluated_entity, self.destinations, context)
-
-        explain = ExplainCollector.from_context(context)
+    def evaluate_destination(self, destination: Destination, entity: Entity, context: dict[str, Any]) -> Destination:
+        if not self.deferrals:
+            return destination.combine(cast(Destination, entity)).evaluate(context)
+        key = self.deferrals.key(destination, entity)
+        reason = self.deferrals.get(key)
+        if reason is not None:
+            raise TryNextDestinationOrWait(f"{reason} (deferred within the last {self.deferrals.ttl}s)")
+        try:
+            return destination.combine(cast(Destination, entity)).evaluate(context)
+        except TryNextDestinationOrWait as e:
+            self.deferrals.set(key, str(e))
+            raise
 
-        # 4. Fully combine entity with matching destinations
-        if ranked_dest_entities:
-            wait_exception_raised = False
-            for d in ranked_dest_entities:
-                try:  # An exception here signifies that a destination rule did not match
-                    if explain:
-                        explain.add_step(
-                            ExplainPhase.DESTINATION_EVALUATION,
-                            f"Evaluating destination '{d.id}'",
+    def destination_evaluations(
+        self, destinations: list[Destination], entity: Entity, context: dict[str, Any]
+    ) -> Iterator[tuple[Destination, Callable[[], Destination]]]:
+        """
+        Pairs each ranked destination with a call that combines it with the entity and evaluates it. If concurrent
+        destination evaluation is enabled, the top ranked destinations are evaluated concurrently, each against its
+        own copy of the context, and their calls wait for the outcome, so that destinations are still chosen in rank
+        order. Destinations are always evaluated one after another while explaining a mapping.
+        """
+        concurrent = []
+        if (
+            self.concurrent_destinations > 1
+            and len(destinations) > 1
+            and not ExplainCollector.from_context(context)
+            # a job mapped from within a destination's rules evaluates its destinations in turn, so that nested
+            # mappings can't exhaust the pool
+            and not getattr(_DESTINATION_THREAD, "active", False)
+        ):
+            pool = _destination_pool()
+            concurrent = [
+                (d, pool.submit(contextvars.copy_context().run, self.evaluate_destination, d, entity, dict(context)))
+                for d in destinations[: self.concurrent_destinations]
+            ]
+        try:
+            for d, future in concurrent:
+                yield d, future.result
+            for d in destinations[len(concurrent) :]:
+                yield d, functools.partial(self.evaluate_destination, d, entity, context)
+        finally:
+            # once a destination has been chosen, evaluations that have not started yet are no longer needed
+            for _, future in concurrent:
+                future.cancel()
+
+    def map_to_tpv_destination(
+        self,
+        app: UniverseApplication,
+        tool: GalaxyTool,
+        user: GalaxyUser | None,
+        job: Job,
+        job_wrapper: JobWrapper | None = None,
+        resource_params: dict[str, Any] | None = None,
+        workflow_invocation_uuid: str | None = None,
+        explain_collector: ExplainCollector | None = None,
+    ) -> Destination:
+        """
+        Map a job to the fully evaluated TPV destination it should run on, without converting it to a Galaxy
+        destination. Useful when the evaluated cores, mem and gpus are of interest.
+        """
+        # tools that could not be mapped for this user and roles before, for reasons unrelated to the job, fail
+        # immediately, unless the mapping is being explained
+        if not explain_collector:
+            message = self.mapping_failures.get(tool, user)
+            if message is not None:
+                raise JobMappingException(message)  # type: ignore[no-untyped-call]
+
+        # job derived values, such as param values, are memoized for the duration of the mapping
+        with helpers.job_memo_scope():
+            # 1. Create evaluation context - these are the common variables available within any code block
+            context = {}
+            context.update(self.global_context or {})
+            context.update(
+                {
+                    "app": app,
+                    "tool": tool,
+                    "user": user,
+                    "job": job,
+                    "job_wrapper": job_wrapper,
+                    "resource_params": resource_params,
+                    "workflow_invocation_uuid": workflow_invocation_uuid,
+                    "mapper": self,
+                    RuleConditionCache.CONTEXT_KEY: self.condition_cache,
+                }
+            )
+            if self.capacity:
+                context[CapacityFeed.CONTEXT_KEY] = self.capacity
+
+            # Inject the explain collector into the context
+            if explain_collector:
+                context[ExplainCollector.CONTEXT_KEY] = explain_collector
+
+            # 2. Find, combine and evaluate entities that match this tool and user
+            try:
+                evaluated_entity = self.match_combine_evaluate_entities(context, tool, user)
+            except JobMappingException as e:
+                self.record_mapping_failure(tool, user, str(e))
+                raise
+
+            # 3. Match and rank destinations that best match the combined entity
+            ranked_dest_entities = self.match_and_rank_destinations(evaluated_entity, self.destinations, context)
+
+            explain = ExplainCollector.from_context(context)
+
+            # 4. Fully combine entity with matching destinations
+            if ranked_dest_entities:
+                wait_exception_raised = False
+                evaluations = self.destination_evaluations(ranked_dest_entities, evaluated_entity, context)
+                for d, evaluate_destination in evaluations:
+                    try:  # An exception here signifies that a destination rule did not match
+                        if explain:
+                            explain.add_step(
+                                ExplainPhase.DESTINATION_EVALUATION,
+                                f"Evaluating destination '{d.id}'",
+                            )
+                        evaluated_destination = evaluate_destination()
+                        # 5. Return the top-ranked destination that evaluates successfully
+                        if explain:
+                            explain.add_step(
+                                ExplainPhase.FINAL_RESULT,
+                                f"Destination: {evaluated_destination.dest_name}",
+                                f"runner: {evaluated_destination.runner}\n"
+                                f"cores: {evaluated_destination.cores}, mem: {evaluated_destination.mem}, "
+                                f"gpus: {evaluated_destination.gpus}\n"
+                                f"params: {evaluated_destination.params}\n"
+                                f"env: {evaluated_destination.env}",
+                            )
+                        return evaluated_destination
+                    except TryNextDestinationOrFail as ef:
+                        if explain:
+                            explain.add_step(
+                                ExplainPhase.DESTINATION_EVALUATION,
+                                f"Destination '{d.id}' failed: {ef}, trying next...",
+                            )
+                        log.exception(
+                            f"Destination entity: {d} matched but could not fulfill requirements due to: {ef}."
+                            " Trying next candidate..."
                         )
-                    dest_combined_entity = d.combine(cast(Destination, evaluated_entity))
-                    evaluated_destination = dest_combined_entity.evaluate(context)
-                    # 5. Return the top-ranked destination that evaluates successfully
+                    except TryNextDestinationOrWait as ew:
+                        if explain:
+                            explain.add_step(
+                                ExplainPhase.DESTINATION_EVALUATION,
+                                f"Destination '{d.id}' deferred: {ew}, trying next...",
+                            )
+                        wait_exception_raised = True
+                if wait_exception_raised:
                     if explain:
                         explain.add_step(
                             ExplainPhase.FINAL_RESULT,
-                            f"Destination: {evaluated_destination.dest_name}",
-                            f"runner: {evaluated_destination.runner}\n"
-                            f"cores: {evaluated_destination.cores}, mem: {evaluated_destination.mem}, "
-                            f"gpus: {evaluated_destination.gpus}\n"
-                            f"params: {evaluated_destination.params}\n"
-                            f"env: {evaluated_destination.env}",
-                        )
-                    return self.to_galaxy_destination(evaluated_destination)
-                except TryNextDestinationOrFail as ef:
-                    if explain:
-                        explain.add_step(
-                            ExplainPhase.DESTINATION_EVALUATION,
-                            f"Destination '{d.id}' failed: {ef}, trying next...",
-                        )
-                    log.exception(
-                        f"Destination entity: {d} matched but could not fulfill requirements due to: {ef}."
-                        " Trying next candidate..."
-                    )
-                except TryNextDestinationOrWait as ew:
-                    if explain:
-                        explain.add_step(
-                            ExplainPhase.DESTINATION_EVALUATION,
-                            f"Destination '{d.id}' deferred: {ew}, trying next...",
+                            "All matching destinations deferred (job not ready)",
                         )
-                    wait_exception_raised = True
-            if wait_exception_raised:
-                if explain:
-                    explain.add_step(
-                        ExplainPhase.FINAL_RESULT,
-                        "All matching destinations deferred (job not ready)",
-                    )
-                raise JobNotReadyException()  # type: ignore[no-untyped-call]
-
-        # No matching destinations. Throw an exception
-        from galaxy.jobs.mapper import JobMappingException
+                    raise JobNotReadyException()  # type: ignore[no-untyped-call]
 
-        if explain:
-            explain.add_step(
-                ExplainPhase.FINAL_RESULT,
-                f"No destinations are available to fulfill request: {evaluated_entity.id}",
-            )
-        raise JobMappingException(
-            f"No destinations are available to fulfill request: {evaluated_entity.id}"
-        )  # type: ignore[no-untyped-call]
+            # No matching destinations. Throw an exception
+            message = f"No destinations are available to fulfill request: {evaluated_entity.id}"
+            if explain:
+                explain.add_step(ExplainPhase.FINAL_RESULT, message)
+            if not ranked_dest_entities and not self.capacity:
+                # destinations that were ranked may have failed because of the job, but if none matched, the failure
+                # only depends on the entity, unless destinations were rejected because they were offline
+                self.record_mapping_failure(tool, user, message)
+            raise JobMappingException(message)  # type: ignore[no-untyped-call]
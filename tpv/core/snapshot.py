@@ -0,0 +1,171 @@
+import fcntl
+import functools
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+from collections.abc import Callable
+from typing import Any
+from urllib.parse import urlparse
+
+import requests
+
+from tpv import get_version
+
+from .entities import Destination, Entity, LazyEntities, Role, Tool, ToolVersionRange, User
+from .loader import TPVConfigLoader
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"TPVSNAP1"
+# the magic bytes, followed by the offset and length of the pickled index
+SNAPSHOT_HEADER = struct.Struct("<8sQQ")
+SNAPSHOT_SECTIONS: dict[str, type[Entity]] = {
+    "tools": Tool,
+    "users": User,
+    "roles": Role,
+    "destinations": Destination,
+}
+
+
+def snapshot_key(tpv_configs: list[Any]) -> str:
+    """
+    A key that changes whenever the config chain may have changed, based on the config sources, the size and
+    modification time of local config files, and a hash of the content of remote config files, which are fetched to
+    compute it.
+    """
+    sources = []
+    for tpv_config in tpv_configs:
+        if isinstance(tpv_config, str) and os.path.isfile(tpv_config):
+            stat = os.stat(tpv_config)
+            sources.append([os.path.realpath(tpv_config), stat.st_mtime_ns, stat.st_size])
+        elif isinstance(tpv_config, str) and urlparse(tpv_config).scheme in {"http", "https"}:
+            # a shared remote config can change without its url changing
+            with requests.get(tpv_config) as r:
+                sources.append([tpv_config, hashlib.sha256(r.content).hexdigest()])
+        else:
+            sources.append(tpv_config)
+    return hashlib.sha256(json.dumps([get_version(), sources], sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ConfigSnapshot:
+    """
+    A read-only, memory-mapped snapshot of a merged config. Only the snapshot's index is read when it is opened.
+    Entities are read from the mapped file when first accessed, so that processes sharing a snapshot share its pages,
+    instead of each validating and compiling the full config. Entities are pickled, so snapshots must be written to
+    a location that is as trusted as the config files themselves.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = SNAPSHOT_HEADER.unpack_from(self.mmap)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"Not a TPV config snapshot: {path}")
+        self.index: dict[str, Any] = pickle.loads(self.mmap[index_offset : index_offset + index_length])
+        self.key: str = self.index["key"]
+
+    def read_entity(self, loader: TPVConfigLoader, section: str, key: str) -> Entity:
+        offset, length = self.index["sections"][section][key]
+        data = pickle.loads(self.mmap[offset : offset + length])
+        # entities were written with their inheritance already resolved
+        return SNAPSHOT_SECTIONS[section](**{**data, "id": key, "evaluator": loader})
+
+    def to_loader(self) -> TPVConfigLoader:
+        """
+        Create a loader whose entities are materialized from this snapshot on first access.
+        """
+        loader = TPVConfigLoader({"global": dict(self.index["global"])})
+        version_ranges = {
+            key: ToolVersionRange.model_validate(version_range)
+            for key, version_range in self.index["version_ranges"].items()
+        }
+        for section, entity_class in SNAPSHOT_SECTIONS.items():
+            setattr(
+                loader.config,
+                section,
+                LazyEntities(
+                    self.index["sections"][section],
+                    functools.partial(self.read_entity, loader, section),
+                    version_ranges=version_ranges if entity_class is Tool else None,
+                ),
+            )
+        return loader
+
+    @staticmethod
+    def write(path: str, key: str, loader: TPVConfigLoader) -> None:
+        """
+        Write the merged config of a loader to a snapshot file. The file is replaced atomically, so that processes
+        reading an earlier snapshot are unaffected.
+        """
+        index: dict[str, Any] = {
+            "key": key,
+            "global": loader.config.global_config.model_dump(by_alias=True),
+            "sections": {},
+            "version_ranges": {
+                tool_key: tool.version_range.model_dump()
+                for tool_key, tool in loader.config.tools.items()
+                if tool.version_range
+            },
+        }
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(os.path.abspath(path)), prefix=".tpv-snapshot-", delete=False
+        ) as f:
+            try:
+                f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 0, 0))
+                for section in SNAPSHOT_SECTIONS:
+                    offsets = {}
+                    for entity_key, entity in getattr(loader.config, section).items():
+                        data = pickle.dumps(entity.model_dump(by_alias=True), protocol=pickle.HIGHEST_PROTOCOL)
+                        offsets[entity_key] = (f.tell(), len(data))
+                        f.write(data)
+                    index["sections"][section] = offsets
+                data = pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL)
+                index_offset = f.tell()
+                f.write(data)
+                f.seek(0)
+                f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, index_offset, len(data)))
+            except Exception:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, path)
+
+    @staticmethod
+    def open_if_current(path: str, key: str) -> "ConfigSnapshot | None":
+        try:
+            snapshot = ConfigSnapshot(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            log.warning(f"Ignoring unreadable config snapshot: {path}", exc_info=True)
+            return None
+        return snapshot if snapshot.key == key else None
+
+
+def load_config_snapshot(
+    path: str, tpv_configs: list[Any], load_config: Callable[[], TPVConfigLoader]
+) -> TPVConfigLoader:
+    """
+    Load a config chain from a snapshot file, first writing the snapshot with `load_config` if it is missing or out
+    of date. Processes are serialized on a lock file, so that only one of them loads the full config and writes the
+    snapshot, while the others wait for it and then read the snapshot.
+    """
+    key = snapshot_key(tpv_configs)
+    snapshot = ConfigSnapshot.open_if_current(path, key)
+    if not snapshot:
+        with open(f"{path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # another process may have written the snapshot while this one waited for the lock
+                snapshot = ConfigSnapshot.open_if_current(path, key)
+                if not snapshot:
+                    log.info(f"writing tpv config snapshot: {path}")
+                    ConfigSnapshot.write(path, key, load_config())
+                    snapshot = ConfigSnapshot(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return snapshot.to_loader()
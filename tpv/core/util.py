@@ -1,3 +1,11 @@
+try:
+    from galaxy.tool_util.version import parse_version
+except ImportError:
+    # Fallback to an older `packaging` version when Galaxy < 23.1.
+    # If Galaxy is < 23.1 you need to have `packaging` in <= 21.3
+    from packaging.version import parse as parse_version
+
+import functools
 import os
 from typing import Any
 from urllib.parse import urlparse
@@ -16,3 +24,9 @@ def load_yaml_from_url_or_path(url_or_path: str) -> Any:
     else:
         with requests.get(url_or_path) as r:
             return yaml.load(r.content)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_tool_version(version: str) -> Any:
+    # the same handful of tool versions are compared over and over, so only parse them once
+    return parse_version(version)
@@ -1,7 +1,11 @@
+import asyncio
+import contextvars
+import functools
 import logging
 import os
 import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, cast
 
 from galaxy.app import UniverseApplication
@@ -10,12 +14,13 @@ from galaxy.jobs.mapper import JobMappingException
 from galaxy.model import Job
 from galaxy.model import User as GalaxyUser
 from galaxy.tools import Tool as GalaxyTool
-from galaxy.util import listify
+from galaxy.util import asbool, listify
 from galaxy.util.watcher import get_watcher
 
 from tpv.core.explain import ExplainCollector, ExplainPhase
 from tpv.core.loader import TPVConfigLoader
 from tpv.core.mapper import EntityToDestinationMapper
+from tpv.core.snapshot import load_config_snapshot
 
 log = logging.getLogger(__name__)
 
@@ -25,26 +30,48 @@ ACTIVE_DESTINATION_MAPPERS: dict[str, EntityToDestinationMapper] = {}
 DESTINATION_MAPPER_LOCK = threading.Lock()
 WATCHERS_BY_CONFIG_FILE: dict[str, Any] = {}
 REFERRERS_BY_CONFIG_FILE: dict[str, dict[str, JOB_YAML_CONFIG_TYPE]] = defaultdict(dict)
+# the snapshot_file and lazy options that each referrer's mapper was loaded with, to reload it with the same options
+LOAD_OPTIONS_BY_REFERRER: dict[str, dict[str, Any]] = {}
+# the maximum number of jobs that are mapped at once through map_tool_to_destination_async
+ASYNC_MAPPING_POOL_SIZE = 4
+ASYNC_MAPPING_POOL = ThreadPoolExecutor(max_workers=ASYNC_MAPPING_POOL_SIZE, thread_name_prefix="tpv-mapper")
 
 
-def load_destination_mapper(tpv_configs: JOB_YAML_CONFIG_TYPE, reload: bool = False) -> EntityToDestinationMapper:
-    tpv_config_list: list[Any] = listify(tpv_configs)
-    log.info(f"{'re' if reload else ''}loading tpv rules from: {tpv_configs}")
+def load_config_chain(tpv_config_list: list[Any], lazy: bool = False) -> TPVConfigLoader:
     loader = None
     for tpv_config in tpv_config_list:
         if isinstance(tpv_config, str):
-            current_loader = TPVConfigLoader.from_url_or_path(tpv_config, parent=loader)
+            current_loader = TPVConfigLoader.from_url_or_path(tpv_config, parent=loader, lazy=lazy)
         else:
             # it is a raw config already
-            current_loader = TPVConfigLoader(tpv_config, parent=loader)
+            current_loader = TPVConfigLoader(tpv_config, parent=loader, lazy=lazy)
         loader = current_loader
-    return EntityToDestinationMapper(loader)  # type: ignore
+    return loader  # type: ignore
+
+
+def load_destination_mapper(
+    tpv_configs: JOB_YAML_CONFIG_TYPE, reload: bool = False, snapshot_file: str | None = None, lazy: bool = False
+) -> EntityToDestinationMapper:
+    tpv_config_list: list[Any] = listify(tpv_configs)
+    log.info(f"{'re' if reload else ''}loading tpv rules from: {tpv_configs}")
+    if snapshot_file:
+        loader = load_config_snapshot(
+            snapshot_file, tpv_config_list, functools.partial(load_config_chain, tpv_config_list)
+        )
+    else:
+        loader = load_config_chain(tpv_config_list, lazy=lazy)
+    return EntityToDestinationMapper(loader)
 
 
 def setup_destination_mapper(
-    app: UniverseApplication, referrer: str, tpv_configs: JOB_YAML_CONFIG_TYPE
+    app: UniverseApplication,
+    referrer: str,
+    tpv_configs: JOB_YAML_CONFIG_TYPE,
+    snapshot_file: str | None = None,
+    lazy: bool = False,
 ) -> EntityToDestinationMapper:
-    mapper = load_destination_mapper(tpv_configs)
+    mapper = load_destination_mapper(tpv_configs, snapshot_file=snapshot_file, lazy=lazy)
+    LOAD_OPTIONS_BY_REFERRER[referrer] = {"snapshot_file": snapshot_file, "lazy": lazy}
 
     for tpv_config in tpv_configs:
         if isinstance(tpv_config, str) and os.path.isfile(tpv_config):
@@ -63,7 +90,9 @@ def setup_destination_mapper(
                 # watchdog on darwin notifies only once per file, so reload all mappers that refer to this file
                 for referrer, config_files in REFERRERS_BY_CONFIG_FILE[tpv_config_real_path].items():
                     try:
-                        ACTIVE_DESTINATION_MAPPERS[referrer] = load_destination_mapper(config_files, reload=True)
+                        ACTIVE_DESTINATION_MAPPERS[referrer] = load_destination_mapper(
+                            config_files, reload=True, **LOAD_OPTIONS_BY_REFERRER.get(referrer, {})
+                        )
                     except Exception:
                         log.warning(
                             "Failed to reload mapper for referrer '%s' after file change at '%s' (event path: '%s')",
@@ -82,7 +111,11 @@ def setup_destination_mapper(
 
 
 def lock_and_load_mapper(
-    app: UniverseApplication, referrer: str, tpv_config: JOB_YAML_CONFIG_TYPE
+    app: UniverseApplication,
+    referrer: str,
+    tpv_config: JOB_YAML_CONFIG_TYPE,
+    snapshot_file: str | None = None,
+    lazy: bool = False,
 ) -> EntityToDestinationMapper:
     destination_mapper = ACTIVE_DESTINATION_MAPPERS.get(referrer)
     if not destination_mapper:
@@ -92,7 +125,7 @@ def lock_and_load_mapper(
             destination_mapper = ACTIVE_DESTINATION_MAPPERS.get(referrer)
             # still null with the lock - must be the first time
             if not destination_mapper:
-                destination_mapper = setup_destination_mapper(app, referrer, tpv_config)
+                destination_mapper = setup_destination_mapper(app, referrer, tpv_config, snapshot_file, lazy)
                 ACTIVE_DESTINATION_MAPPERS[referrer] = destination_mapper
     return destination_mapper
 
@@ -110,6 +143,10 @@ def map_tool_to_destination(
     resource_params: dict[str, Any] | None = None,
     workflow_invocation_uuid: str | None = None,
     explain_collector: ExplainCollector | None = None,
+    # a file shared by all handler processes, from which the merged config is read lazily
+    tpv_snapshot_file: str | None = None,
+    # validate and compile tool entries only when they are first matched
+    tpv_lazy_tools: bool | str = False,
 ) -> JobDestination:
     if tpv_configs and tpv_config_files:
         raise ValueError("Only one of tpv_configs or tpv_config_files can be specified in execution environment.")
@@ -117,7 +154,13 @@ def map_tool_to_destination(
     if not resolved_tpv_configs:
         raise ValueError("One of tpv_configs or tpv_config_files must be specified in execution environment.")
     referrer_id = referrer.id if referrer else None
-    destination_mapper = lock_and_load_mapper(app, referrer_id or "tpv_dispatcher", resolved_tpv_configs)
+    destination_mapper = lock_and_load_mapper(
+        app,
+        referrer_id or "tpv_dispatcher",
+        resolved_tpv_configs,
+        tpv_snapshot_file,
+        asbool(tpv_lazy_tools),  # type: ignore[no-untyped-call]
+    )
     explain_on_failure = bool(referrer.params.get("tpv_explain_on_failure", False)) if referrer else False
     log_on_failure = explain_collector is None and explain_on_failure
     collector = explain_collector or (ExplainCollector() if log_on_failure else None)
@@ -142,3 +185,24 @@ def map_tool_to_destination(
             assert collector is not None
             log.warning("Job mapping failed. TPV scheduling trace:\n%s", collector.render())
         raise
+
+
+async def map_tool_to_destination_async(
+    app: UniverseApplication,
+    job: Job,
+    tool: GalaxyTool,
+    user: GalaxyUser | None,
+    **kwargs: Any,
+) -> JobDestination:
+    """
+    An asyncio friendly version of map_tool_to_destination, which takes the same arguments. Code blocks in the config
+    are synchronous, and may call helpers that block on the database, so the mapping runs on a bounded thread pool,
+    and the event loop is free to handle other work in the meantime. Independent blocking calls within a mapping can
+    be run concurrently through helpers.run_concurrently.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        ASYNC_MAPPING_POOL,
+        functools.partial(context.run, map_tool_to_destination, app, job, tool, user, **kwargs),
+    )